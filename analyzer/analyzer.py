@@ -18,6 +18,8 @@ from config import config
 from analyzer.git_commit_linker import *
 from sqlalchemy import Date, cast
 from ingester.git import  *
+import calendar # to convert datetime to unix time
+from monthdelta import MonthDelta
 
 def analyze(repo_id):
 	"""
@@ -57,41 +59,107 @@ def analyzeRepo(repository_to_analyze, session):
 
 	logging.info('Worker analyzing repository id ' + repo_id)
 
-	# all commits in descending order
-	all_commits = (session.query(Commit)
-				.filter( Commit.repository_id == repo_id)
-				.order_by( Commit.author_date_unix_timestamp.desc())
-				.all()
-				)
-
-	# corrective commits in ascending order 
-	# if updating, only get the corrective commits that have not been linked yet.
+	# if updating, only the corrective commits that have not been linked yet are linked.
 	# No need to re-link corrective commits that have already been linked with the bug-inducing commit.
-	corrective_commits = (session.query(Commit)
+	num_corrective_commits = (session.query(func.count(Commit.commit_hash))
 				.filter( 
 					( Commit.fix == "True" ) &
 					( Commit.repository_id == repo_id ) &
 					( Commit.linked == False )
 				)
-				.order_by( Commit.author_date_unix_timestamp.asc() )
-				.all()
+				.scalar()
 				)
 
-	logging.info("Linking " + str(len(corrective_commits)) + " new corrective commits for repo " + repo_id)
+	logging.info("Linking " + str(num_corrective_commits) + " new corrective commits for repo " + repo_id)
 
 	try:
 		git_commit_linker = GitCommitLinker(repo_id)
-		git_commit_linker.linkCorrectiveCommits(corrective_commits, all_commits)
+		batch_size = int(config.get('stages', {}).get('link', {}).get('batch_size', 100))
+		git_commit_linker.linkCorrectiveCommits(session, batch_size)
+		session.commit() # the contains_bug, fixes & linked labels, before analyze closes the session
 	except Exception as e:
 		logging.exception("Got an exception linking bug fixing changes to bug inducing changes for repo " + repo_id)
-		repository_to_analyze.status = "Error"
-		session.commit() # update repo status
-		raise
-
-	# Signify to CAS Manager that this repo is ready to have it's model built
-	if repository_to_analyze.status != "Error":
-		repository_to_analyze.status = "In Queue to Build Model"
-		session.commit() # update repo status
-		# after update commit.contains_bug & commit.fix label, parsing diff information
-		git = Git()
-		git.diff(repo_id)
\ No newline at end of file
+		session.rollback() # the batch that failed
+		raise # the job is retried, and the repo set in error once it runs out of attempts
+
+def diff(repo_id):
+	"""
+	Parses the diff information of the commits of the repository with the given id, after their
+	contains_bug & fix labels were updated by analyze.
+	@param repo_id		The repository id to parse the diffs of
+	"""
+	git = Git()
+	git.diff(repo_id)
+
+def buildModel(repo_id):
+	"""
+	Builds the median and glm models of the repository with the given id, and scores its
+	recent commits. Runs in a model building worker process, so many repositories can have their
+	models built at the same time.
+	@param repo_id		The repository id to build the models of
+	"""
+	session = Session()
+	repo = (session.query(Repository).filter(Repository.id == repo_id).first())
+
+	if repo is None:
+		logging.info('Repo with id ' + repo_id + ' not found!')
+		session.close()
+		return
+
+	# use data only up to X months prior we won't have sufficent data to build models
+	# as there may be bugs introduced in those months that haven't been fixed, skewing
+	# our model.
+	glm_model_time =  int(config['glm_modeling']['months']) 
+	data_months_datetime = datetime.utcnow() - MonthDelta(glm_model_time)
+	data_months_unixtime = calendar.timegm(data_months_datetime.utctimetuple())
+
+	try: 
+		# trained on all commits for repo prior to current time - glm model time,
+		# tested on all commits for repo after or on current time - glm model time
+		metrics_generator = MetricsGenerator(repo_id, int(data_months_unixtime))
+		metrics_generator.buildAllModels()
+
+		# montly data dump - or rather, every 30 days.
+		dump_refresh_date = str(datetime.utcnow() - timedelta(days=30))
+		if repo.last_data_dump == None or repo.last_data_dump < dump_refresh_date:
+			logging.info("Generating a monthly data dump for repository: " + repo_id)
+			metrics_generator.dumpData()
+			repo.last_data_dump = str(datetime.now().replace(microsecond=0))
+			
+		# Notify user if repo has never been analyzed previously
+		if repo.analysis_date is None:
+			notify(repo)
+
+		logging.info("Repo " + repo_id + " finished analyzing.")
+		repo.analysis_date = str(datetime.now().replace(microsecond=0))
+		repo.status = "Analyzed"
+		session.commit() # update status of repo
+		session.close()
+
+	# uh-oh
+	except Exception as e:
+		logging.exception("Got an exception building model for repository " + repo_id)
+		session.rollback()
+		session.close()
+		raise # the job is retried, and the repo set in error once it runs out of attempts
+
+def notify(repo):
+	""" 
+	Send e-mail notifications if applicable to a repo 
+	used by buildModel
+	"""
+	notifier = None
+	logging.info("Notifying subscribed users for repository " + repo.id)
+
+	# Create the Notifier
+	gmail_user = config['gmail']['user']
+	gmail_pass = config['gmail']['pass']
+	notifier = Notifier(gmail_user, gmail_pass, repo.name)
+
+	# Add subscribers if applicable
+	if repo.email is not None:
+		notifier.addSubscribers([repo.email, gmail_user])
+	else:
+		notifier.addSubscribers([gmail_user])
+
+	notifier.notify()
@@ -1,6 +1,7 @@
 import re
 import os
 import subprocess
+from deadline import * # runs git commands under the deadline of their job
 from orm.commit import *
 from caslogging import logging
 import json
@@ -30,12 +31,43 @@ class GitCommitLinker:
     self.repo_path = os.path.join(os.path.dirname(__file__), '..', self.REPO_DIR + repoId)
     self.repo_id = repoId
 
-  def linkCorrectiveCommits(self, corrective_commits, all_commits):
+  def linkCorrectiveCommits(self, session, batch_size=100):
     """
-    links all corrective changes/commits to the change that introduced the problem
+    links all corrective changes/commits not linked yet to the change that introduced the problem
     note: a bug introducing change may have introduced more than one bug.
-    """
 
+    corrective commits are linked in batches of batch_size, oldest first, and each batch is
+    committed in its own transaction: an interrupted linking resumes from the first corrective
+    commit not linked yet, and only loses the work of its last batch.
+
+    @return the number of corrective commits linked
+    """
+    num_linked = 0
+
+    while True:
+      corrective_commits = (session.query(Commit)
+            .filter( 
+              ( Commit.fix == "True" ) &
+              ( Commit.repository_id == self.repo_id ) &
+              ( Commit.linked == False )
+            )
+            .order_by( Commit.author_date_unix_timestamp.asc() )
+            .limit(batch_size)
+            .all()
+            )
+
+      if len(corrective_commits) == 0:
+        return num_linked
+
+      self._linkBatch(session, corrective_commits)
+      session.commit() # checkpoint
+      num_linked += len(corrective_commits)
+      logging.info("Linked " + str(num_linked) + " corrective commits for repo " + self.repo_id)
+
+  def _linkBatch(self, session, corrective_commits):
+    """
+    links a batch of corrective commits and labels the commits they fix as containing a bug
+    """
     linked_commits = {} # dict of buggy commit hash -> [corrective commits]
 
     # find all bug introducing commits
@@ -51,12 +83,21 @@ class GitCommitLinker:
 
       corrective_commit.linked = True # mark that we have linked this corrective commit.
 
-    for commit in all_commits:
+    if len(linked_commits) == 0:
+      return
+
+    buggy_commits = (session.query(Commit)
+          .filter( ( Commit.repository_id == self.repo_id ) & ( Commit.commit_hash.in_(list(linked_commits.keys())) ) )
+          .all()
+          )
 
-      if commit.commit_hash in linked_commits:
-        commit.contains_bug = True
-        commit.fixes = json.dumps(linked_commits[commit.commit_hash])
+    for commit in buggy_commits:
+      # keep the fixes found by previous batches and analyses
+      fixes = json.loads(commit.fixes) if commit.fixes else []
+      fixes += [fix for fix in linked_commits[commit.commit_hash] if fix not in fixes]
 
+      commit.contains_bug = True
+      commit.fixes = json.dumps(fixes)
 
   def _linkCorrectiveCommit(self, commit):
     """
@@ -196,18 +237,20 @@ class GitCommitLinker:
 
     # It is possible that a commit doesn't have a parent! i.e., merged from a clean branch.
     try:
-      diff = str(subprocess.check_output(diff_cmd, shell=True, cwd= self.repo_path, executable="/bin/bash" ))
+      diff = str(checkOutput(diff_cmd, shell=True, cwd= self.repo_path, executable="/bin/bash" ))
 
       # files changed, this is used by the getLineNumbersChanged function
       diff_cmd_lines_changed = "git diff " + commit.commit_hash + "^ "+ commit.commit_hash + " --name-only"
 
       # get the files modified -> use this to validate if we have arrived at a new file
       # when grepping for the specific lines changed.
-      files_modified = str( subprocess.check_output( diff_cmd_lines_changed, shell=True, cwd= self.repo_path )).replace("b'", "").split("\\n")
+      files_modified = str( checkOutput( diff_cmd_lines_changed, shell=True, cwd= self.repo_path )).replace("b'", "").split("\\n")
 
       # now, let's get the file and the line number changed in the commit
       return self._getModifiedRegionsOnly(diff, files_modified)
 
+    except DeadlineExceeded:
+      raise
     except:
       # The code change did not have a parent change!
       return {}
@@ -251,7 +294,7 @@ class GitCommitLinker:
 
           # we need to git blame with the --follow option so that it follows renames in the file, and the '-l'
           # option gives us the complete commit hash. additionally, start looking at the commit's ancestor 
-          result = str( subprocess.check_output( "git blame --show-number -L" + line + ",+1 " + commit.commit_hash + "^ -l -- '" \
+          result = str( checkOutput( "git blame --show-number -L" + line + ",+1 " + commit.commit_hash + "^ -l -- '" \
                             + file + "'", shell=True, cwd= self.repo_path )).split(" ")
           buggy_change = result[0][2:] # commit_hash
           original_line = result[1] # the original linenumber
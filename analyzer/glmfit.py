@@ -0,0 +1,344 @@
+"""
+file: glmfit.py
+description: In-process logistic regression (binomial GLM) fitting used by the linear
+regression model, along with a cache so that each formula is fitted only once per data set.
+The fitting follows R's glm.fit (IRLS) and summary.glm (Wald z-test) so the
+coefficients and p-values match what was previously obtained through rpy2.
+"""
+import hashlib
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+class GlmFit:
+  """
+  Holds the result of fitting a binomial GLM with a logit link.
+  coefficients and pvalues are dictionaries of {term -> value}, with the intercept
+  stored under the name "intercept".
+  """
+
+  def __init__(self, terms, coefficients, pvalues, deviance, iterations, converged, information=None):
+    self.terms = terms
+    self.coefficients = coefficients
+    self.pvalues = pvalues
+    self.deviance = deviance
+    self.iterations = iterations
+    self.converged = converged
+
+    # fisher information matrix (X'WX) at the estimate, intercept first
+    self.information = information
+
+  def startVector(self):
+    """
+    returns the coefficients as a vector, intercept first
+    """
+    return [self.coefficients["intercept"]] + [self.coefficients[term] for term in self.terms]
+
+def _sigmoid(eta):
+  """
+  numerically stable logistic function, 1/(1+exp(-eta)) without overflowing
+  """
+  out = np.empty_like(eta, dtype=float)
+  pos = eta >= 0
+  out[pos] = 1.0 / (1.0 + np.exp(-eta[pos]))
+  exp_eta = np.exp(eta[~pos])
+  out[~pos] = exp_eta / (1.0 + exp_eta)
+  return out
+
+def predictProbabilities(X, intercept, coefficients):
+  """
+  estimated probability = 1/[1 + exp(-a - BX)] for every row of X at once
+  @X            - matrix of observations (rows) by metrics (columns)
+  @coefficients - coefficients of the metrics, in the same order as the columns of X
+  """
+  return _sigmoid(intercept + X.dot(np.asarray(coefficients, dtype=float)))
+
+def _deviance(y, mu):
+  """
+  binomial deviance, -2 * log likelihood
+  """
+  eps = np.finfo(float).tiny
+  return -2.0 * np.sum(y * np.log(np.maximum(mu, eps)) + (1 - y) * np.log(np.maximum(1 - mu, eps)))
+
+def fitLogit(X, y, terms, start=None, epsilon=1e-8, maxit=25):
+  """
+  Fits is_buggy ~ terms by iteratively reweighted least squares, the same way R's
+  glm(family="binomial") does. X must not contain the intercept column, it is added here.
+
+  @X        - matrix of observations (rows) by terms (columns)
+  @y        - vector of 0/1 responses
+  @terms    - names of the columns of X
+  @start    - optional starting coefficients (intercept first) to warm start the iterations,
+              e.g. from a previous build. Falls back to R's default start if they do not converge.
+
+  Returns None if the model cannot be built, i.e. when two metrics are perfectly collinear
+  (R would leave the aliased coefficients as NA).
+  """
+  n = X.shape[0]
+  design = np.column_stack([np.ones(n), X])
+
+  if n == 0 or np.linalg.matrix_rank(design) < design.shape[1]:
+    return None
+
+  if start is not None:
+    beta = np.asarray(start, dtype=float)
+    eta = design.dot(beta)
+  else:
+    mu = (y + 0.5) / 2.0
+    eta = np.log(mu / (1 - mu))
+  mu = _sigmoid(eta)
+  dev_old = _deviance(y, mu)
+
+  converged = False
+  iterations = 0
+
+  for iterations in range(1, maxit + 1):
+    mu_eta = np.maximum(mu * (1 - mu), np.finfo(float).eps)
+    z = eta + (y - mu) / mu_eta
+    w = np.sqrt(mu_eta)
+    beta = np.linalg.lstsq(design * w[:, None], z * w, rcond=None)[0]
+    eta = design.dot(beta)
+    mu = _sigmoid(eta)
+    dev = _deviance(y, mu)
+
+    if abs(dev - dev_old) / (abs(dev) + 0.1) < epsilon:
+      converged = True
+      break
+    dev_old = dev
+
+  weights = mu * (1 - mu)
+  fit = _waldFit(terms, beta, design.T.dot(design * weights[:, None]), float(dev), iterations, converged)
+
+  # a poor start can saturate the probabilities, so that the deviance stops changing away from the
+  # estimate - start over from R's default start if a Newton step would still lower the deviance
+  if start is not None and (fit is None or not converged or
+      _newtonDecrement(design, y, mu, fit.information) > 10 * epsilon * (abs(dev) + 0.1)):
+    return fitLogit(X, y, terms, None, epsilon, maxit)
+
+  return fit
+
+def _newtonDecrement(design, y, mu, information):
+  """
+  decrease of the deviance a Newton step from the current estimate is expected to make
+  """
+  score = design.T.dot(y - mu)
+  try:
+    return float(score.dot(np.linalg.solve(information, score)))
+  except np.linalg.LinAlgError:
+    return float('inf')
+
+def _waldFit(terms, beta, information, deviance, iterations, converged):
+  """
+  builds the fit from its estimate and information matrix, with the Wald test on each
+  coefficient - what summary.glm reports as Pr(>|z|)
+  """
+  try:
+    cov = np.linalg.inv(information)
+  except np.linalg.LinAlgError:
+    return None
+
+  std_err = np.sqrt(np.maximum(np.diag(cov), 0))
+  names = ["intercept"] + list(terms)
+  coefficients = {}
+  pvalues = {}
+
+  for index, name in enumerate(names):
+    coefficients[name] = float(beta[index])
+    if std_err[index] > 0:
+      pvalues[name] = math.erfc(abs(beta[index] / std_err[index]) / math.sqrt(2))
+    else:
+      pvalues[name] = float('nan')
+
+  return GlmFit(list(terms), coefficients, pvalues, deviance, iterations, converged, information)
+
+def updateLogit(X, y, terms, start, information, epsilon=1e-8, maxit=25):
+  """
+  Updates a fitted model with new observations only. The likelihood of the data the model
+  was fitted on is approximated by a quadratic around its estimate (start) with its fisher
+  information, and is maximized together with the likelihood of the new rows by Newton steps.
+
+  @X           - matrix of the new observations by terms, without the intercept column
+  @y           - vector of 0/1 responses of the new observations
+  @start       - the previous estimate, intercept first
+  @information - the previous fisher information matrix, intercept first
+
+  Returns None if the combined information is singular.
+  """
+  design = np.column_stack([np.ones(X.shape[0]), X])
+  prior = np.asarray(start, dtype=float)
+  prior_information = np.asarray(information, dtype=float)
+  beta = prior.copy()
+
+  def objective(beta):
+    mu = _sigmoid(design.dot(beta))
+    diff = beta - prior
+    return _deviance(y, mu) + diff.dot(prior_information).dot(diff), mu
+
+  obj_old, mu = objective(beta)
+  converged = False
+  iterations = 0
+
+  for iterations in range(1, maxit + 1):
+    gradient = design.T.dot(y - mu) - prior_information.dot(beta - prior)
+    hessian = design.T.dot(design * (mu * (1 - mu))[:, None]) + prior_information
+    try:
+      beta = beta + np.linalg.solve(hessian, gradient)
+    except np.linalg.LinAlgError:
+      return None
+    obj, mu = objective(beta)
+
+    if abs(obj - obj_old) / (abs(obj) + 0.1) < epsilon:
+      converged = True
+      break
+    obj_old = obj
+
+  new_information = prior_information + design.T.dot(design * (mu * (1 - mu))[:, None])
+  return _waldFit(terms, beta, new_information, _deviance(y, mu), iterations, converged)
+
+def fingerprint(X, y):
+  """
+  returns a fingerprint of a data set, used to key cached fits
+  """
+  digest = hashlib.sha1()
+  digest.update(str(X.shape).encode())
+  digest.update(np.ascontiguousarray(X).tobytes())
+  digest.update(np.ascontiguousarray(y).tobytes())
+  return digest.hexdigest()
+
+class FitCache:
+  """
+  Caches GLM fits keyed by formula and data set fingerprint so that the same model is never
+  fitted twice. Fits are submitted to a thread pool and the cache holds futures, so concurrent
+  requests for a formula that is already being fitted wait on the same fit.
+  """
+
+  def __init__(self, workers=1):
+    self.fits = {}
+    self.lock = threading.Lock()
+    self.workers = max(1, workers)
+    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+  def submit(self, X, y, columns, terms, data_fingerprint, start=None):
+    """
+    schedules the fit of is_buggy ~ terms, unless it was already fitted or is being fitted.
+    @columns - names of all the columns of X, terms selects a subset of them
+    @start   - optional function of the terms returning the starting coefficients
+    """
+    key = (tuple(terms), data_fingerprint)
+
+    with self.lock:
+      if key not in self.fits:
+        indices = [columns.index(term) for term in terms]
+        start_vector = start(terms) if start is not None else None
+        self.fits[key] = self.executor.submit(fitLogit, X[:, indices], y, list(terms), start_vector)
+      return self.fits[key]
+
+  def put(self, terms, data_fingerprint, fit):
+    """
+    stores a fit obtained elsewhere (i.e. by an incremental update) as the fit of is_buggy ~ terms
+    """
+    future = Future()
+    future.set_result(fit)
+    with self.lock:
+      self.fits[(tuple(terms), data_fingerprint)] = future
+
+  def get(self, X, y, columns, terms, data_fingerprint, start=None):
+    """
+    returns the fit of is_buggy ~ terms, fitting it if needed
+    """
+    return self.submit(X, y, columns, terms, data_fingerprint, start).result()
+
+  def shutdown(self):
+    """
+    cancels speculative fits that have not started yet and stops the thread pool
+    """
+    with self.lock:
+      for fit in self.fits.values():
+        fit.cancel()
+    self.executor.shutdown(wait=True)
+
+def _softThreshold(value, threshold):
+  if value > threshold:
+    return value - threshold
+  elif value < -threshold:
+    return value + threshold
+  return 0.0
+
+def l1LogitPath(X, y, terms, num_lambdas=50, lambda_ratio=1e-3, tol=1e-6, maxit=100):
+  """
+  Computes the path of L1-regularized logistic regressions of y on X, from the smallest penalty
+  that selects no term, down to lambda_ratio times that penalty. Each penalty is solved by coordinate descent on
+  the IRLS quadratic approximation (as glmnet does), warm started from the solution of the previous
+  penalty, on standardized columns.
+
+  Returns a list of (lambda, support) from the largest to the smallest penalty, where support is the
+  list of terms with a non-zero coefficient.
+  """
+  n, p = X.shape
+  if n == 0:
+    return []
+
+  mean = X.mean(axis=0)
+  std = X.std(axis=0)
+  usable = [j for j in range(p) if std[j] > 0]
+  Xs = np.zeros((n, p))
+  for j in usable:
+    Xs[:, j] = (X[:, j] - mean[j]) / std[j]
+
+  ybar = y.mean()
+  if ybar <= 0 or ybar >= 1:
+    return [] # a single class - nothing to select
+
+  lambda_max = np.max(np.abs(Xs.T.dot(y - ybar))) / n
+  if lambda_max <= 0:
+    return []
+  lambdas = lambda_max * np.logspace(0, math.log10(lambda_ratio), num_lambdas)
+
+  # coefficients with the (unpenalized) intercept first
+  design = np.column_stack([np.ones(n), Xs])
+  coefs = np.zeros(p + 1)
+  coefs[0] = math.log(ybar / (1 - ybar))
+  active = [0] + [j + 1 for j in usable]
+  path = []
+
+  for lam in lambdas:
+    penalty = np.full(p + 1, lam)
+    penalty[0] = 0.0
+
+    for _ in range(maxit):
+      eta = design.dot(coefs)
+      mu = _sigmoid(eta)
+      w = np.maximum(mu * (1 - mu), 1e-5)
+      z = eta + (y - mu) / w
+
+      # weighted gram matrix of the quadratic approximation, so each coordinate
+      # update costs O(p) instead of a pass over the data
+      gram = design.T.dot(design * w[:, None]) / n
+      target = design.T.dot(w * z) / n
+      coefs_old = coefs.copy()
+
+      for _ in range(maxit):
+        max_change = 0.0
+        for j in active:
+          rho = target[j] - gram[j].dot(coefs) + gram[j, j] * coefs[j]
+          new_coef = _softThreshold(rho, penalty[j]) / gram[j, j]
+          max_change = max(max_change, abs(new_coef - coefs[j]))
+          coefs[j] = new_coef
+
+        if max_change < tol:
+          break
+
+      if np.max(np.abs(coefs - coefs_old)) < tol:
+        break
+
+    beta = coefs[1:]
+    path.append((float(lam), [terms[j] for j in range(p) if beta[j] != 0]))
+
+  return path
+
+def bic(fit, n):
+  """
+  Bayesian information criterion of a fitted model on n observations
+  """
+  return fit.deviance + (len(fit.terms) + 1) * math.log(n)
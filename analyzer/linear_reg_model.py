@@ -1,10 +1,13 @@
 import csv
 import os
-import rpy2.robjects as robjects # R integration
-from rpy2.robjects.packages import importr # import the importr package from R
+import operator
+import numpy as np
+from analyzer.glmfit import * # in-process glm fitting and the fit cache
+from analyzer.repositorymetrics import * # metrics abstraction; holds all metric values for commits
 from orm.glmcoefficients import * # to store the glm coefficients
+from orm.commit import * # to store the riskyness of commits
 from db import *	# postgresql db information
-import math
+from sqlalchemy.dialects.postgresql import ARRAY
 from caslogging import logging
 
 class LinearRegressionModel:
@@ -14,6 +17,9 @@ class LinearRegressionModel:
   probability: intercept + sum([metric_coefficient] * metric)
   """
 
+  # column order of the data set
+  columns = RepositoryMetrics.metric_names
+
   def __init__(self, metrics, repo_id, testingCommits):
     """
     @metrics - this is the list of metrics from the TRAINING data set.
@@ -22,20 +28,66 @@ class LinearRegressionModel:
     """
     self.metrics = metrics
     self.repo_id = repo_id
-    self.stats = importr('stats', robject_translations={'format_perc': '_format_perc'})
-    self.base = importr('base')
-    self.readcsv = robjects.r['read.csv']
     self.sig_threshold = 0.05
-    self.data = None 
+    self.data = None
+    self.is_buggy = None
+    self.data_fingerprint = None
     self.commits = testingCommits
 
+    # every formula is fitted once and candidate formulas are fitted concurrently
+    self.fit_cache = FitCache(int(config['glm_modeling'].get('workers', 4)))
+
+    # how metrics are selected: "stepwise" (forward selection) or "lasso" (L1-regularized path)
+    self.selection = config['glm_modeling'].get('selection', 'stepwise')
+
+    # whether to update the stored model with only the new training commits, and how many such
+    # updates are made before the model is fully rebuilt again (as the older labels also change)
+    self.incremental = config['glm_modeling'].get('incremental', False)
+    self.full_refit_every = int(config['glm_modeling'].get('full_refit_every', 10))
+
+    self.stored_coefficients = None
+    self.incremental_updates = 0
+
   def buildModel(self):
     """
     Builds the GLM model, stores the coefficients, and calculates the probability based on model that a commit
     will introduce a bug.
     """
-    self._buildDataSet()
-    self._buildModelIncrementally()
+    try:
+      stored_coefficients = self._getStoredCoefficients()
+      self.stored_coefficients = stored_coefficients
+
+      # same training data as the stored model - only the testing commits need to be scored
+      if stored_coefficients is not None and stored_coefficients.training_fingerprint == self._trainingFingerprint():
+        logging.info("Training data unchanged, rescoring commits with the stored glm model of repo " + self.repo_id)
+        self._rescoreCommitRiskyness(self.commits, stored_coefficients)
+        return
+
+      self._buildDataSet()
+
+      if self.incremental and self._updateModelIncrementally(stored_coefficients):
+        return
+      elif self.selection == "lasso":
+        self._buildModelRegularized()
+      else:
+        self._buildModelIncrementally()
+    finally:
+      self.fit_cache.shutdown()
+
+  def _trainingFingerprint(self):
+    """
+    fingerprint of the training data, and of how the model is selected from it
+    """
+    return self.metrics.fingerprint() + ":" + self.selection
+
+  def _getStoredCoefficients(self):
+    """
+    returns the glm coefficients previously stored for the repository, if any
+    """
+    coefSession = Session()
+    stored_coefficients = coefSession.query(GlmCoefficients).filter(GlmCoefficients.repo == self.repo_id).first()
+    coefSession.close()
+    return stored_coefficients
 
   def _buildDataSet(self):
     """
@@ -48,117 +100,132 @@ class LinearRegressionModel:
     current_dir = os.path.dirname(__file__)
     # dir to store dataset to be used for building model
     dir_of_datasets = current_dir + "/datasets/model/"
-    num_buggy = getattr(self.metrics, "num_buggy")
-    num_nonbuggy = getattr(self.metrics, "num_nonbuggy")
 
     with open(dir_of_datasets + self.repo_id + ".csv", "w") as file:
       csv_writer = csv.writer(file, dialect="excel")
 
       # write the columns
-      csv_writer.writerow(["ns","nd","nf","entrophy","la","ld","lt","ndev","age","nuc","exp","rexp","sexp","is_buggy"])
-
-      # write the relevant data - start w/ the buggy data first
-      for buggy_index in range(0,num_buggy):
-        ns = self.metrics.ns_buggy[buggy_index]
-        nd = self.metrics.nd_buggy[buggy_index]
-        nf = self.metrics.nf_buggy[buggy_index]
-        entrophy = self.metrics.entrophy_buggy[buggy_index]
-        la = self.metrics.la_buggy[buggy_index]
-        ld = self.metrics.ld_buggy[buggy_index]
-        lt = self.metrics.lt_buggy[buggy_index]
-        ndev = self.metrics.ndev_buggy[buggy_index]
-        age = self.metrics.age_buggy[buggy_index]
-        nuc = self.metrics.nuc_buggy[buggy_index]
-        exp = self.metrics.exp_buggy[buggy_index]
-        rexp = self.metrics.rexp_buggy[buggy_index]
-        sexp = self.metrics.sexp_buggy[buggy_index]
-        csv_writer.writerow([ns,nd,nf,entrophy,la,ld,lt,ndev,age,nuc,exp,rexp,sexp,True])
-      # end buggy data
-
-      # write the non buggy data
-      for nonbuggy_index in range(0,num_nonbuggy):
-        ns = self.metrics.ns_nonbuggy[nonbuggy_index]
-        nd = self.metrics.nd_nonbuggy[nonbuggy_index]
-        nf = self.metrics.nf_nonbuggy[nonbuggy_index]
-        entrophy = self.metrics.entrophy_nonbuggy[nonbuggy_index]
-        la = self.metrics.la_nonbuggy[nonbuggy_index]
-        ld = self.metrics.ld_nonbuggy[nonbuggy_index]
-        lt = self.metrics.lt_nonbuggy[nonbuggy_index]
-        ndev = self.metrics.ndev_nonbuggy[nonbuggy_index]
-        age = self.metrics.age_nonbuggy[nonbuggy_index]
-        nuc = self.metrics.nuc_nonbuggy[nonbuggy_index]
-        exp = self.metrics.exp_nonbuggy[nonbuggy_index]
-        rexp = self.metrics.rexp_nonbuggy[nonbuggy_index]
-        sexp = self.metrics.sexp_nonbuggy[nonbuggy_index]
-        csv_writer.writerow([ns,nd,nf,entrophy,la,ld,lt,ndev,age,nuc,exp,rexp,sexp,False])
-      # end non buggy data
+      csv_writer.writerow(self.columns + ["is_buggy"])
+
+      # write the relevant data
+      csv_writer.writerows(row + [is_buggy] for row, is_buggy in zip(self.metrics.data.tolist(), self.metrics.is_buggy.tolist()))
     # end file
 
+    self.data = self.metrics.data
+    self.is_buggy = self.metrics.is_buggy.astype(float)
+    self.data_fingerprint = fingerprint(self.data, self.is_buggy)
+
+  def _fit(self, formula_metrics):
+    """
+    returns the (cached) fit of the GLM with the given metrics, or None if it cannot be built
+    """
+    return self.fit_cache.get(self.data, self.is_buggy, self.columns, formula_metrics, self.data_fingerprint,
+      self._startCoefficients)
+
+  def _startCoefficients(self, formula_metrics):
+    """
+    returns the coefficients of the previously stored model as starting point of the fit of the given
+    metrics (0 for the metrics it did not have), or None if there is no stored model
+    """
+    stored = self.stored_coefficients
+    if stored is None or stored.intercept is None:
+      return None
+
+    # the stored intercept is corrected for the sampling of the non buggy commits, see _getInterceptValue
+    start = [stored.intercept - np.log(self.metrics.nonbuggy_sampling_rate)]
+    for metric in formula_metrics:
+      if getattr(stored, metric + "_sig") == 1:
+        start.append(getattr(stored, metric))
+      else:
+        start.append(0.0)
+    return start
+
+  def _updateModelIncrementally(self, stored_coefficients):
+    """
+    Updates the stored model with only the training commits authored since it was built, keeping its metrics.
+    Returns false if the model cannot be updated and must be fully rebuilt: there is no stored model to update,
+    it has been updated too many times already, or there are no new commits (labels of older commits changed).
+    """
+    stored = stored_coefficients
+    if (stored is None or stored.information is None or stored.intercept is None
+        or stored.training_max_timestamp is None):
+      return False
+
+    if (stored.incremental_updates or 0) >= self.full_refit_every:
+      logging.info("Fully rebuilding the glm model of repo " + self.repo_id + " after " + str(stored.incremental_updates) + " incremental updates")
+      return False
+
+    if stored.training_fingerprint is None or not stored.training_fingerprint.endswith(":" + self.selection):
+      return False
+
+    information = json.loads(stored.information)
+    formula_metrics = information["terms"]
+    new_rows = self.metrics.timestamps > stored.training_max_timestamp
+
+    if len(formula_metrics) == 0 or not np.any(new_rows):
+      return False
+
+    indices = [self.columns.index(metric) for metric in formula_metrics]
+    fit = updateLogit(self.data[new_rows][:, indices], self.is_buggy[new_rows], formula_metrics,
+      self._startCoefficients(formula_metrics), information["matrix"])
+
+    if fit is None:
+      return False
+
+    logging.info("Updated the glm model of repo " + self.repo_id + " with " + str(int(np.count_nonzero(new_rows))) + " new commits")
+    self.fit_cache.put(formula_metrics, self.data_fingerprint, fit)
+    self.incremental_updates = (stored.incremental_updates or 0) + 1
+
+    # Store coefficients of the updated model
+    self._storeCoefficients(formula_metrics)
+
+    # Calculate all probability for each commit to introduce a bug
+    self.calculateCommitRiskyness(self.commits, formula_metrics)
+    return True
+
   def _isMetricSignificant(self, formula_metrics, metric):
     """
     Checks if adding a metric to the already significant metrics in formula_metrics in a GLM model is significant. If significant,
     and doesn't cause any previous metric in formula_metrics to become non significant, we return true. Otherwise, false.
-
-    Note: The p-value is always given in the 4th column of the summary matrix!
     """
-    sig_column = 4
+    fit = self._fit(formula_metrics + [metric])
+
+    # If we have two metrics that are perfectly collinear it will not build the model with the metrics.
+    # Indeed, do not add this value to the model!
+    if fit is None:
+      return False
 
     # Case 1: no existing metrics in the formula
     if len(formula_metrics) == 0:
-      formula = "is_buggy~" + metric
-      fit = self.stats.glm(formula, data=self.data, family="binomial")
-      summary = self.base.summary(fit)
-      # Note - first row is the intercept information so we start at second row!
-
-      try:
-        metric_sig = summary.rx2('coefficients').rx(2,sig_column)[0] # Second row, 4th column of the summary matrix.
-        if metric_sig <= self.sig_threshold:
-          return True
-        else:
-          return False
-
-      except:
-        # If we have two metrics that are perfectly collinear it will not build the model with the metrics
-        # and we will get an exception when trying to find the significance of *all values*. Indeed, do not add
-        # this value to the model!
-        return False
+      return fit.pvalues[metric] <= self.sig_threshold
 
-    # Case 2: existing metrics in the formula    
-    else:
-      num_metrics = len(formula_metrics)+2 # plus one for the new metric we are adding and one for intercept
-      formula = "is_buggy~" + "+".join(formula_metrics) + "+" + metric
-      fit = self.stats.glm(formula, data=self.data, family="binomial")
-      summary = self.base.summary(fit)
-
-      # If any metric is now not significant, than we should not have added this metric to the formula
-      # There are (intercept) + num_metrics rows in the matrix to check - starts at second row skipping intercept
-      try: 
-        for row in range(2,num_metrics+1):
-          metric_sig = summary.rx2('coefficients').rx(row,sig_column)[0]
-          if metric_sig > self.sig_threshold:
-            return False
-        return True # old metrics added to model ARE significant still as well as the new one being tested
-
-      except:
-        # If we have two metrics that are perfectly collinear it will not build the model with the metrics
-        # and we will get an exception when trying to find the significance of *all values*. Indeed, do not add
-        # this value to the model!
+    # Case 2: existing metrics in the formula
+    # If any metric is now not significant, than we should not have added this metric to the formula
+    for formula_metric in formula_metrics + [metric]:
+      if fit.pvalues[formula_metric] > self.sig_threshold:
         return False
+    return True # old metrics added to model ARE significant still as well as the new one being tested
 
   def _buildModelIncrementally(self):
     """
     Builds the linear regression model incrementally. It adds one metric at the time to the formula and keeps it
     if it is significant. However, if adding it to the model casuses any other metric already added to the formula
     to become not significant anymore, we do add it to the glm forumla.
+
+    While a candidate is being tested, the next few candidates (as many as the fit cache has workers) are
+    speculatively fitted against the current formula, so the next step's fit is usually ready by the time it is
+    needed. Speculative fits are wasted whenever a metric is accepted, so the lookahead is kept short.
     """
 
     metrics_list = ["la","ld","lt","ns","nd","nf","ndev","age","nuc","exp","rexp","sexp","entrophy"]
     formula_metrics = []
-    current_dir = os.path.dirname(__file__)
-    dir_of_datasets = current_dir + "/datasets/model/"
-    self.data = self.readcsv(dir_of_datasets + self.repo_id + ".csv", header=True, sep = ",")
+    lookahead = self.fit_cache.workers
+
+    for index, metric in enumerate(metrics_list):
+      for candidate in metrics_list[index:index + lookahead]:
+        self.fit_cache.submit(self.data, self.is_buggy, self.columns, formula_metrics + [candidate], self.data_fingerprint,
+          self._startCoefficients)
 
-    for metric in metrics_list:
       if self._isMetricSignificant(formula_metrics, metric):
         formula_metrics.append(metric)
 
@@ -168,6 +235,44 @@ class LinearRegressionModel:
     # Calculate all probability for each commit to introduce a bug
     self.calculateCommitRiskyness(self.commits, formula_metrics)
 
+  def _buildModelRegularized(self):
+    """
+    Builds the linear regression model by computing the path of L1-regularized logistic regressions over all
+    metrics at once, and keeping the support along the path whose (unpenalized) refit has the lowest BIC. Unlike
+    the incremental build, the result does not depend on the order the metrics are considered in.
+    """
+    path = l1LogitPath(self.data, self.is_buggy, self.columns)
+    num_observations = len(self.is_buggy)
+
+    # refit each distinct support concurrently
+    supports = []
+    for penalty, support in path:
+      if len(support) > 0 and support not in supports:
+        supports.append(support)
+        self.fit_cache.submit(self.data, self.is_buggy, self.columns, support, self.data_fingerprint, self._startCoefficients)
+
+    formula_metrics = []
+    best_bic = None
+    for support in supports:
+      fit = self._fit(support)
+
+      # collinear metrics in the support - model cannot be built
+      if fit is None:
+        continue
+
+      support_bic = bic(fit, num_observations)
+      if best_bic is None or support_bic < best_bic:
+        best_bic = support_bic
+        formula_metrics = support
+
+    logging.info("L1 path selected metrics " + str(formula_metrics) + " for repo " + self.repo_id)
+
+    # Store coefficients of the selected model
+    self._storeCoefficients(formula_metrics)
+
+    # Calculate all probability for each commit to introduce a bug
+    self.calculateCommitRiskyness(self.commits, formula_metrics)
+
 
   def _getCoefficients(self, formula_coefs):
     """
@@ -175,11 +280,10 @@ class LinearRegressionModel:
     coefficient with its value.
     """
     coef_dict = {} # a dict containing glm coefficients {name -> value}
-    formula = "is_buggy~" + "+".join(formula_coefs)
-    fit = self.stats.glm(formula, data=self.data, family="binomial")
+    fit = self._fit(formula_coefs)
 
     for coef in formula_coefs:
-      coef_dict[coef] = fit.rx2('coefficients').rx2(coef)[0]
+      coef_dict[coef] = fit.coefficients[coef]
 
     return coef_dict
 
@@ -187,11 +291,12 @@ class LinearRegressionModel:
     """
     Return the Intercept value of a GLM model and the p-value
     Assumes that model can be built!
+
+    When the model is trained on a sample of the non buggy commits, the intercept is shifted by the log
+    of their sampling rate so that probabilities are those of the full population (prior correction).
     """
-    formula = "is_buggy~" + "+".join(coefs)
-    fit = self.stats.glm(formula, data=self.data, family="binomial")
-    summary = self.base.summary(fit)
-    return summary.rx2('coefficients').rx(1)[0], summary.rx2('coefficients').rx(1,4)[0]
+    fit = self._fit(coefs)
+    return fit.coefficients["intercept"] + np.log(self.metrics.nonbuggy_sampling_rate), fit.pvalues["intercept"]
 
   def _getCoefficientObject(self, coef_name, coef_value):
     """
@@ -213,6 +318,9 @@ class LinearRegressionModel:
     # 2 Cases: where there are NO significant coefficients and the revese case.
     if len(coefficient_names) == 0:
       coefficient_dict = {}
+
+      # no model - clear the intercept of any previously stored one
+      coefs += '"intercept":null,"intercept_sig":null,'
     else:
       coefficient_dict = self._getCoefficients(coefficient_names)
 
@@ -233,6 +341,7 @@ class LinearRegressionModel:
     # iterate through all the values in the dict containing coeficients
     for coef_name, coef_value in coefficient_dict.items():
       coefs += self._getCoefficientObject(coef_name, coef_value)
+
       coefs += self._getCoefficientObject(coef_name + "_sig", 1) # keep track more easily which are statistically significant in db
       sig_coefs.append(coef_name)
 
@@ -242,6 +351,25 @@ class LinearRegressionModel:
         coefs += self._getCoefficientObject(c, -1) 
         coefs += self._getCoefficientObject(c + "_sig", 0)
 
+    coefs += self._getCoefficientObject("training_fingerprint", self._trainingFingerprint())
+    coefs += self._getCoefficientObject("incremental_updates", self.incremental_updates)
+    if self.metrics.max_timestamp is not None:
+      coefs += self._getCoefficientObject("training_max_timestamp", self.metrics.max_timestamp)
+
+    # size and seed of the training sample, if the model was trained on one
+    if self.metrics.sample_seed is not None:
+      coefs += self._getCoefficientObject("sample_size", len(self.metrics.is_buggy))
+      coefs += self._getCoefficientObject("sample_seed", self.metrics.sample_seed)
+    else:
+      coefs += '"sample_size":null,"sample_seed":null,'
+
+    # information matrix of the model, to update it incrementally later on
+    if len(coefficient_names) > 0:
+      information = {"terms": coefficient_names, "matrix": self._fit(coefficient_names).information.tolist()}
+      coefs += '"information":' + json.dumps(json.dumps(information)) + ','
+    else:
+      coefs += '"information":null,'
+
     # remove the trailing comma
     coefs = coefs[:-1]
 
@@ -262,34 +390,73 @@ class LinearRegressionModel:
     using the linear regression model
 
     estimated probability = 1/[1 + exp(-a - BX)]
+
+    probabilities are computed for all commits at once and written back to the commits table
+    in bulk, rather than through each commit's ORM object.
     """
     # 2 cases: model cannot possibly be build if no signficant coefficients available
-    # in this case, we just insert -1 for the probability to indicate no glm prediction possible
-
     if len(coefficient_names) == 0:
-      coefficient_dict = {}
-      model_available = False
+      self._scoreCommits(commits, 0, {})
     else:
       coefficient_dict = self._getCoefficients(coefficient_names)
-      model_available = True
       intercept_value, intercept_pvalue = self._getInterceptValue(coefficient_names)
+      self._scoreCommits(commits, intercept_value, coefficient_dict)
 
-    for commit in commits:
+  def _rescoreCommitRiskyness(self, commits, stored_coefficients):
+    """
+    calculates the probability of commits to be buggy using the coefficients stored in the glm_coefficients
+    table, without building the model
+    """
+    coefficient_dict = {}
+    for name in self.columns:
+      if getattr(stored_coefficients, name + "_sig") == 1:
+        coefficient_dict[name] = getattr(stored_coefficients, name)
 
-      if model_available == False:
-        commit.glm_probability = -1
-      else:
-        coefs_sum = 0
-        for coef_name, coef_value in coefficient_dict.items():
-          coefs_sum += (coef_value * getattr(commit, coef_name))
-
-        try:
-          riskyness = 1/(1+ math.exp(-intercept_value-coefs_sum))
-        except OverflowError:
-          logging.error("Overflow error for repo " + self.repo_id)
-          logging.error("Calculating riskyness for " + commit.commit_hash)
-          logging.error("Sum of coefficients: " + str(coefs_sum))
-          logging.error("Coeffiecents: " + str(coefficient_dict))
-          riskyness = 0.01
-
-        commit.glm_probability = riskyness
\ No newline at end of file
+    self._scoreCommits(commits, stored_coefficients.intercept, coefficient_dict)
+
+  def _scoreCommits(self, commits, intercept_value, coefficient_dict):
+    """
+    computes the probability of all commits at once and stores them
+    """
+    hashes = [commit.commit_hash for commit in commits]
+    coefficient_names = list(coefficient_dict.keys())
+
+    # no glm prediction possible - we just insert -1 for the probability to indicate it
+    if len(coefficient_names) == 0:
+      probabilities = np.full(len(hashes), -1.0)
+    else:
+      # commits x metrics matrix
+      get_metrics = operator.attrgetter(*coefficient_names)
+      matrix = np.array([get_metrics(commit) for commit in commits], dtype=float).reshape(len(hashes), len(coefficient_names))
+      probabilities = predictProbabilities(matrix, intercept_value, [coefficient_dict[name] for name in coefficient_names])
+
+      # -1 as well for the commits missing (NULL) a metric of the model, whose probability would be NaN
+      missing = np.isnan(matrix).any(axis=1)
+      if missing.any():
+        logging.warning(str(int(missing.sum())) + " commits of repo " + self.repo_id + " miss metrics of the glm model and cannot be scored")
+        probabilities[missing] = -1.0
+
+    self._storeRiskyness(hashes, probabilities)
+
+  def _storeRiskyness(self, hashes, probabilities):
+    """
+    writes the glm probability of each commit with one bulk UPDATE per batch, joining the commits
+    table to the unnested arrays of hashes and probabilities, all within one transaction
+    """
+    batch_size = 10000
+    statement = text("UPDATE commits SET glm_probability = v.probability "
+        "FROM unnest(:hashes, :probabilities) AS v(commit_hash, probability) "
+        "WHERE commits.commit_hash = v.commit_hash").bindparams(
+      bindparam('hashes', type_=ARRAY(String)),
+      bindparam('probabilities', type_=ARRAY(Float)))
+
+    riskySession = Session()
+    try:
+      for start in range(0, len(hashes), batch_size):
+        riskySession.execute(statement, {
+          'hashes': list(hashes[start:start + batch_size]),
+          'probabilities': [float(probability) for probability in probabilities[start:start + batch_size]]
+        })
+      riskySession.commit()
+    finally:
+      riskySession.close()
@@ -0,0 +1,59 @@
+"""
+file: lrucache.py
+description: In-memory cache used by the scoring and read services
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+  """
+  Thread safe least recently used cache, whose entries optionally expire after ttl seconds
+  """
+
+  def __init__(self, max_size, ttl=None):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.entries = OrderedDict() # key -> (time stored, value)
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    """
+    returns the cached value of key, or None if it is not cached or has expired
+    """
+    with self.lock:
+      if key not in self.entries:
+        return None
+
+      stored, value = self.entries[key]
+      if self.ttl is not None and time.time() - stored > self.ttl:
+        del self.entries[key]
+        return None
+
+      self.entries.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    with self.lock:
+      self.entries[key] = (time.time(), value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, key=None):
+    """
+    removes key from the cache, or everything if no key is given
+    """
+    with self.lock:
+      if key is None:
+        self.entries.clear()
+      else:
+        self.entries.pop(key, None)
+
+  def invalidateWhere(self, predicate):
+    """
+    removes every key for which predicate(key) is true
+    """
+    with self.lock:
+      for key in [key for key in self.entries if predicate(key)]:
+        del self.entries[key]
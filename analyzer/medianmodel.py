@@ -1,5 +1,5 @@
-import rpy2.robjects as robjects # R integration to python
 from analyzer.repositorymetrics import * # metrics abstraction; holds all metric values for commits
+from analyzer.ranksum import * # medians and wilcoxon rank sum tests of all metrics
 from db import *	# postgresql db information
 from orm.metrics import *	# orm metrics table
 from caslogging import logging
@@ -23,75 +23,61 @@ class MedianModel:
     # A p-value for wilcox test
     self.psig = 0.05
 
-    # R functions to be used
-    self.medianFn = robjects.r['median']
-    self.wilcoxFn = robjects.r['wilcox.test']
-
   def buildModel(self):
     """
-    builds the model
+    builds the model, unless it was already built from the same training data
     """
+    session = Session()
+    stored_metrics = session.query(Metrics).filter(Metrics.repo == self.repo_id).first()
+    session.close()
+
+    if stored_metrics is not None and stored_metrics.training_fingerprint == self.metrics.fingerprint():
+      logging.info("Training data unchanged, keeping the median model of repo " + self.repo_id)
+      return
+
     self.calculateMedians()
 
-  def getMedian(self,metric):
+  def getMedian(self, metric, buggy_median, nonbuggy_median, pvalue):
     """
     Helper function for the method calculateMedians.
-    Takes in a metric and returns a string property of the results
+    Takes in a metric with its medians and wilcox test p-value and returns a string property of the results
     @private
     """
     median_props = ""
+    median_props += '"' + metric + 'buggy":"' + str(buggy_median) + '", '
+    median_props += '"' + metric + 'nonbuggy":"' + str(nonbuggy_median) + '", '
 
-    try:
-      # R functions to be used
-      medianFn = robjects.r['median']
-      wilcoxFn = robjects.r['wilcox.test']
-
-      metric_buggy = getattr(self.metrics, metric + "_buggy")
-      metric_nonbuggy = getattr(self.metrics, metric + "_nonbuggy")
-
-      # First check p-values, if signficant then calculate median
-      pvalue = self.wilcoxFn(robjects.FloatVector(metric_buggy), robjects.FloatVector(metric_nonbuggy))[2][0]
-      buggy_median = self.medianFn(robjects.FloatVector(metric_buggy))
-      nonbuggy_median = self.medianFn(robjects.FloatVector(metric_nonbuggy))
-      median_props += '"' + metric + 'buggy":"' + str(buggy_median[0]) + '", '
-      median_props += '"' + metric + 'nonbuggy":"' + str(nonbuggy_median[0]) + '", '
-
-      if pvalue <= self.psig:
-        median_props += '"' + metric + '_sig":"1", '
-      else:
-        median_props += '"' + metric + '_sig":"0", '
-
-    except:
-      # catch the case where we haven't made any observations to do this metric
-      logging.info("Metric " + metric + " could not be used in the median model for repo " + self.repo_id)
+    if pvalue <= self.psig:
+      median_props += '"' + metric + '_sig":"1", '
+    else:
+      median_props += '"' + metric + '_sig":"0", '
 
     return median_props
 
 
   def calculateMedians(self):
     """
-    Using R through the rpy2 module, generate the medians of each metrics
-    lists. If it passes the wilcox test (statistically sig), put it into
-    the metrics table. Otherwise, inserts a -1.
+    Generate the medians of each metrics for the buggy and non buggy commits, along with the
+    wilcox test between them, for all metrics at once. If it passes the wilcox test (statistically sig),
+    it is marked as significant in the metrics table.
     @private
     """
 
     # Metric objects represents the metrics as a dictionary
     metricObject = '"repo":"' + self.repo_id + '", '
+    metricObject += '"training_fingerprint":"' + self.metrics.fingerprint() + '", '
+
+    if self.metrics.num_buggy == 0 or self.metrics.num_nonbuggy == 0:
+      # catch the case where we haven't made any observations to do the metrics
+      for metric in self.metrics.metric_names:
+        logging.info("Metric " + metric + " could not be used in the median model for repo " + self.repo_id)
+
+    else:
+      buggy_medians, nonbuggy_medians, pvalues = medianTests(
+        self.metrics.data[self.metrics.is_buggy], self.metrics.data[~self.metrics.is_buggy])
 
-    metricObject += self.getMedian("ns")
-    metricObject += self.getMedian("nd")
-    metricObject += self.getMedian("nf")
-    metricObject += self.getMedian("entrophy")
-    metricObject += self.getMedian("la")
-    metricObject += self.getMedian("ld")
-    metricObject += self.getMedian("lt")
-    metricObject += self.getMedian("ndev")
-    metricObject += self.getMedian("age")
-    metricObject += self.getMedian("nuc")
-    metricObject += self.getMedian("exp")
-    metricObject += self.getMedian("rexp")
-    metricObject += self.getMedian("sexp")
+      for index, metric in enumerate(self.metrics.metric_names):
+        metricObject += self.getMedian(metric, buggy_medians[index], nonbuggy_medians[index], pvalues[index])
 
     # Remove trailing comma
     metricObject = metricObject[:-2]
@@ -105,3 +91,4 @@ class MedianModel:
 
     # Write the metrics changes to the database
     metricsSession.commit()
+    metricsSession.close()
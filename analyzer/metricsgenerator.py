@@ -10,6 +10,12 @@ from analyzer.repositorymetrics import * # metrics abstraction; holds all metric
 from analyzer.medianmodel import * # builds the median model
 from analyzer.linear_reg_model import *
 from orm.commit import *
+from caslogging import logging
+from datetime import datetime
+from monthdelta import MonthDelta
+import calendar
+import gzip
+import hashlib
 import json
 
 class MetricsGenerator:
@@ -18,16 +24,19 @@ class MetricsGenerator:
 	Generate the metrics for buggy & non-buggy commits
 	"""
 
-	def __init__(self, repo_id, trainingData, testData):
+	DUMP_BATCH_SIZE = 10000           # rows fetched from the cursor at a time when dumping
+	DUMP_PROGRESS_INTERVAL = 100000   # log progress of dumps every this many rows
+
+	def __init__(self, repo_id, trainingCutoff):
 		"""
 		Constructor
 		@repo_id : repository id
-		@training data : all commits that we are training the models on 
-		@testing data : all commits that we are testing the models on (i.e. glm model)
+		@trainingCutoff : unix time; the models are trained on all commits authored before it,
+						  and tested on (i.e. glm model) all commits authored on or after it
 		"""
 		self.repo_id = repo_id
-		self.trainingData = trainingData
-		self.testData = testData
+		self.trainingCutoff = trainingCutoff
+		self.testData = []
 
 		# metrics
 		self.metrics = RepositoryMetrics()
@@ -38,6 +47,14 @@ class MetricsGenerator:
 		"""
 		self.fetchAllMetrics() # first get all metrics
 
+		# opt-in: bound the size of the training set of very large repositories
+		if config['glm_modeling'].get('sample_training', False):
+			max_nonbuggy = int(config['glm_modeling'].get('max_nonbuggy_rows', 100000))
+			seed = int(config['glm_modeling'].get('sample_seed', 42))
+			num_commits = len(self.metrics.is_buggy)
+			self.metrics = self.metrics.sample(max_nonbuggy, seed)
+			logging.info("Training on " + str(len(self.metrics.is_buggy)) + " of " + str(num_commits) + " commits of repo " + self.repo_id)
+
 		# Only use training data b/c if new bugs are introduced in newer commits,
 		# then we do not know about it and therefore new data is unreliable. 
 		median_model = MedianModel(self.metrics, self.repo_id)
@@ -46,10 +63,14 @@ class MetricsGenerator:
 		median_model.buildModel() # build the median model
 		linear_reg_model.buildModel() # build the linear regression model & calculate the riskyness of each commit
 
-	def dumpData(self, commits):
+	def dumpData(self):
 		"""
-		dumps all commit data(analyze result) into the monthly dataset folder.
-		dataset names after repository id
+		dumps all commit data(analyze result) into the monthly dataset folder, in a folder named
+		after the repository id holding one gzip compressed csv per author month and a manifest.json
+		listing the partitions and their checksums.
+
+		The checksum of every month's rows is computed by the database, and a partition is only
+		rewritten when it differs from the one in the manifest, so only changed months are read and written.
 		"""
 		# to write dataset file in this directory (git ignored!)
 		current_dir = os.path.dirname(__file__)
@@ -59,63 +80,142 @@ class MetricsGenerator:
 		else:
 			dir_of_datasets = current_dir + "/datasets/monthly/"
 
-		with open(dir_of_datasets + self.repo_id + ".csv", "w") as file:
+		dir_of_repo = os.path.join(dir_of_datasets, self.repo_id)
+		if not os.path.isdir(dir_of_repo):
+			os.makedirs(dir_of_repo)
+
+		manifest_path = os.path.join(dir_of_repo, "manifest.json")
+		manifest = {"repo": self.repo_id, "columns": Commit.__table__.columns.keys(), "partitions": {}}
+		if os.path.isfile(manifest_path):
+			with open(manifest_path) as file:
+				manifest["partitions"] = json.load(file).get("partitions", {})
+
+		session = Session()
+
+		try:
+			checksums = self._partitionChecksums(session)
+			num_rewritten = 0
+
+			for month, (num_rows, checksum) in sorted(checksums.items()):
+				partition = manifest["partitions"].get(month)
+				if (partition is not None and partition["source_checksum"] == checksum and
+						os.path.isfile(os.path.join(dir_of_repo, partition["file"]))):
+					continue
+
+				file_name = month + ".csv.gz"
+				sha256 = self._dumpPartition(session, month, os.path.join(dir_of_repo, file_name))
+				manifest["partitions"][month] = {"file": file_name, "rows": num_rows, "source_checksum": checksum, "sha256": sha256}
+				num_rewritten += 1
+
+			# months that no longer have commits
+			for month in list(manifest["partitions"].keys()):
+				if month not in checksums:
+					old_file = os.path.join(dir_of_repo, manifest["partitions"][month]["file"])
+					if os.path.isfile(old_file):
+						os.remove(old_file)
+					del manifest["partitions"][month]
+		finally:
+			session.close()
+
+		manifest["generated"] = str(datetime.now().replace(microsecond=0))
+		with open(manifest_path + ".tmp", "w") as file:
+			json.dump(manifest, file, indent=2, sort_keys=True)
+		os.replace(manifest_path + ".tmp", manifest_path)
+
+		logging.info("Rewrote " + str(num_rewritten) + " of " + str(len(checksums)) + " monthly partitions of repository " + self.repo_id)
+
+	def _partitionChecksums(self, session):
+		"""
+		returns {author month (YYYY-MM, or "unknown") -> (number of commits, checksum of their rows)},
+		computed by the database without transferring the rows.
+		@private
+		"""
+		rows = session.execute(text(
+			"SELECT to_char(to_timestamp(c.author_date_unix_timestamp) AT TIME ZONE 'UTC', 'YYYY-MM') AS month, "
+			"count(*), md5(string_agg(md5(c::text), '' ORDER BY c.commit_hash)) "
+			"FROM commits AS c WHERE c.repository_id = :repo_id GROUP BY 1"), {"repo_id": self.repo_id})
+
+		checksums = {}
+		for month, num_rows, checksum in rows:
+			checksums[month if month is not None else "unknown"] = (num_rows, checksum)
+		return checksums
+
+	def _dumpPartition(self, session, month, path):
+		"""
+		streams the commits authored in the month from a server side cursor into a compressed csv at path,
+		and returns the sha256 of the file
+		@private
+		"""
+		columns = Commit.__table__.columns.keys()
+		num_dumped = 0
+
+		if month == "unknown":
+			in_month = Commit.author_date_unix_timestamp == None
+		else:
+			year, month_of_year = [int(part) for part in month.split("-")]
+			start = calendar.timegm(datetime(year, month_of_year, 1).utctimetuple())
+			end = calendar.timegm((datetime(year, month_of_year, 1) + MonthDelta(1)).utctimetuple())
+			in_month = (Commit.author_date_unix_timestamp >= start) & (Commit.author_date_unix_timestamp < end)
+
+		commits = (session.query(*[Commit.__table__.c[col] for col in columns])
+			.filter( (Commit.repository_id == self.repo_id) & in_month )
+			.order_by( Commit.author_date_unix_timestamp.desc(), Commit.commit_hash )
+			.execution_options(stream_results=True)
+			.yield_per(self.DUMP_BATCH_SIZE))
+
+		with gzip.open(path + ".tmp", "wt", newline="") as file:
 			csv_writer = csv.writer(file, dialect="excel")
-			columns = Commit.__table__.columns.keys()
 
 			# write the columns
 			csv_writer.writerow(columns)
 
 			# dump all commit data
 			for commit in commits:
-				commit_data = []
-				for col in columns:
-					commit_data.append(getattr(commit,col))
-				csv_writer.writerow(commit_data)
+				csv_writer.writerow(commit)
+				num_dumped += 1
+
+				if num_dumped % self.DUMP_PROGRESS_INTERVAL == 0:
+					logging.info("Dumped " + str(num_dumped) + " commits of " + month + " of repository " + self.repo_id)
+
+		os.replace(path + ".tmp", path)
+
+		digest = hashlib.sha256()
+		with open(path, "rb") as file:
+			for chunk in iter(lambda: file.read(1 << 20), b""):
+				digest.update(chunk)
+		return digest.hexdigest()
 
 	def fetchAllMetrics(self):
 		"""
 		fetchAllMetrics()
-		Iterate through each commit storing each individual's metrics into the metrics object,
-		to hold all metrics information necessary to build models.
+		Reads the commits of the repository once and splits them into the training data, loaded into the
+		metrics object to hold all metrics information necessary to build models, and the testing data.
+		Only the columns needed to build and test the models are queried, streamed in bulk.
 		@private
 		"""
-		for commit in self.trainingData:
-
-			# Exclude merge commits where no lines of code where changed
-			if commit.classification == "Merge" and commit.la == 0 and commit.ld == 0:
+		session = Session()
+		columns = [Commit.commit_hash]
+		columns += [getattr(Commit, name) for name in RepositoryMetrics.metric_names]
+		columns += [Commit.contains_bug, Commit.classification, Commit.author_date_unix_timestamp]
+
+		commits = (session.query(*columns)
+			.filter( Commit.repository_id == self.repo_id )
+			.order_by( Commit.author_date_unix_timestamp.desc(), Commit.commit_hash )
+			.execution_options(stream_results=True)
+			.yield_per(10000))
+
+		training_rows = []
+		testing_commits = []
+
+		for commit in commits:
+			if commit.author_date_unix_timestamp is None:
 				continue
-
+			elif commit.author_date_unix_timestamp < self.trainingCutoff:
+				training_rows.append(commit[1:]) # metrics, contains_bug, classification and timestamp
 			else:
+				testing_commits.append(commit)
+
+		session.close()
 
-				if commit.contains_bug == True:
-					self.metrics.ns_buggy.append(commit.ns)
-					self.metrics.nd_buggy.append(commit.nd)
-					self.metrics.nf_buggy.append(commit.nf)
-					self.metrics.entrophy_buggy.append(commit.entrophy)
-					self.metrics.la_buggy.append(commit.la)
-					self.metrics.ld_buggy.append(commit.ld)
-					self.metrics.lt_buggy.append(commit.lt)
-					self.metrics.ndev_buggy.append(commit.ndev)
-					self.metrics.age_buggy.append(commit.age)
-					self.metrics.nuc_buggy.append(commit.nuc)
-					self.metrics.exp_buggy.append(commit.exp)
-					self.metrics.rexp_buggy.append(commit.rexp)
-					self.metrics.sexp_buggy.append(commit.sexp)
-					self.metrics.num_buggy += 1
-
-				else:
-					self.metrics.ns_nonbuggy.append(commit.ns)
-					self.metrics.nd_nonbuggy.append(commit.nd)
-					self.metrics.nf_nonbuggy.append(commit.nf)
-					self.metrics.entrophy_nonbuggy.append(commit.entrophy)
-					self.metrics.la_nonbuggy.append(commit.la)
-					self.metrics.ld_nonbuggy.append(commit.ld)
-					self.metrics.lt_nonbuggy.append(commit.lt)
-					self.metrics.ndev_nonbuggy.append(commit.ndev)
-					self.metrics.age_nonbuggy.append(commit.age)
-					self.metrics.nuc_nonbuggy.append(commit.nuc)
-					self.metrics.exp_nonbuggy.append(commit.exp)
-					self.metrics.rexp_nonbuggy.append(commit.rexp)
-					self.metrics.sexp_nonbuggy.append(commit.sexp)
-					self.metrics.num_nonbuggy += 1
+		self.metrics = RepositoryMetrics.fromRows(training_rows)
+		self.testData = testing_commits
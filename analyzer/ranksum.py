@@ -0,0 +1,108 @@
+"""
+file: ranksum.py
+description: Computes the medians of buggy and non buggy commits and the Wilcoxon rank sum
+test between them for every metric at once. The p-values follow R's wilcox.test defaults:
+two sided, exact when both samples have fewer than 50 observations and no ties, otherwise
+a normal approximation with continuity and tie correction.
+"""
+import math
+import numpy as np
+
+EXACT_LIMIT = 50 # R computes exact p-values when both samples are smaller than this
+
+def _averageRanks(matrix):
+  """
+  ranks each column of the matrix, giving tied values the average of their ranks.
+  Returns the ranks and, per column, the tie correction term sum(t^3 - t) over groups of t ties.
+  """
+  n, p = matrix.shape
+  order = np.argsort(matrix, axis=0, kind='mergesort')
+  sorted_values = np.take_along_axis(matrix, order, axis=0)
+
+  # a new group of ties starts wherever the sorted value changes
+  starts = np.ones((n, p), dtype=bool)
+  starts[1:] = sorted_values[1:] != sorted_values[:-1]
+  groups_per_column = starts.sum(axis=0)
+  offsets = np.concatenate([[0], np.cumsum(groups_per_column)[:-1]])
+  group_ids = (np.cumsum(starts, axis=0) - 1 + offsets).ravel()
+
+  # the average rank of a group is the mean of its (1-based) positions
+  positions = np.repeat(np.arange(1, n + 1, dtype=float), p)
+  group_sizes = np.bincount(group_ids)
+  group_ranks = np.bincount(group_ids, weights=positions) / group_sizes
+
+  ranks = np.empty((n, p))
+  np.put_along_axis(ranks, order, group_ranks[group_ids].reshape(n, p), axis=0)
+
+  group_columns = np.repeat(np.arange(p), groups_per_column)
+  ties = np.bincount(group_columns, weights=group_sizes.astype(float) ** 3 - group_sizes, minlength=p)
+  return ranks, ties
+
+def _rankSumDistribution(n_x, n_y):
+  """
+  returns the cumulative distribution of the Mann-Whitney statistic W for samples of
+  sizes n_x and n_y without ties, i.e. R's pwilcox(0..n_x*n_y, n_x, n_y)
+  """
+  # ways[k][u] = number of ways to pick k of the values seen so far with statistic u
+  max_w = n_x * n_y
+  ways = np.zeros((n_x + 1, max_w + 1))
+  ways[0, 0] = 1.0
+
+  for item in range(n_x + n_y):
+    # picking this item as the k-th of x adds (item - (k - 1)) to W
+    for k in range(min(item + 1, n_x), 0, -1):
+      shift = item - (k - 1)
+      if shift <= max_w:
+        ways[k, shift:] += ways[k - 1, :max_w + 1 - shift]
+
+  counts = ways[n_x]
+  return np.cumsum(counts) / counts.sum()
+
+def _exactPvalue(statistic, cdf, n_x, n_y):
+  """
+  two sided exact p-value of the statistic, as computed by R's wilcox.test
+  """
+  statistic = int(round(statistic))
+  if statistic > n_x * n_y / 2:
+    pvalue = 1.0 - cdf[statistic - 1]
+  else:
+    pvalue = cdf[statistic]
+  return min(2 * pvalue, 1.0)
+
+def medianTests(buggy, nonbuggy):
+  """
+  @buggy    - matrix of buggy commits (rows) by metrics (columns)
+  @nonbuggy - matrix of non buggy commits (rows) by metrics (columns)
+
+  returns the buggy medians, the non buggy medians and the rank sum test p-values of each
+  metric, as three arrays. Neither matrix may be empty.
+  """
+  n_x = buggy.shape[0]
+  n_y = nonbuggy.shape[0]
+
+  buggy_medians = np.median(buggy, axis=0)
+  nonbuggy_medians = np.median(nonbuggy, axis=0)
+
+  ranks, ties = _averageRanks(np.vstack([buggy, nonbuggy]))
+  statistics = ranks[:n_x].sum(axis=0) - n_x * (n_x + 1) / 2.0
+
+  # normal approximation
+  z = statistics - n_x * n_y / 2.0
+  sigma = np.sqrt((n_x * n_y / 12.0) * ((n_x + n_y + 1) - ties / ((n_x + n_y) * (n_x + n_y - 1))))
+  correction = np.sign(z) * 0.5
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    z = (z - correction) / sigma
+
+  pvalues = np.array([math.erfc(abs(value) / math.sqrt(2)) for value in z])
+
+  # exact p-values for small samples without ties
+  if n_x < EXACT_LIMIT and n_y < EXACT_LIMIT:
+    cdf = None
+    for column in range(buggy.shape[1]):
+      if ties[column] == 0:
+        if cdf is None:
+          cdf = _rankSumDistribution(n_x, n_y)
+        pvalues[column] = _exactPvalue(statistics[column], cdf, n_x, n_y)
+
+  return buggy_medians, nonbuggy_medians, pvalues
@@ -1,36 +1,102 @@
+import hashlib
+import numpy as np
 
 class RepositoryMetrics:
   """
-  Holds all the metrics values for a repository
+  Holds all the metrics values for a repository, column oriented: a matrix of
+  commits (rows) by metrics (columns) and a boolean vector of which commits are buggy.
   """
 
-  def __init__(self):
-
-    self.ns_buggy = []
-    self.ns_nonbuggy = []
-    self.nd_buggy = []
-    self.nd_nonbuggy = []
-    self.nf_buggy = []
-    self.nf_nonbuggy = []
-    self.entrophy_buggy = []
-    self.entrophy_nonbuggy = []
-    self.la_buggy = []
-    self.la_nonbuggy = []
-    self.ld_buggy = []
-    self.ld_nonbuggy = []
-    self.lt_buggy = []
-    self.lt_nonbuggy = []
-    self.ndev_buggy = []
-    self.ndev_nonbuggy = []
-    self.age_buggy = []
-    self.age_nonbuggy = []
-    self.nuc_buggy = []
-    self.nuc_nonbuggy = []
-    self.exp_buggy = []
-    self.exp_nonbuggy = []
-    self.rexp_nonbuggy = []
-    self.rexp_buggy = []
-    self.sexp_buggy = []
-    self.sexp_nonbuggy = []
-    self.num_buggy = 0
-    self.num_nonbuggy = 0
+  # column order of the metrics matrix
+  metric_names = ["ns","nd","nf","entrophy","la","ld","lt","ndev","age","nuc","exp","rexp","sexp"]
+
+  def __init__(self, data=None, is_buggy=None, timestamps=None):
+    """
+    @data       : float matrix of commits by metric_names
+    @is_buggy   : boolean vector, true if the commit of the same row contains a bug
+    @timestamps : author time of the commit of each row
+    """
+    if data is None:
+      data = np.empty((0, len(self.metric_names)))
+      is_buggy = np.empty(0, dtype=bool)
+
+    if timestamps is None:
+      timestamps = np.full(len(is_buggy), np.nan)
+
+    self.data = data
+    self.is_buggy = is_buggy
+    self.timestamps = timestamps
+
+    # author time of the most recent commit
+    if np.any(~np.isnan(timestamps)):
+      self.max_timestamp = float(np.nanmax(timestamps))
+    else:
+      self.max_timestamp = None
+
+    self.num_buggy = int(np.count_nonzero(is_buggy))
+    self.num_nonbuggy = len(is_buggy) - self.num_buggy
+
+    # fraction of the non buggy commits kept and seed they were sampled with, see sample()
+    self.nonbuggy_sampling_rate = 1.0
+    self.sample_seed = None
+
+  @classmethod
+  def fromRows(cls, rows):
+    """
+    builds the metrics from rows holding the metric_names columns, followed by the
+    contains_bug, classification and author_date_unix_timestamp columns of each commit.
+    Merge commits where no lines of code where changed are excluded.
+    """
+    num_metrics = len(cls.metric_names)
+    rows = list(rows)
+
+    data = np.array([row[:num_metrics] for row in rows], dtype=float).reshape(len(rows), num_metrics)
+    is_buggy = np.array([row[num_metrics] == True for row in rows], dtype=bool)
+    is_merge = np.array([row[num_metrics + 1] == "Merge" for row in rows], dtype=bool)
+    timestamps = np.array([row[num_metrics + 2] for row in rows], dtype=float)
+
+    la = data[:, cls.metric_names.index("la")]
+    ld = data[:, cls.metric_names.index("ld")]
+    keep = ~(is_merge & (la == 0) & (ld == 0))
+
+    return cls(data[keep], is_buggy[keep], timestamps[keep])
+
+  def sample(self, max_nonbuggy, seed):
+    """
+    returns the metrics of a stratified sample of the commits: every buggy commit is kept and at most
+    max_nonbuggy non buggy commits are drawn at random with the given seed. Commits keep their order.
+    """
+    if self.num_nonbuggy <= max_nonbuggy:
+      return self
+
+    nonbuggy_rows = np.flatnonzero(~self.is_buggy)
+    sampled_rows = np.random.RandomState(seed).choice(nonbuggy_rows, max_nonbuggy, replace=False)
+    keep = np.sort(np.concatenate([np.flatnonzero(self.is_buggy), sampled_rows]))
+
+    sample = RepositoryMetrics(self.data[keep], self.is_buggy[keep], self.timestamps[keep])
+    sample.nonbuggy_sampling_rate = max_nonbuggy / float(self.num_nonbuggy)
+    sample.sample_seed = seed
+    return sample
+
+  def fingerprint(self):
+    """
+    returns a fingerprint of the training set: its number of commits, the time of the most
+    recent one and a hash of all the labels and metrics. Models built from data with the
+    same fingerprint are the same.
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(self.data).tobytes())
+    digest.update(np.ascontiguousarray(self.is_buggy).tobytes())
+    return "%d:%s:%s" % (len(self.is_buggy), self.max_timestamp, digest.hexdigest())
+
+  def buggy(self, metric):
+    """
+    returns the values of a metric for the buggy commits
+    """
+    return self.data[self.is_buggy, self.metric_names.index(metric)]
+
+  def nonbuggy(self, metric):
+    """
+    returns the values of a metric for the non buggy commits
+    """
+    return self.data[~self.is_buggy, self.metric_names.index(metric)]
@@ -0,0 +1,145 @@
+"""
+file: riskreader.py
+description: Read side service over the stored analysis results (commit risk, median metrics and
+glm coefficients) for the web tier. Results are kept in an in-memory TTL/LRU cache, and the cached
+results of a repository are dropped as soon as it is analyzed again: marking a repository "Analyzed"
+sets its analysis date, which versions its cache entries.
+"""
+import time
+from sqlalchemy import func
+from orm.commit import *
+from orm.repository import *
+from orm.metrics import *
+from orm.glmcoefficients import *
+from analyzer.lrucache import *
+
+class RiskReader:
+  """
+  Cached read API for the stored risk of commits and metrics of repositories
+  """
+
+  def __init__(self, cache_size=1024, ttl=300, version_check_interval=5):
+    """
+    @cache_size             : number of results kept in memory
+    @ttl                    : seconds after which a result is read again regardless
+    @version_check_interval : seconds between two checks of whether a repository was analyzed again
+    """
+    self.cache = LRUCache(cache_size, ttl)
+    self.version_check_interval = version_check_interval
+    self.versions = LRUCache(cache_size) # repo id -> (analysis date, time checked)
+
+  def invalidateRepository(self, repo_id):
+    """
+    drops every cached result of the repository
+    """
+    self.cache.invalidateWhere(lambda key: key[0] == repo_id)
+
+  def _checkVersion(self, repo_id, session):
+    """
+    drops the cached results of the repository if it has been analyzed since they were cached
+    """
+    now = time.time()
+    version = self.versions.get(repo_id)
+    if version is not None and now - version[1] < self.version_check_interval:
+      return
+
+    # the results cached while the version was not known (i.e. it was evicted) may be stale too
+    analysis_date = session.query(Repository.analysis_date).filter(Repository.id == repo_id).scalar()
+    if version is None or version[0] != analysis_date:
+      self.invalidateRepository(repo_id)
+    self.versions.put(repo_id, (analysis_date, now))
+
+  def _cached(self, key, read):
+    """
+    returns the cached result of key, reading it with read(session) if it is not cached
+    """
+    session = Session()
+    try:
+      self._checkVersion(key[0], session)
+      result = self.cache.get(key)
+      if result is None:
+        result = read(session)
+        self.cache.put(key, result)
+      return result
+    finally:
+      session.close()
+
+  def _commitRisk(self, commit):
+    return {
+      "commit_hash": commit.commit_hash,
+      "author_name": commit.author_name,
+      "author_date": commit.author_date,
+      "commit_message": commit.commit_message,
+      "contains_bug": commit.contains_bug,
+      "glm_probability": commit.glm_probability
+    }
+
+  def topRiskyCommits(self, repo_id, limit=10):
+    """
+    returns the limit commits of the repository with the highest glm probability
+    """
+    def read(session):
+      commits = (session.query(Commit)
+        .filter( (Commit.repository_id == repo_id) & (Commit.glm_probability != None) )
+        .order_by( Commit.glm_probability.desc() )
+        .limit(limit)
+        .all())
+      return [self._commitRisk(commit) for commit in commits]
+
+    return self._cached((repo_id, "top", limit), read)
+
+  def commitRisk(self, repo_id, commit_hash):
+    """
+    returns the risk of a commit of the repository, or None if there is no such commit
+    """
+    def read(session):
+      commit = (session.query(Commit)
+        .filter( (Commit.repository_id == repo_id) & (Commit.commit_hash == commit_hash) )
+        .first())
+      return self._commitRisk(commit) if commit is not None else {}
+
+    return self._cached((repo_id, "commit", commit_hash), read) or None
+
+  def repositorySummary(self, repo_id):
+    """
+    returns the status of the repository, counts and risk statistics of its commits, its median
+    metrics and its glm coefficients, or None if there is no such repository
+    """
+    def read(session):
+      repo = session.query(Repository).filter(Repository.id == repo_id).first()
+      if repo is None:
+        return {}
+
+      num_commits, num_buggy, avg_probability, max_probability = (session.query(
+          func.count(Commit.commit_hash),
+          func.sum(case([(Commit.contains_bug == True, 1)], else_=0)),
+          func.avg(Commit.glm_probability),
+          func.max(Commit.glm_probability))
+        .filter(Commit.repository_id == repo_id)
+        .one())
+
+      metrics = session.query(Metrics).filter(Metrics.repo == repo_id).first()
+      coefficients = session.query(GlmCoefficients).filter(GlmCoefficients.repo == repo_id).first()
+
+      return {
+        "repo": repo_id,
+        "name": repo.name,
+        "status": repo.status,
+        "analysis_date": repo.analysis_date,
+        "num_commits": num_commits,
+        "num_buggy": int(num_buggy or 0),
+        "avg_glm_probability": avg_probability,
+        "max_glm_probability": max_probability,
+        "metrics": self._columns(metrics),
+        "glm_coefficients": self._columns(coefficients)
+      }
+
+    return self._cached((repo_id, "summary"), read) or None
+
+  def _columns(self, row):
+    """
+    returns the columns of an ORM row as a dictionary
+    """
+    if row is None:
+      return None
+    return dict((column, getattr(row, column)) for column in row.__table__.columns.keys())
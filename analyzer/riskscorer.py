@@ -0,0 +1,233 @@
+"""
+file: riskscorer.py
+description: Scores the risk of changes that have not been ingested yet (a diff, or a commit range
+of the local clone) with the stored glm model of their repository. The file and developer state of
+each repository is rebuilt once from the commits table and kept, along with its glm coefficients,
+in an in-memory LRU cache so that scoring a change only takes milliseconds.
+"""
+import copy
+import json
+import os
+import re
+import time
+import numpy as np
+from ingester.git import * # computes the change metrics
+from orm.commit import *
+from orm.repository import *
+from orm.glmcoefficients import *
+from analyzer.repositorymetrics import * # metric names
+from analyzer.glmfit import * # probabilities
+from analyzer.lrucache import *
+from deadline import checkOutput
+from caslogging import logging
+
+# a revision (i.e. a hash, branch, tag, HEAD~2 or master@{1}) or a range of two of them (A..B or A...B)
+REVISION = r"[\w./@{}~^][\w./@{}~^-]*"
+REVISION_RANGE = re.compile(r"^" + REVISION + r"(\.\.\.?(" + REVISION + r")?)?$")
+
+class InvalidRequest(Exception):
+  """Raised when a change to score is not given in a valid form"""
+  pass
+
+class RepositoryState:
+  """
+  What is needed to score a change of a repository: the state of its files and developers,
+  as left by the ingested commits, and its glm model.
+  """
+
+  def __init__(self, repo_id, files, developers, intercept, coefficients):
+    self.repo_id = repo_id
+    self.files = files               # file name -> CommitFile
+    self.developers = developers     # author -> {subsystem -> number of changes}
+    self.intercept = intercept
+    self.coefficients = coefficients # metric -> coefficient, for metrics in the model
+
+class RiskScorer:
+  """
+  Computes the 13 change metrics of a diff or commit range against the state of its
+  repository and returns the probability of the change to introduce a bug.
+  """
+
+  REPO_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "ingester", "CASRepos", "git")
+
+  def __init__(self, cache_size=64, ttl=600):
+    self.states = LRUCache(cache_size, ttl)
+
+  def getState(self, repo_id):
+    """
+    returns the state of a repository, loading it if it is not cached
+    """
+    state = self.states.get(repo_id)
+    if state is None:
+      state = self._loadState(repo_id)
+      self.states.put(repo_id, state)
+    return state
+
+  def _loadState(self, repo_id):
+    """
+    replays the files changed by every ingested commit of the repository, in order, to rebuild
+    the file and developer state the ingester computed its metrics with
+    """
+    start = time.time()
+    session = Session()
+
+    # the id is also a directory name, only ids of known repositories may reach the file system
+    if session.query(Repository.id).filter(Repository.id == repo_id).first() is None:
+      session.close()
+      raise ValueError("Unknown repository " + repo_id)
+
+    coefficients_row = session.query(GlmCoefficients).filter(GlmCoefficients.repo == repo_id).first()
+    if coefficients_row is None:
+      session.close()
+      raise ValueError("No glm model has been built for repository " + repo_id)
+
+    # a model with no metric is stored with a null intercept and intercept_sig
+    intercept = None
+    coefficients = {}
+    if coefficients_row.intercept_sig is not None and coefficients_row.intercept is not None:
+      intercept = coefficients_row.intercept
+      for metric in RepositoryMetrics.metric_names:
+        if getattr(coefficients_row, metric + "_sig") == 1:
+          coefficients[metric] = getattr(coefficients_row, metric)
+
+    files = {}
+    developers = {}
+    commits = (session.query(Commit.author_name, Commit.author_date_unix_timestamp, Commit.fileschanged)
+      .filter(Commit.repository_id == repo_id)
+      .order_by(Commit.author_date_unix_timestamp.asc())
+      .yield_per(10000))
+
+    for author, timestamp, fileschanged in commits:
+      stats = ["0\\t0\\t" + name for name in self._filesChanged(fileschanged)]
+      Git.getCommitStatsProperties(stats, files, developers, author, str(int(timestamp or 0)))
+
+    session.close()
+    logging.info("Loaded the scoring state of repository " + repo_id + " in " + str(round(time.time() - start, 2)) + "s")
+    return RepositoryState(repo_id, files, developers, intercept, coefficients)
+
+  def _filesChanged(self, fileschanged):
+    """
+    splits the fileschanged column of a commit into file names
+    """
+    if fileschanged is None or fileschanged == "NULL":
+      return []
+    names = [name.lstrip(",") for name in fileschanged.split(",CAS_DELIMITER")]
+    return [name for name in names if name != ""]
+
+  def _numstat(self, diff):
+    """
+    returns the list of (lines added, lines deleted, file name) of each file in a unified diff
+    """
+    stats = []
+    in_hunk = False
+
+    for line in diff.splitlines():
+      if line.startswith("diff --git "):
+        match = re.match(r"diff --git a/(.*) b/(.*)", line)
+        if match is None:
+          in_hunk = False
+          continue
+        stats.append([0, 0, match.group(2)])
+        in_hunk = False
+      elif line.startswith("@@") and len(stats) > 0:
+        in_hunk = True
+      elif in_hunk and line.startswith("+"):
+        stats[-1][0] += 1
+      elif in_hunk and line.startswith("-"):
+        stats[-1][1] += 1
+
+    return [tuple(stat) for stat in stats]
+
+  def _countLines(self, repo_id, name):
+    """
+    lines of code of a file in the local clone of the repository, 0 if it does not exist
+    """
+    repo_dir = os.path.realpath(os.path.join(self.REPO_DIRECTORY, repo_id))
+    path = os.path.realpath(os.path.join(repo_dir, name))
+    if not path.startswith(repo_dir + os.sep):
+      return 0 # the name of a file of the diff may point outside of the clone
+
+    try:
+      with open(path, "rb") as file:
+        return sum(1 for line in file)
+    except (IOError, OSError):
+      return 0
+
+  def scoreDiff(self, repo_id, diff, author=None, timestamp=None):
+    """
+    scores a unified diff (as given by git diff or git show) authored by author at the unix time timestamp
+    """
+    return self._score(repo_id, self._numstat(diff), author, timestamp)
+
+  def scoreRange(self, repo_id, commit_range, author=None):
+    """
+    scores the changes of a commit range (i.e. "A..B") of the local clone of the repository, as one change
+    """
+    # the range comes from the request - it must not be taken by git for an option (i.e. --output=<file>)
+    if not REVISION_RANGE.match(commit_range):
+      raise InvalidRequest("Invalid commit range: " + commit_range)
+
+    self.getState(repo_id) # unknown repositories are rejected before their directory is used
+    repo_dir = os.path.join(self.REPO_DIRECTORY, repo_id)
+    numstat = checkOutput(["git", "diff", "--numstat", "--end-of-options", commit_range], cwd=repo_dir).decode("utf-8", "replace")
+
+    stats = []
+    for line in numstat.splitlines():
+      fields = line.split("\t")
+      if len(fields) == 3:
+        # binary files have "-" line counts
+        added = int(fields[0]) if fields[0].isdigit() else 0
+        deleted = int(fields[1]) if fields[1].isdigit() else 0
+        stats.append((added, deleted, fields[2]))
+
+    if author is None:
+      last_commit = commit_range.split("..")[-1].lstrip(".") or "HEAD"
+      author = checkOutput(["git", "log", "-1", "--format=%an", "--end-of-options", last_commit], cwd=repo_dir).decode("utf-8", "replace").strip()
+
+    return self._score(repo_id, stats, author, None)
+
+  def _score(self, repo_id, stats, author, timestamp):
+    """
+    computes the metrics of the change given by its stats and its probability with the repository's glm model
+    """
+    start = time.time()
+    state = self.getState(repo_id)
+
+    if author is None:
+      author = ""
+    if timestamp is None:
+      timestamp = int(time.time())
+
+    # work on copies of the state of the files and developer touched, the change is not part of the history
+    files = {}
+    for added, deleted, name in stats:
+      if name in state.files:
+        files[name] = copy.copy(state.files[name])
+        files[name].loc = self._countLines(repo_id, name)
+    developers = {}
+    if author in state.developers:
+      developers[author] = dict(state.developers[author])
+
+    git_stats = [str(added) + "\\t" + str(deleted) + "\\t" + name for added, deleted, name in stats]
+    properties = Git.getCommitStatsProperties(git_stats, files, developers, author, str(int(timestamp)))
+
+    if properties == "":
+      metrics = dict((metric, 0.0) for metric in RepositoryMetrics.metric_names)
+    else:
+      properties = json.loads("{" + properties[1:] + "}")
+      metrics = dict((metric, float(properties[metric])) for metric in RepositoryMetrics.metric_names)
+
+    # -1 when no glm prediction is possible, as for ingested commits
+    if len(state.coefficients) == 0:
+      probability = -1.0
+    else:
+      names = list(state.coefficients.keys())
+      matrix = np.array([[metrics[name] for name in names]])
+      probability = float(predictProbabilities(matrix, state.intercept, [state.coefficients[name] for name in names])[0])
+
+    return {
+      "repo": repo_id,
+      "glm_probability": probability,
+      "metrics": metrics,
+      "elapsed_ms": round((time.time() - start) * 1000, 2)
+    }
@@ -3,31 +3,199 @@ file: cas_manager.py
 authors: Christoffer Rosen <cbr4830@rit.edu>
 date: Jan. 2014
 description: This module contains the CAS_manager class, which is a thread that continously checks if there
-			 is work that needs to be done. Also contains supporting classes of Worker and ThreadPool used by
-			 the CAS_Manager.
+			 is work that needs to be done, queues it as jobs and hands claimed jobs to its workers. Also contains
+			 supporting classes of Worker, ThreadPool and ProcessPool used by the CAS_Manager.
 """
 from analyzer.analyzer import *
 from ingester.ingester import *
 from orm.repository import *
+from jobqueue import * # durable queue of the work on repositories
+from db import initWorkerProcess # database engine of the worker processes
+from config import config, reloadConfig
+from deadline import * # deadlines of jobs
 import calendar # to convert datetime to unix time
 from caslogging import logging
 from queue import *
 import threading
 import time
-from monthdelta import MonthDelta
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# stage of work -> (function doing it, status of repositories waiting for it, next stage)
+STAGES = {
+	"fetch": (fetch, "In Queue to be Ingested", "ingest"),
+	"ingest": (ingest, "Ingesting", "link"),
+	"link": (analyze, "In Queue to be Analyzed", "diff"),
+	"diff": (diff, "Analyzing", "model"),
+	"model": (buildModel, "In Queue to Build Model", None)
+}
+STAGE_ORDER = ["fetch", "ingest", "link", "diff", "model"]
+
+def runJob(job_id, repo_id, stage, attempt, lease_seconds, max_attempts, backoff_seconds, deadline_seconds=0):
+	"""
+	Does a claimed job, renewing its lease while it runs, and once it is done queues the next stage
+	of its repository. A failed job, or one running past its deadline, is retried with backoff.
+	Runs in the worker threads and processes.
+
+	The lease of a job is renewed until it returns, so it is never reaped (and run again) while it
+	still runs. Past its deadline, the commands it runs are killed; a worker process is terminated
+	altogether, while a worker thread, which cannot be, is failed as timed out once it returns.
+	"""
+	func, waiting_status, next_stage = STAGES[stage]
+
+	def terminate():
+		logging.error("Job " + str(job_id) + " (" + stage + " of repo " + repo_id + ") ran past its deadline, terminating its worker process")
+		failJob(job_id, attempt, max_attempts, backoff_seconds)
+		os._exit(1)
+
+	in_worker_process = multiprocessing.parent_process() is not None
+	heartbeat = LeaseHeartbeat(job_id, attempt, lease_seconds, deadline_seconds,
+		terminate if in_worker_process else None)
+	heartbeat.start()
+
+	try:
+		# the commands run by the job are killed once the deadline is reached
+		with Deadline(deadline_seconds):
+			func(repo_id)
+	except Exception as e:
+		if isinstance(e, DeadlineExceeded) or heartbeat.timedOut():
+			logging.error("Job " + str(job_id) + " (" + stage + " of repo " + repo_id + ") timed out: " + str(e))
+		failJob(job_id, attempt, max_attempts, backoff_seconds)
+		raise
+	finally:
+		heartbeat.stop()
+
+	if heartbeat.timedOut():
+		logging.warning("Job " + str(job_id) + " (" + stage + " of repo " + repo_id + ") finished past its deadline")
+
+	if next_stage is None:
+		completeJob(job_id, attempt)
+	else:
+		completeJob(job_id, attempt, next_stage, STAGES[next_stage][1])
 
 class CAS_Manager(threading.Thread):
 	""" 
-	Thread that continiously checks if there is work to be done and adds it to
-	the thread pool work queue
+	Thread that continiously checks if there is work to be done, queues it in the jobs table
+	and claims queued jobs for its worker pools. Any number of managers can share the jobs table.
 	"""
 
 	def __init__(self):
 		"""Constructor"""
 		threading.Thread.__init__(self)
+
+		# set whenever a worker finishes a job, so the next stage is claimed right away
+		self.wakeup = threading.Event()
+
+		# each stage has its own pool, so that i.e. fetching from the network does not wait on linking.
+		# Stages run in worker threads, or in worker processes (to use more than one core) with the
+		# "processes" executor. Models are always built in worker processes by default.
+		processes = config['system'].get('executor', 'threads') == "processes"
+		start_method = config['system'].get('start_method', 'spawn')
+		stages_config = config.get('stages', {})
+		self.pools = {}
+		for stage in STAGE_ORDER:
+			if stages_config.get(stage, {}).get('processes', processes or stage == "model"):
+				self.pools[stage] = ProcessPool(1, self.wakeup.set, start_method)
+			else:
+				self.pools[stage] = ThreadPool(1, self.wakeup.set)
+
+		self.configure()
+
+		# jobs queued by any manager are announced by the database - polling is only a fallback
+		if config.get('jobs', {}).get('listen', True):
+			self.listener = JobListener(self.wakeup.set)
+			self.listener.start()
+		else:
+			self.listener = None
+
+	def configure(self):
+		"""
+		Reads the settings of the manager and its pools from the configuration. Called again whenever
+		config.json changes, so they can be changed without a restart.
+		"""
 		numOfWorkers = int(config['system']['workers'])
-		self.workQueue = ThreadPool(numOfWorkers)
-		self.modelQueue = Queue()
+		numOfModelWorkers = int(config['system'].get('model_workers', 2))
+		stages_config = config.get('stages', {})
+
+		# pools are resized between min_workers and max_workers from their load, see scalePools
+		self.min_workers = {}
+		self.max_workers = {}
+		self.max_waiting = {}
+		self.deadlines = {}
+		for stage in STAGE_ORDER:
+			stage_config = stages_config.get(stage, {})
+			workers = int(stage_config.get('workers', numOfModelWorkers if stage == "model" else numOfWorkers))
+			self.min_workers[stage] = int(stage_config.get('min_workers', workers))
+			self.max_workers[stage] = max(self.min_workers[stage], int(stage_config.get('max_workers', workers)))
+
+			size = self.pools[stage].size()
+			self.pools[stage].resize(min(max(size, self.min_workers[stage]), self.max_workers[stage]),
+				self.max_workers[stage])
+
+			# jobs of the previous stage are not claimed while this many jobs wait for this stage, 0 for no bound
+			self.max_waiting[stage] = int(stage_config.get('max_waiting', 0))
+
+			# seconds a job of the stage may run, 0 for no limit
+			self.deadlines[stage] = int(stage_config.get('deadline', 0))
+
+		# pools do not grow while the load average per cpu is above this or less memory is available
+		self.max_load = float(config['system'].get('max_load_per_cpu', 1.5))
+		self.min_free_memory = int(config['system'].get('min_free_memory_mb', 512))
+
+		jobs_config = config.get('jobs', {})
+		self.lease_seconds = int(jobs_config.get('lease_seconds', 300))
+		self.max_attempts = int(jobs_config.get('max_attempts', 5))
+		self.retry_backoff = int(jobs_config.get('retry_backoff', 60))
+		self.aging = float(jobs_config.get('aging', 1.0))
+		self.max_per_owner = int(jobs_config.get('max_per_owner', 0))
+		self.owner_weights = jobs_config.get('owner_weights', {})
+		if jobs_config.get('listen', True):
+			self.poll_interval = float(jobs_config.get('poll_interval', 60))
+		else:
+			self.poll_interval = float(jobs_config.get('poll_interval', 10))
+
+	def _freeMemory(self):
+		"""Available memory in MB, or None if it cannot be known"""
+		try:
+			with open("/proc/meminfo") as meminfo:
+				for line in meminfo:
+					if line.startswith("MemAvailable:"):
+						return int(line.split()[1]) // 1024
+		except (IOError, OSError):
+			pass
+		return None
+
+	def scalePools(self, waiting):
+		"""
+		Resizes the pool of each stage to its running and waiting jobs, between its min_workers and
+		max_workers. Pools do not grow while the machine is loaded or short on memory, and idle
+		workers are retired when there is less work.
+		@param waiting	number of queued jobs of each stage
+		"""
+		load = os.getloadavg()[0] / multiprocessing.cpu_count() if hasattr(os, "getloadavg") else 0
+		free_memory = self._freeMemory()
+		can_grow = load < self.max_load and (free_memory is None or free_memory > self.min_free_memory)
+
+		for stage in STAGE_ORDER:
+			pool = self.pools[stage]
+			size = pool.size()
+			wanted = min(max(pool.busy() + waiting.get(stage, 0), self.min_workers[stage]), self.max_workers[stage])
+
+			if wanted > size and not can_grow:
+				continue
+			if wanted != size:
+				logging.info("Resizing the " + stage + " pool from " + str(size) + " to " + str(wanted) + " workers")
+				pool.resize(wanted)
+
+	def queueRepos(self, session, repos, stage):
+		"""Queues a stage of work for each repository that has no job yet"""
+		for repo in repos:
+			if enqueueJob(session, repo.id, stage):
+				logging.info("Queued repo " + repo.id + " for stage " + stage)
+				repo.status = STAGES[stage][1]
+		session.commit() # update the status of repos along with their jobs
 
 	def checkIngestion(self):
 		"""Check if any repo needs to be ingested"""
@@ -44,32 +212,19 @@ class CAS_Manager(threading.Thread):
 								(Repository.status != "Analyzing"))
 							.all())
 
-		for repo in repos_to_get:
-			logging.info("Adding repo " + repo.id + " to work queue for ingesting")
-			repo.status = "In Queue to be Ingested"
-			session.commit() # update the status of repo
-			self.workQueue.add_task(ingest,repo.id)
-
+		self.queueRepos(session, repos_to_get, "fetch")
 		session.close()
 
 	def checkAnalyzation(self):
 		"""Checks if any repo needs to be analyzed"""
 
 		session = Session()
-		repo_update_freq = int(config['repoUpdates']['freqInDays'])
-		refresh_date = str(datetime.utcnow() - timedelta(days=repo_update_freq))
-
 		repos_to_get = (session.query(Repository)
 						  .filter( (Repository.status == "Waiting to be Analyzed") )
 						  .all()
 						)
-		
-		for repo in repos_to_get:
-			logging.info("Adding repo " + repo.id + " to work queue for analyzing.")
-			repo.status = "In Queue to be Analyzed"
-			session.commit() # update the status of repo
-			self.workQueue.add_task(analyze, repo.id)
 
+		self.queueRepos(session, repos_to_get, "link")
 		session.close()
 
 	def checkModel(self):
@@ -81,146 +236,267 @@ class CAS_Manager(threading.Thread):
 								(Repository.status == "In Queue to Build Model") )
 							.all())
 
-		for repo in repos_to_get:
-			logging.info("Adding repo " + repo.id + " to model queue to finish analyzing")
-			repo.status = "Building Model"
-			session.commit() # update status of repo
-			self.modelQueue.put(repo.id)
-
+		self.queueRepos(session, repos_to_get, "model")
 		session.close()
 
-	def checkBuildModel(self):
-		""" Checks if any repo is awaiting to build model. 
-			We are using a queue because we can't concurrently access R """
-
+	def checkOrphans(self):
+		"""
+		Queues again the repositories left in the middle of a stage without a job, i.e. by a manager
+		that stopped before jobs were leased
+		"""
 		session = Session()
+		for stage, statuses in [("fetch", ["In Queue to be Ingested", "Ingesting"]),
+								("link", ["In Queue to be Analyzed", "Analyzing"]),
+								("model", ["Building Model"])]:
+			repos_to_get = (session.query(Repository)
+								.filter( Repository.status.in_(statuses) &
+									~session.query(Job).filter( (Job.repo == Repository.id) & Job.state.in_(ACTIVE_STATES) ).exists() )
+								.all())
+			self.queueRepos(session, repos_to_get, stage)
+		session.close()
 
-		if self.modelQueue.empty() != True:
-			repo_id = self.modelQueue.get()
-			repo = (session.query(Repository).filter(Repository.id == repo_id).first())
-
-			# use data only up to X months prior we won't have sufficent data to build models
-			# as there may be bugs introduced in those months that haven't been fixed, skewing
-			# our model.
-			glm_model_time =  int(config['glm_modeling']['months']) 
-			data_months_datetime = datetime.utcnow() - MonthDelta(glm_model_time)
-			data_months_unixtime = calendar.timegm(data_months_datetime.utctimetuple())
-		
-			# all commits for repo prior to current time - glm model time
-			training_commits = (session.query(Commit)
-						.filter( 
-							( Commit.repository_id == repo_id ) &
-							( Commit.author_date_unix_timestamp < int(data_months_unixtime))
-						)
-						.order_by( Commit.author_date_unix_timestamp.desc() )
-						.all())
-
-			# all commits for repo after or on current time - glm model time
-			testing_commits = (session.query(Commit)
-						.filter(
-							( Commit.repository_id == repo_id ) &
-							( Commit.author_date_unix_timestamp >= int(data_months_unixtime)))
-						.all())
-	
-			try: 
-				metrics_generator = MetricsGenerator(repo_id, training_commits, testing_commits)
-				metrics_generator.buildAllModels()
-
-				# montly data dump - or rather, every 30 days.
-				dump_refresh_date = str(datetime.utcnow() - timedelta(days=30))
-				if repo.last_data_dump == None or repo.last_data_dump < dump_refresh_date:
-					logging.info("Generating a monthly data dump for repository: " + repo_id)
-
-					# Get all commits for the repository
-					all_commits = (session.query(Commit)
-						.filter( 
-							( Commit.repository_id == repo_id )
-						)
-						.order_by( Commit.author_date_unix_timestamp.desc() )
-						.all())
-
-					metrics_generator.dumpData(all_commits)
-					repo.last_data_dump = str(datetime.now().replace(microsecond=0))
-					
-				# Notify user if repo has never been analyzed previously
-				if repo.analysis_date is None:
-					self.notify(repo)
-	
-				logging.info("Repo " + repo_id + " finished analyzing.")
-				repo.analysis_date = str(datetime.now().replace(microsecond=0))
-				repo.status = "Analyzed"
-				session.commit() # update status of repo
-				session.close()
-
-			# uh-oh
-			except Exception as e:
-				logging.exception("Got an exception building model for repository " + repo_id)
-
-				repo.status = "Error"
-				session.commit() # update repo status
-				session.close()
-
-	def notify(self, repo):
-		""" Send e-mail notifications if applicable to a repo 
-			used by checkBuildModel """
-
-		notify = False
-		notifier = None
-		logging.info("Notifying subscribed users for repository " + repo.id)
+	def reapJobs(self):
+		"""Queues again the jobs of workers that died or hung, on any node"""
+		session = Session()
+		reapExpiredJobs(session, self.max_attempts, self.retry_backoff)
+		session.close()
 
-		# Create the Notifier
-		gmail_user = config['gmail']['user']
-		gmail_pass = config['gmail']['pass']
-		notifier = Notifier(gmail_user, gmail_pass, repo.name)
+	def reportQueueDepth(self):
+		"""Logs how busy the pool of each stage is and how many jobs wait for it, on all nodes"""
+		session = Session()
+		waiting = queuedJobCounts(session)
+		session.close()
 
-		# Add subscribers if applicable
-		if repo.email is not None:
-			notifier.addSubscribers([repo.email, gmail_user])
-		else:
-			notifier.addSubscribers([gmail_user])
+		for stage in STAGE_ORDER:
+			pool = self.pools[stage]
+			logging.info("Stage " + stage + ": " + str(pool.busy()) + "/" + str(pool.size()) + " workers busy, " +
+				str(waiting.get(stage, 0)) + " jobs waiting")
+
+	def dispatchJobs(self):
+		"""
+		Claims as many queued jobs of each stage as its pool has idle workers, and hands them to the pool.
+		A stage is not claimed from while too many jobs wait for the next one, so that work does not pile up
+		in front of a slower stage. The manager never waits on a job.
+		"""
+		session = Session()
+		waiting = queuedJobCounts(session)
+		self.scalePools(waiting)
+
+		for stage in STAGE_ORDER:
+			pool = self.pools[stage]
+			next_stage = STAGES[stage][2]
+			if next_stage is not None and 0 < self.max_waiting[next_stage] <= waiting.get(next_stage, 0):
+				continue
+
+			jobs = claimJobs(session, [stage], pool.capacity(), self.lease_seconds, self.aging,
+				self.max_per_owner, self.owner_weights)
+
+			if stage == "model" and len(jobs) > 0:
+				(session.query(Repository).filter(Repository.id.in_([job.repo for job in jobs]))
+					.update({"status": "Building Model"}, synchronize_session=False))
+				session.commit() # update status of repos
+
+			for job in jobs:
+				logging.info("Adding repo " + job.repo + " to the " + stage + " pool, expected to take " +
+					str(int(job.expected_cost or 0)) + "s")
+				if not pool.add_task(runJob, job.id, job.repo, job.stage, job.attempts, self.lease_seconds,
+						self.max_attempts, self.retry_backoff, self.deadlines[stage]):
+					releaseJob(job.id, job.attempts)
 
-		notifier.notify()
+		session.close()
 
 	def run(self):
 
+		next_check = 0
 		while(True):
-			### --- Check repository table if there is any work to be done ---  ###
-			self.checkIngestion()
-			self.checkAnalyzation()
-			self.checkModel()
-			self.checkBuildModel()
-			time.sleep(10)
+			self.wakeup.clear()
+
+			try:
+				### --- Check repository table if there is any work to be queued ---  ###
+				if time.time() >= next_check:
+					if reloadConfig():
+						logging.info("Configuration changed, reconfiguring the CAS Manager")
+						self.configure()
+
+					self.checkIngestion()
+					self.checkAnalyzation()
+					self.checkModel()
+					self.checkOrphans()
+					self.reapJobs()
+					self.reportQueueDepth()
+					next_check = time.time() + self.poll_interval
+
+				### --- Claim queued jobs for the idle workers --- ###
+				self.dispatchJobs()
+
+			except Exception:
+				# i.e. the database is unavailable for a moment: the manager, and the recovery of
+				# orphaned and expired jobs with it, must keep going, so try again on the next round
+				logging.exception("CAS Manager round failed, trying again in " + str(self.poll_interval) + "s")
+				next_check = max(next_check, time.time() + self.poll_interval)
+
+			# until a job is queued, a worker is done, or it is time to check again
+			self.wakeup.wait(max(0, next_check - time.time()))
 
 class Worker(threading.Thread):
-	"""Thread executing tasks from a given tasks queue"""
-	def __init__(self, tasks):
+	"""Thread executing tasks from the tasks queue of its pool, until the pool shrinks"""
+	def __init__(self, pool):
 		threading.Thread.__init__(self)
-		self.tasks = tasks
+		self.pool = pool
 		self.daemon = True
 		self.start()
 	
 	def run(self):
 
-		while True:
+		while not self.pool._retire():
+
+			try:
+				func, args, kargs = self.pool.tasks.get(timeout=1)
+			except Empty:
+				continue
 
-			func, args, kargs = self.tasks.get()
 			try:
 				func(*args, **kargs)
 			except Exception as e:
 				print(e)
 
-			self.tasks.task_done()
+			self.pool.tasks.task_done()
+			if self.pool.on_task_done is not None:
+				self.pool.on_task_done()
 
 class ThreadPool:
-	"""Pool of threads consuming tasks from a queue"""
-	def __init__(self, num_threads):
-		self.tasks = Queue(num_threads)
-		for _ in range(num_threads): Worker(self.tasks)
+	"""Pool of threads consuming tasks from a queue, which can be resized at any time"""
+	def __init__(self, num_threads, on_task_done=None):
+		self.num_threads = 0
+		self.num_workers = 0 # threads running, more than num_threads until the extra ones retire
+		self.on_task_done = on_task_done
+		self.lock = threading.Lock()
+		self.tasks = Queue()
+		self.resize(num_threads)
+
+	def resize(self, num_threads, max_threads=None):
+		"""Starts threads, or lets the extra ones retire once they are done with their task"""
+		with self.lock:
+			self.num_threads = num_threads
+			new_workers = max(0, num_threads - self.num_workers)
+			self.num_workers += new_workers
+		for _ in range(new_workers): Worker(self)
+
+	def _retire(self):
+		"""Called by a worker between tasks; true if it should stop"""
+		with self.lock:
+			if self.num_workers > self.num_threads:
+				self.num_workers -= 1
+				return True
+			return False
 
 	def add_task(self, func, *args, **kargs):
-		"""Add a task to the queue"""
-		self.tasks.put((func, args, kargs))
+		"""Add a task to the queue, without blocking. Returns false if all threads are busy"""
+		if self.capacity() <= 0:
+			return False
+		self.tasks.put_nowait((func, args, kargs))
+		return True
+
+	def size(self):
+		"""Number of threads"""
+		return self.num_threads
+
+	def busy(self):
+		"""Number of tasks added and not done yet"""
+		return self.tasks.unfinished_tasks
+
+	def capacity(self):
+		"""Number of tasks that can be added before all threads are busy"""
+		return max(0, self.num_threads - self.busy())
 
 	def wait_completion(self):
 		"""Wait for completion of all the tasks in the queue"""
 		self.tasks.join()
+
+class ProcessPool:
+	"""
+	Pool of worker processes consuming tasks. Processes are started with the "spawn" or "forkserver"
+	start method, never forked from the manager and its threads, and each one creates its own
+	database engine. Adding a task never blocks.
+
+	Starting a process re-imports the workers' code, so the processes are not replaced whenever the
+	pool is resized: they belong to one executor of up to max_processes, started as tasks come in, and
+	the size of the pool only bounds how many tasks it takes at once. The executor is only replaced
+	when max_processes itself changes.
+	"""
+	def __init__(self, num_processes, on_task_done=None, start_method="spawn", max_processes=None):
+		self.num_processes = num_processes
+		self.max_processes = max(num_processes, max_processes or num_processes)
+		self.on_task_done = on_task_done
+		self.pending = set()
+		self.lock = threading.Lock()
+
+		self.context = multiprocessing.get_context(start_method)
+		if start_method == "forkserver":
+			# processes are forked from a server that has imported the workers' code once
+			self.context.set_forkserver_preload(["cas_manager"])
+
+		self.executor = None # created with the first task
+
+	def _getExecutor(self):
+		if self.executor is None:
+			self.executor = ProcessPoolExecutor(max_workers=self.max_processes, mp_context=self.context,
+				initializer=initWorkerProcess)
+		return self.executor
+
+	def resize(self, num_processes, max_processes=None):
+		"""
+		Sets how many tasks the pool runs at once. A new max_processes replaces the executor, whose
+		tasks already added finish in the processes of the previous one.
+		"""
+		if max_processes is not None and max_processes != self.max_processes:
+			self.max_processes = max_processes
+			if self.executor is not None:
+				self.executor.shutdown(wait=False)
+				self.executor = None
+		self.num_processes = min(num_processes, self.max_processes)
+
+	def add_task(self, func, *args, **kargs):
+		"""Add a task to the pool, without blocking"""
+		try:
+			future = self._getExecutor().submit(func, *args, **kargs)
+		except BrokenProcessPool:
+			# a worker process died abruptly - start over with fresh processes
+			logging.error("Worker process pool is broken, restarting it")
+			self.executor = None
+			future = self._getExecutor().submit(func, *args, **kargs)
+
+		with self.lock:
+			self.pending.add(future)
+		future.add_done_callback(self._taskDone)
+		return True
+
+	def _taskDone(self, future):
+		with self.lock:
+			self.pending.discard(future)
+
+		if not future.cancelled() and future.exception() is not None:
+			# the traceback of the worker process is chained to the exception
+			logging.error("Task failed in a worker process", exc_info=future.exception())
+
+		if self.on_task_done is not None:
+			self.on_task_done()
+
+	def size(self):
+		"""Number of processes"""
+		return self.num_processes
+
+	def busy(self):
+		"""Number of tasks added and not done yet"""
+		with self.lock:
+			return len(self.pending)
+
+	def capacity(self):
+		"""Number of tasks that can be added before all processes are busy"""
+		return max(0, self.num_processes - self.busy())
+
+	def wait_completion(self):
+		"""Wait for completion of all the tasks in the pool"""
+		with self.lock:
+			pending = list(self.pending)
+		wait(pending)
@@ -5,5 +5,35 @@ date: November 2013
 description: Reads the config.json info into a varible
 """
 import json
+import os
 #from StringIO import StringIO
-config = json.load(open('./config.json'))
\ No newline at end of file
+
+CONFIG_FILE = './config.json'
+
+config = json.load(open(CONFIG_FILE))
+config_mtime = os.path.getmtime(CONFIG_FILE)
+
+def reloadConfig():
+    """
+    Reads config.json again if it was modified since it was last read. The config dictionary is
+    updated in place, so every module sees the new values. A file that cannot be parsed (i.e. while
+    it is being edited) is ignored until it is modified again.
+    @return true if the configuration changed
+    """
+    global config_mtime
+
+    mtime = os.path.getmtime(CONFIG_FILE)
+    if mtime == config_mtime:
+        return False
+    config_mtime = mtime
+
+    try:
+        new_config = json.load(open(CONFIG_FILE))
+    except ValueError:
+        return False
+
+    for key in list(config.keys()):
+        if key not in new_config:
+            del config[key]
+    config.update(new_config)
+    return True
\ No newline at end of file
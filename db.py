@@ -10,13 +10,31 @@ from sqlalchemy import *
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+def createEngine(pool_size):
+    """
+    createEngine(): Integer -> Engine
+    description: creates an engine to the configured database, holding at most pool_size connections
+    """
+    return sqlalchemy.create_engine(config['db']['type'] + '+' +
+                                    config['db']['adapter'] + '://' + 
+                                    config['db']['username'] + ':' +
+                                    config['db']['password'] + '@' +
+                                    config['db']['host'] + ':' +
+                                    config['db']['port'] + '/' +
+                                    config['db']['database'], pool_size=pool_size, max_overflow=0)
+
 Session = sessionmaker()
-engine = sqlalchemy.create_engine(config['db']['type'] + '+' +
-                                  config['db']['adapter'] + '://' + 
-                                  config['db']['username'] + ':' +
-                                  config['db']['password'] + '@' +
-                                  config['db']['host'] + ':' +
-                                  config['db']['port'] + '/' +
-                                  config['db']['database'], pool_size=100, max_overflow=0) # the value of pool_size has to be less than the max_connections to postgres.
+engine = createEngine(int(config['db'].get('pool_size', 100))) # the value of pool_size has to be less than the max_connections to postgres.
 Session.configure(bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+def initWorkerProcess():
+    """
+    initWorkerProcess(): NoneType -> NoneType
+    description: gives a worker process an engine of its own, with a smaller pool (the pools of all
+        processes together have to stay below the max_connections to postgres). Connections of the
+        engine inherited from a forked parent are left alone, as they belong to the parent.
+    """
+    global engine
+    engine = createEngine(int(config['db'].get('worker_pool_size', 5)))
+    Session.configure(bind=engine)
\ No newline at end of file
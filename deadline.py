@@ -0,0 +1,107 @@
+"""
+file: deadline.py
+description: Deadlines of the jobs run by the workers, and running commands (i.e. git) under them.
+			 A command that runs past its timeout, or past the deadline of the job running it, is
+			 killed along with every process it started and DeadlineExceeded is raised, so that the
+			 worker is freed and the job is retried.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from config import config
+
+class DeadlineExceeded(Exception):
+	"""Raised when a command or a job runs past its time limit"""
+	pass
+
+# deadline of the job running in the current thread
+_current = threading.local()
+
+class Deadline:
+	"""
+	Context in which the commands run by the current thread must finish within seconds (no limit if
+	seconds is 0 or None).
+	"""
+
+	def __init__(self, seconds):
+		self.seconds = seconds
+
+	def __enter__(self):
+		self.previous = getattr(_current, "expires", None)
+		_current.expires = time.time() + self.seconds if self.seconds else None
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		_current.expires = self.previous
+		return False
+
+def remainingTime():
+	"""
+	@return the seconds left before the deadline of the current thread, or None if it has none
+	"""
+	expires = getattr(_current, "expires", None)
+	if expires is None:
+		return None
+	return expires - time.time()
+
+def _timeout(timeout):
+	"""
+	the seconds a command may run: its own timeout (by default system.command_timeout), but no
+	longer than the deadline of the current thread
+	"""
+	if timeout is None:
+		timeout = config['system'].get('command_timeout')
+
+	remaining = remainingTime()
+	if remaining is not None:
+		if remaining <= 0:
+			raise DeadlineExceeded("Deadline of the job exceeded")
+		timeout = remaining if timeout is None else min(timeout, remaining)
+
+	return timeout
+
+def _killTree(process):
+	"""
+	kills a command and every process it started, which all are in its own process group
+	"""
+	try:
+		os.killpg(process.pid, signal.SIGKILL)
+	except OSError:
+		pass # already exited
+	process.communicate()
+
+def _run(args, timeout, stdout, kwargs):
+	timeout = _timeout(timeout)
+
+	# in a session of its own, so that its whole process tree can be killed
+	process = subprocess.Popen(args, stdout=stdout, start_new_session=True, **kwargs)
+	try:
+		output, _ = process.communicate(timeout=timeout)
+	except subprocess.TimeoutExpired:
+		_killTree(process)
+		raise DeadlineExceeded("Killed after " + str(round(timeout, 1)) + "s: " + str(args))
+	except BaseException:
+		_killTree(process)
+		raise
+
+	return process.returncode, output
+
+def checkOutput(args, timeout=None, **kwargs):
+	"""
+	Same as subprocess.check_output, but the command is killed, along with its children, once it runs
+	past timeout or the deadline of the current thread.
+	"""
+	returncode, output = _run(args, timeout, subprocess.PIPE, kwargs)
+	if returncode != 0:
+		raise subprocess.CalledProcessError(returncode, args, output=output)
+	return output
+
+def call(args, timeout=None, **kwargs):
+	"""
+	Same as subprocess.call, but the command is killed, along with its children, once it runs
+	past timeout or the deadline of the current thread.
+	"""
+	returncode, output = _run(args, timeout, None, kwargs)
+	return returncode
@@ -4,6 +4,9 @@ import re
 import json
 import logging
 import math                               # Required for the math.log function
+import shutil
+from deadline import *                    # runs git commands under the deadline of their job
+from config import config
 from orm.commit import *
 from ingester.commitFile import *         # Represents a file
 from classifier.classifier import *       # Used for classifying each commit
@@ -447,7 +450,15 @@ class Git():
 
 
     def diff(self,repoId):
-        repo_dir = os.chdir(os.path.dirname(__file__) + self.REPO_DIRECTORY + repoId)
+        """
+        diff(repoId): String -> NoneType
+        description: parses the diff information of the commits of the repository not diffed yet. Commits
+            are marked as diffed in batches of stages.diff.batch_size, each in its own transaction, so an
+            interrupted diff resumes from the first commit of its last batch.
+        """
+        batch_size = int(config.get('stages', {}).get('diff', {}).get('batch_size', 500))
+        # no os.chdir - other stages run git in other threads at the same time
+        repo_dir = os.path.dirname(__file__) + self.REPO_DIRECTORY + repoId
         diff_dir = os.path.dirname(__file__)+ self.DIFF_DIRECTORY + repoId
 
         # check the directory exist or not
@@ -456,33 +467,51 @@ class Git():
         else:
             pass
 
-        # get commit hash
+        # get commit hash, a batch at a time: only the commits of the batch are loaded, and the
+        # commits diffed by an interrupted run are not loaded again
         session = Session()
-        commits = (session.query(Commit).filter((Commit.repository_id==repoId)&(Commit.diffed==False))
-                   .order_by( Commit.author_date_unix_timestamp.desc()).all())
+        failed = [] # commits that could not be diffed stay not diffed, but are not retried in this run
+        num_diffed = 0
 
         # diff
         logging.info('Starting get/parsing diff information.')
-        for commit in commits:
-            try:
-                diff_info = (subprocess.check_output(self.DIFF_CMD.format(commit.commit_hash, commit.commit_hash),\
-                                                 shell=True, cwd=repo_dir)).decode('utf-8','replace')
+        while True:
+            commits = session.query(Commit).filter((Commit.repository_id==repoId)&(Commit.diffed==False))
+            if len(failed) > 0:
+                commits = commits.filter(~Commit.commit_hash.in_(failed))
+            commits = commits.order_by( Commit.author_date_unix_timestamp.desc()).limit(batch_size).all()
 
-                self.parsingDiff(diff_info,  commit)
-                commit.diffed = True
-            except:
+            if len(commits) == 0:
+                break
+
+            for commit in commits:
                 try:
-                    diff_info = (subprocess.check_output(self.DIFF_CMD_INIT.format(commit.commit_hash), \
-                                                         shell=True, cwd=repo_dir)).decode('utf-8', 'replace')
+                    diff_info = (checkOutput(self.DIFF_CMD.format(commit.commit_hash, commit.commit_hash),\
+                                                     shell=True, cwd=repo_dir)).decode('utf-8','replace')
 
-                    self.parsingDiff(diff_info, commit)
+                    self.parsingDiff(diff_info,  commit)
                     commit.diffed = True
-                    #session.commit()  # update diffed
-                except Exception as e:
-                    logging.info(e)
-                    continue
-        # the initial commit
-        session.commit()
+                except DeadlineExceeded:
+                    raise
+                except:
+                    try:
+                        diff_info = (checkOutput(self.DIFF_CMD_INIT.format(commit.commit_hash), \
+                                                             shell=True, cwd=repo_dir)).decode('utf-8', 'replace')
+
+                        self.parsingDiff(diff_info, commit)
+                        commit.diffed = True
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        logging.info(e)
+                        failed.append(commit.commit_hash)
+                        continue
+                num_diffed += 1
+
+            # checkpoint the commits diffed so far
+            session.commit()
+            logging.info('Diffed ' + str(num_diffed) + ' commits of repo ' + repoId)
+
         session.close()
         logging.info('Done getting/parsing diff informations.')
 
@@ -494,7 +523,7 @@ class Git():
             ingestion date
         description: a very basic abstraction for using git in python.
         """
-        repo_dir = os.chdir(os.path.dirname(__file__) + self.REPO_DIRECTORY + repo.id)
+        repo_dir = os.path.dirname(__file__) + self.REPO_DIRECTORY + repo.id
         logging.info('Getting/parsing git commits: '+ str(repo) )
         # Spawn a git process and convert the output to a string
         if not firstSync and repo.ingestion_date is not None:
@@ -502,7 +531,7 @@ class Git():
         else:
             cmd = 'git log '
 
-        log = str( subprocess.check_output(cmd + self.LOG_FORMAT, shell=True, cwd = repo_dir ) )
+        log = str( checkOutput(cmd + self.LOG_FORMAT, shell=True, cwd = repo_dir ) )
         log = log[2:-1]   # Remove head/end clutter
 
         # List of json objects
@@ -606,15 +635,20 @@ class Git():
         arguments: repo Repository: the repository to clone
         pre-conditions: The repo has not been already created
         """
-        repo_dir = os.chdir(os.path.dirname(__file__) + self.REPO_DIRECTORY)
+        repo_dir = os.path.dirname(__file__) + self.REPO_DIRECTORY
 
         # Run the clone command and return the results
 
         logging.info('Git cloning repo: '+ str(repo) )
-        cloneResult = str(subprocess.check_output(
-                  self.CLONE_CMD.format(repo.url, './' + repo.id),
-                  shell= True,
-                  cwd = repo_dir ) )
+        try:
+            cloneResult = str(checkOutput(
+                      self.CLONE_CMD.format(repo.url, './' + repo.id),
+                      shell= True,
+                      cwd = repo_dir ) )
+        except DeadlineExceeded:
+            # remove the partial clone, or the next attempt would pull into it
+            shutil.rmtree(repo_dir + repo.id, ignore_errors=True)
+            raise
         logging.info('Done cloning.')
         #logging.debug("Git clone result:\n" + cloneResult)
 
@@ -634,12 +668,12 @@ class Git():
         repo_dir = os.path.dirname(__file__) + self.REPO_DIRECTORY + repo.id
 
         # Weird sceneario where something in repo gets modified - reset all changes before pulling
-        subprocess.call(self.RESET_CMD, shell=True, cwd= repo_dir)
-        subprocess.call(self.CLEAN_CMD, shell=True, cwd= repo_dir)
+        call(self.RESET_CMD, shell=True, cwd= repo_dir)
+        call(self.CLEAN_CMD, shell=True, cwd= repo_dir)
 
         # Run the pull command and return the results
         logging.info('Pulling latest changes from repo: '+ str(repo) )
-        fetchResult = str(subprocess.check_output(
+        fetchResult = str(checkOutput(
                   self.RESET_CMD + "\n" + self.PULL_CMD ,
                   shell=True,
                   cwd=  repo_dir  ) )
@@ -13,9 +13,33 @@ from orm.repository import *
 from orm.metrics import *
 from ingester.localrepository import *
 
+def fetchRepo(repository_to_fetch, session):
+  """
+  Clones a given repository, or pulls its latest changes
+  @param repository_to_fetch    The repository to fetch
+  @param session 				The SQLAlchemy session
+  @private
+  """
+  logging.info( 'A worker is starting to fetch repository: ' +
+                      repository_to_fetch.id )
+
+  # Update status of repo to show it is ingesting
+  repository_to_fetch.status = "Ingesting"
+  session.commit()
+
+  local_repo = LocalRepository(repository_to_fetch)
+  local_repo.syncRepoFiles()
+  repository_to_fetch.fetch_date = local_repo.start_date
+  session.commit()
+
+  logging.info( 'A worker finished fetching repo ' +
+                  repository_to_fetch.id )
+
+  session.close()
+
 def ingestRepo(repository_to_ingest, session):
   """
-  Ingests a given repository
+  Ingests the commits of a given repository, fetched by fetchRepo
   @param repository_to_ingest   The repository to inspect
   @param session 				The SQLAlchemy session
   @private
@@ -28,8 +52,10 @@ def ingestRepo(repository_to_ingest, session):
   session.commit()
 
   local_repo = LocalRepository(repository_to_ingest)
-  local_repo.sync()
-  session.merge(repository_to_ingest) 
+  local_repo.syncCommits(repository_to_ingest.ingestion_date is None)
+
+  # Set the date to when it was fetched, as later commits are not in the local clone yet
+  repository_to_ingest.ingestion_date = repository_to_ingest.fetch_date
   repository_to_ingest.status = "Waiting to be Analyzed" # update status
   session.commit() 
 
@@ -38,6 +64,26 @@ def ingestRepo(repository_to_ingest, session):
 
   session.close()
 
+def fetch(repo_id):
+  """
+  Fetch a repository with the given id. Gets the repository information
+  from the repository table and fetches it using fetchRepo method
+  @param repo_id   The repository id to fetch.
+  """
+  session = Session()
+  repo_to_fetch = (session.query(Repository)
+        .filter (Repository.id == repo_id)
+        .all()
+        )
+
+  # Verify that repo exists
+  if len(repo_to_fetch) == 1:
+    fetchRepo(repo_to_fetch[0], session)
+  else:
+    logging.info('Repo with id ' + repo_id + ' not found!')
+
+  session.close()
+
 def ingest(repo_id):
   """
   Ingest a repository with the given id. Gets the repository information
@@ -0,0 +1,114 @@
+"""
+file: jobcost.py
+description: Estimates how long a job will take, so that short jobs (i.e. incremental updates) can be
+			 run before long ones (i.e. the first ingestion of a huge repository). A job's cost is its
+			 amount of work, in units depending on its stage, times the seconds per unit its stage took
+			 in previous runs: for the same repository if it has any, else for all repositories.
+"""
+import os
+import subprocess
+from orm.job import *
+from orm.commit import *
+from orm.repository import *
+from ingester.git import Git
+from analyzer.lrucache import LRUCache
+from deadline import checkOutput, DeadlineExceeded
+from caslogging import logging
+
+REPO_DIRECTORY = os.path.dirname(__file__) + "/ingester" + Git.REPO_DIRECTORY
+
+# a first clone is counted as this many pulls
+FIRST_CLONE_UNITS = 20
+
+# seconds per unit of work of each stage, until there is history to learn it from
+DEFAULT_SECONDS_PER_UNIT = {
+	"fetch": 30,      # per pull
+	"ingest": 0.05,   # per new commit in the local clone
+	"link": 2,        # per unlinked corrective commit
+	"diff": 0.05,     # per commit not diffed yet
+	"model": 0.001    # per commit
+}
+
+# number of previous runs the seconds per unit are learnt from
+HISTORY_SIZE = 10
+
+# seconds counting the commits of a clone may take before the count is given up (as 0)
+COUNT_TIMEOUT = 10
+
+# commits to ingest of each repository, by its ingestion and fetch dates: the count only changes
+# once the repository is fetched or ingested again, so it is not recomputed by every enqueue
+_commit_counts = LRUCache(1024)
+
+def _countCommits(repo):
+	"""
+	number of commits of the local clone of the repository that have not been ingested yet
+	"""
+	key = (repo.id, repo.ingestion_date, repo.fetch_date)
+	count = _commit_counts.get(key)
+	if count is not None:
+		return count
+
+	command = ["git", "rev-list", "--count", "HEAD"]
+	if repo.ingestion_date is not None:
+		command.insert(2, "--since=" + repo.ingestion_date)
+
+	# killed along with its children if it hangs, as git commands of the workers are
+	try:
+		count = int(checkOutput(command, timeout=COUNT_TIMEOUT, cwd=REPO_DIRECTORY + repo.id, stderr=subprocess.DEVNULL))
+	except (subprocess.SubprocessError, DeadlineExceeded, OSError, ValueError):
+		return 0
+
+	_commit_counts.put(key, count)
+	return count
+
+def workUnits(session, repo_id, stage):
+	"""
+	returns the amount of work of a stage for a repository, in the units of the stage
+	"""
+	if stage == "fetch":
+		return 1 if os.path.isdir(REPO_DIRECTORY + repo_id) else FIRST_CLONE_UNITS
+
+	elif stage == "ingest":
+		repo = session.query(Repository).filter(Repository.id == repo_id).first()
+		return 1 + (_countCommits(repo) if repo is not None else 0)
+
+	commits = session.query(func.count(Commit.commit_hash)).filter(Commit.repository_id == repo_id)
+	if stage == "link":
+		commits = commits.filter( (Commit.fix == "True") & (Commit.linked == False) )
+	elif stage == "diff":
+		commits = commits.filter(Commit.diffed == False)
+	return 1 + commits.scalar()
+
+def _secondsPerUnit(session, stage, repo_id=None):
+	"""
+	seconds per unit of work of the last runs of a stage, for a repository or for all of them,
+	or None if there are none
+	"""
+	runs = (session.query(Job.start_date.label("start_date"), Job.finish_date.label("finish_date"),
+			Job.work_units.label("work_units"))
+		.filter( (Job.stage == stage) & (Job.state == "done") & (Job.start_date != None) & (Job.work_units > 0) ))
+	if repo_id is not None:
+		runs = runs.filter(Job.repo == repo_id)
+	runs = runs.order_by(Job.finish_date.desc()).limit(HISTORY_SIZE).subquery()
+
+	seconds, units = session.query(
+		func.sum(func.extract("epoch", runs.c.finish_date - runs.c.start_date)),
+		func.sum(runs.c.work_units)).one()
+
+	if seconds is None or not units:
+		return None
+	return float(seconds) / float(units)
+
+def estimateJobCost(session, repo_id, stage):
+	"""
+	returns the amount of work of a stage for a repository and how many seconds it is expected to take
+	"""
+	units = workUnits(session, repo_id, stage)
+
+	seconds_per_unit = _secondsPerUnit(session, stage, repo_id)
+	if seconds_per_unit is None:
+		seconds_per_unit = _secondsPerUnit(session, stage)
+	if seconds_per_unit is None:
+		seconds_per_unit = DEFAULT_SECONDS_PER_UNIT[stage]
+
+	return units, units * seconds_per_unit
@@ -0,0 +1,363 @@
+"""
+file: jobqueue.py
+description: Durable queue of the work to be done on repositories, kept in the jobs table. Jobs are
+			 claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of CAS managers, on any
+			 number of nodes, can pull work from it without ever processing a job twice. Queuing a job
+			 notifies the listening managers, so that it is claimed as soon as its transaction commits.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from orm.job import *
+from orm.repository import *
+from jobcost import * # expected cost of jobs
+from caslogging import logging
+from config import config
+
+# after the star imports, which bring in sqlalchemy's own insert and select
+import select as _select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+ACTIVE_STATES = ("queued", "running")
+
+JOBS_CHANNEL = "cas_jobs" # notified with the stage of each queued job
+
+def enqueueJob(session, repo_id, stage):
+	"""
+	Queues a stage of work for a repository, unless the repository already has a job waiting or
+	running. Does not commit, so that the job is queued in the same transaction as the caller's changes.
+	@return true if the job was queued
+	"""
+	active_job = session.query(Job.id).filter( (Job.repo == repo_id) & Job.state.in_(ACTIVE_STATES) ).first()
+	if active_job is not None:
+		return False
+
+	work_units, expected_cost = estimateJobCost(session, repo_id, stage)
+
+	# another manager may have queued a job for the repository in the meantime
+	statement = (pg_insert(Job.__table__)
+		.values(repo=repo_id, stage=stage, state="queued", attempts=0, creation_date=datetime.utcnow(),
+			work_units=work_units, expected_cost=expected_cost)
+		.on_conflict_do_nothing(index_elements=["repo"], index_where=Job.state.in_(ACTIVE_STATES)))
+
+	if session.execute(statement).rowcount == 0:
+		return False
+
+	# delivered to the listeners when the transaction commits, and not at all if it is rolled back
+	session.execute(text("SELECT pg_notify(:channel, :stage)"), {"channel": JOBS_CHANNEL, "stage": stage})
+	return True
+
+def claimJobs(session, stages, limit, lease_seconds, aging=1.0, max_per_owner=0, owner_weights=None):
+	"""
+	Claims up to limit of the queued jobs of the given stages that are not backing off.
+
+	Jobs are shared fairly between the owners (e-mail) of their repositories: they are handed out
+	round-robin, to the owner with the fewest running jobs (divided by its weight in owner_weights,
+	1 by default) first, and no more than max_per_owner jobs of an owner run at once (0 for no limit).
+	The jobs of an owner are claimed the ones expected to be the shortest first. Every second a job
+	waits takes aging seconds off its expected cost, so long jobs are not starved by a stream of
+	short ones.
+
+	Rows locked by other claimers are skipped rather than waited on. The claimed jobs are leased to
+	the caller for lease_seconds; the lease must be renewed (see LeaseHeartbeat) for longer jobs.
+	@return the claimed jobs, detached from the session
+	"""
+	if limit <= 0:
+		return []
+
+	now = datetime.utcnow()
+	owner = func.coalesce(Repository.email, "")
+
+	# expected cost - aging * (now - creation date), without the term common to all jobs
+	priority = func.coalesce(Job.expected_cost, 0) + aging * func.extract("epoch", Job.creation_date)
+
+	# the limit best jobs of each owner
+	ranked = (session.query(Job.id.label("id"), owner.label("owner"), priority.label("priority"),
+			func.row_number().over(partition_by=owner, order_by=priority).label("owner_rank"))
+		.outerjoin(Repository, Repository.id == Job.repo)
+		.filter( (Job.state == "queued") & (Job.stage.in_(stages)) &
+			((Job.run_after == None) | (Job.run_after <= now)) )
+		.subquery())
+	candidates = (session.query(ranked.c.id, ranked.c.owner)
+		.filter(ranked.c.owner_rank <= limit)
+		.order_by(ranked.c.priority.asc())
+		.all())
+
+	running = dict(session.query(owner, func.count(Job.id))
+		.outerjoin(Repository, Repository.id == Job.repo)
+		.filter(Job.state == "running")
+		.group_by(owner)
+		.all())
+
+	order = _fairShareOrder(candidates, running, max_per_owner, owner_weights or {})
+
+	# lock the jobs in that order, skipping those claimed by others in the meantime
+	jobs = []
+	next_job = 0
+	while len(jobs) < limit and next_job < len(order):
+		batch = order[next_job:next_job + limit - len(jobs)]
+		next_job += len(batch)
+		locked = (session.query(Job)
+			.filter( Job.id.in_(batch) & (Job.state == "queued") )
+			.with_for_update(skip_locked=True)
+			.all())
+		jobs += sorted(locked, key=lambda job: batch.index(job.id))
+
+	lease_until = now + timedelta(seconds=lease_seconds)
+	for job in jobs:
+		job.state = "running"
+		job.attempts = (job.attempts or 0) + 1
+		job.lease_until = lease_until
+		job.start_date = now
+
+	# detached before committing, as the commit would expire them and they could not be loaded again
+	session.flush()
+	for job in jobs:
+		session.expunge(job)
+	session.commit()
+	return jobs
+
+def _fairShareOrder(candidates, running, max_per_owner, owner_weights):
+	"""
+	Orders the candidate jobs, given as (job id, owner) by priority, round-robin between owners
+	@param running	number of running jobs of each owner
+	@return the job ids, without the jobs of owners that reached max_per_owner
+	"""
+	position = {}
+	queues = {}
+	for index, (job_id, owner) in enumerate(candidates):
+		position[job_id] = index
+		queues.setdefault(owner, []).append(job_id)
+
+	load = dict((owner, running.get(owner, 0)) for owner in queues)
+	order = []
+	while True:
+		eligible = [owner for owner in queues
+			if len(queues[owner]) > 0 and (max_per_owner <= 0 or load[owner] < max_per_owner)]
+		if len(eligible) == 0:
+			return order
+
+		# least loaded owner, the one with the highest priority job on ties
+		owner = min(eligible, key=lambda owner:
+			(load[owner] / float(owner_weights.get(owner, 1)), position[queues[owner][0]]))
+		order.append(queues[owner].pop(0))
+		load[owner] += 1
+
+def releaseJob(job_id, attempt):
+	"""
+	Gives a claimed job that could not be started back to the queue, as if it had not been claimed
+	"""
+	session = Session()
+	(session.query(Job)
+		.filter( (Job.id == job_id) & (Job.attempts == attempt) & (Job.state == "running") )
+		.update({"state": "queued", "attempts": attempt - 1, "lease_until": None}, synchronize_session=False))
+	session.commit()
+	session.close()
+
+def queuedJobCounts(session):
+	"""
+	@return the number of queued jobs of each stage
+	"""
+	counts = (session.query(Job.stage, func.count(Job.id))
+		.filter(Job.state == "queued")
+		.group_by(Job.stage)
+		.all())
+	return dict(counts)
+
+def _runningJob(session, job_id, attempt):
+	"""
+	returns the job if it is still running the given attempt, locked for update. A worker whose lease
+	expired and whose job was queued again (or claimed by another worker) gets None.
+	"""
+	return (session.query(Job)
+		.filter( (Job.id == job_id) & (Job.attempts == attempt) & (Job.state == "running") )
+		.with_for_update()
+		.first())
+
+def renewLease(job_id, attempt, lease_seconds):
+	"""
+	Extends the lease of a running job
+	@return false if the job is not leased to this attempt anymore
+	"""
+	session = Session()
+	renewed = (session.query(Job)
+		.filter( (Job.id == job_id) & (Job.attempts == attempt) & (Job.state == "running") )
+		.update({"lease_until": datetime.utcnow() + timedelta(seconds=lease_seconds)}, synchronize_session=False))
+	session.commit()
+	session.close()
+	return renewed > 0
+
+def completeJob(job_id, attempt, next_stage=None, next_status=None):
+	"""
+	Marks a job as done and, in the same transaction, queues the next stage of its repository.
+	@param next_status	status shown for the repository while the next stage waits
+	"""
+	session = Session()
+	job = _runningJob(session, job_id, attempt)
+	if job is None:
+		logging.warning("Job " + str(job_id) + " finished after losing its lease, discarding its completion")
+		session.close()
+		return
+
+	job.state = "done"
+	job.lease_until = None
+	job.finish_date = datetime.utcnow()
+	session.flush() # the repository has no active job anymore
+
+	if next_stage is not None and enqueueJob(session, job.repo, next_stage) and next_status is not None:
+		session.query(Repository).filter(Repository.id == job.repo).update({"status": next_status}, synchronize_session=False)
+
+	session.commit()
+	session.close()
+
+def _retryOrFail(session, job, max_attempts, backoff_seconds):
+	"""
+	Queues a job again, after a delay doubling with each attempt, or marks it as failed (and its
+	repository as in error) once it has been attempted max_attempts times. Does not commit.
+	"""
+	job.lease_until = None
+
+	if job.attempts >= max_attempts:
+		logging.error("Job " + str(job.id) + " (" + job.stage + " of repo " + job.repo + ") failed " + str(job.attempts) + " times, giving up")
+		job.state = "failed"
+		job.finish_date = datetime.utcnow()
+		session.query(Repository).filter(Repository.id == job.repo).update({"status": "Error"}, synchronize_session=False)
+	else:
+		delay = backoff_seconds * 2 ** (job.attempts - 1)
+		logging.info("Retrying job " + str(job.id) + " (" + job.stage + " of repo " + job.repo + ") in " + str(delay) + "s")
+		job.state = "queued"
+		job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+
+def failJob(job_id, attempt, max_attempts, backoff_seconds):
+	"""
+	Records that an attempt of a job failed; it is retried with backoff up to max_attempts times
+	"""
+	session = Session()
+	job = _runningJob(session, job_id, attempt)
+	if job is not None:
+		_retryOrFail(session, job, max_attempts, backoff_seconds)
+		session.commit()
+	session.close()
+
+def reapExpiredJobs(session, max_attempts, backoff_seconds):
+	"""
+	Queues again (with backoff, up to max_attempts attempts) the running jobs whose lease expired:
+	their worker, process or node died or hung without renewing it.
+	@return the number of expired jobs
+	"""
+	jobs = (session.query(Job)
+		.filter( (Job.state == "running") & (Job.lease_until < datetime.utcnow()) )
+		.with_for_update(skip_locked=True)
+		.all())
+
+	for job in jobs:
+		logging.warning("Lease of job " + str(job.id) + " (" + job.stage + " of repo " + job.repo + ") expired")
+		_retryOrFail(session, job, max_attempts, backoff_seconds)
+
+	session.commit()
+	return len(jobs)
+
+class LeaseHeartbeat(threading.Thread):
+	"""
+	Thread renewing the lease of a running job a few times per lease period, until stopped. The lease
+	is renewed for as long as the job runs, even past its deadline, so that a job still running is
+	never reaped and run twice: once the deadline passes, on_deadline (if given) is called instead,
+	i.e. to terminate the worker process running the job.
+	"""
+
+	def __init__(self, job_id, attempt, lease_seconds, deadline_seconds=0, on_deadline=None):
+		threading.Thread.__init__(self)
+		self.job_id = job_id
+		self.attempt = attempt
+		self.lease_seconds = lease_seconds
+		self.deadline = time.time() + deadline_seconds if deadline_seconds else None
+		self.on_deadline = on_deadline
+		self.stopped = threading.Event()
+		self.daemon = True
+
+	def timedOut(self):
+		"""true if the job has run past its deadline"""
+		return self.deadline is not None and time.time() > self.deadline
+
+	def run(self):
+		deadline_passed = False
+		while not self.stopped.wait(self._interval()):
+			if not deadline_passed and self.timedOut():
+				deadline_passed = True
+				logging.warning("Job " + str(self.job_id) + " is past its deadline")
+				if self.on_deadline is not None:
+					self.on_deadline()
+
+			try:
+				if not renewLease(self.job_id, self.attempt, self.lease_seconds):
+					logging.warning("Job " + str(self.job_id) + " lost its lease, it may be run again elsewhere")
+					return
+			except Exception:
+				logging.exception("Could not renew the lease of job " + str(self.job_id))
+
+	def _interval(self):
+		"""seconds until the next renewal, or until the deadline if it comes first"""
+		interval = self.lease_seconds / 3.0
+		if self.deadline is not None and time.time() < self.deadline:
+			interval = min(interval, self.deadline - time.time())
+		return max(0, interval)
+
+	def stop(self):
+		self.stopped.set()
+
+class JobListener(threading.Thread):
+	"""
+	Thread listening on its own database connection for the notifications of queued jobs, and calling
+	on_notify for each of them. Reconnects if the connection is lost.
+	"""
+
+	def __init__(self, on_notify, reconnect_delay=5):
+		threading.Thread.__init__(self)
+		self.on_notify = on_notify
+		self.reconnect_delay = reconnect_delay
+		self.daemon = True
+
+	def run(self):
+		while True:
+			try:
+				self._listen()
+			except Exception:
+				logging.exception("Lost the job notification connection, reconnecting")
+
+			time.sleep(self.reconnect_delay)
+			self.on_notify() # jobs may have been queued while not listening
+
+	def _listen(self):
+		"""
+		listens until the connection fails. The connection is opened with the driver of the db adapter,
+		outside of the SQLAlchemy pool, as notifications are only delivered outside of transactions.
+		"""
+		db_config = config['db']
+
+		if db_config['adapter'] == "psycopg2":
+			import psycopg2
+			connection = psycopg2.connect(host=db_config['host'], port=db_config['port'], user=db_config['username'],
+				password=db_config['password'], dbname=db_config['database'])
+			connection.autocommit = True
+			try:
+				connection.cursor().execute("LISTEN " + JOBS_CHANNEL)
+				while True:
+					_select.select([connection], [], [], 60)
+					connection.poll()
+					if len(connection.notifies) > 0:
+						del connection.notifies[:]
+						self.on_notify()
+			finally:
+				connection.close()
+
+		else:
+			import postgresql
+			connection = postgresql.open(host=db_config['host'], port=int(db_config['port']), user=db_config['username'],
+				password=db_config['password'], database=db_config['database'])
+			try:
+				connection.listen(JOBS_CHANNEL)
+				for notification in connection.iternotifies(60):
+					if notification is not None: # None when the timeout elapsed
+						self.on_notify()
+			finally:
+				connection.close()
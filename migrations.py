@@ -0,0 +1,136 @@
+"""
+file: migrations.py
+description: Versioned migrations of the database schema, so that existing databases are upgraded
+			 in place. create_all only creates the tables that are missing, so every column or index
+			 added to an existing table must also be added here as a new migration, at the end of
+			 MIGRATIONS. Migrations are applied in order, each in its own transaction, and the ones
+			 applied are recorded in the schema_version table. Their statements must be idempotent
+			 (i.e. IF NOT EXISTS), since a new database already has everything create_all made.
+"""
+from db import *
+from orm.commit import *
+from orm.repository import *
+from orm.metrics import *
+from orm.glmcoefficients import *
+from orm.feedback import *
+from orm.user import *
+from orm.job import *
+from orm.schemaversion import *
+from caslogging import logging
+
+# key of the advisory lock that keeps two processes from migrating at once
+MIGRATION_LOCK = 5270801
+
+def _addColumns(session, table, columns):
+	"""
+	adds the columns, given as (name, type) tuples, that the table does not have yet
+	"""
+	for name, type in columns:
+		session.execute(text("ALTER TABLE " + table + " ADD COLUMN IF NOT EXISTS " + name + " " + type))
+
+def _trainingFingerprints(session):
+	# skipping model rebuilds when the training data is unchanged
+	_addColumns(session, "metrics", [
+		("training_fingerprint", "VARCHAR")
+	])
+	_addColumns(session, "glm_coefficients", [
+		("training_fingerprint", "VARCHAR")
+	])
+
+def _incrementalModels(session):
+	# warm starts and incremental updates of the glm models
+	_addColumns(session, "glm_coefficients", [
+		("training_max_timestamp", "FLOAT"),
+		("information", "VARCHAR"),
+		("incremental_updates", "INTEGER")
+	])
+
+def _trainingSamples(session):
+	# stratified sampling of the training sets
+	_addColumns(session, "glm_coefficients", [
+		("sample_size", "INTEGER"),
+		("sample_seed", "INTEGER")
+	])
+
+def _fetchDate(session):
+	# fetch and ingest run as separate stages
+	_addColumns(session, "repositories", [
+		("fetch_date", "VARCHAR")
+	])
+
+def _commitIndexes(session):
+	# same indexes as declared by the Commit ORM
+	session.execute(text("CREATE INDEX IF NOT EXISTS commits_repository_time "
+		"ON commits (repository_id, author_date_unix_timestamp)"))
+	session.execute(text("CREATE INDEX IF NOT EXISTS commits_unlinked_fixes "
+		"ON commits (repository_id, author_date_unix_timestamp) WHERE fix = 'True' AND NOT linked"))
+	session.execute(text("CREATE INDEX IF NOT EXISTS commits_not_diffed "
+		"ON commits (repository_id, author_date_unix_timestamp) WHERE NOT diffed"))
+	session.execute(text("CREATE INDEX IF NOT EXISTS commits_repository_risk "
+		"ON commits (repository_id, glm_probability)"))
+
+	# so that the planner knows how selective the new indexes are
+	session.execute(text("ANALYZE commits"))
+
+# (version, description, function applying it to a session), one per change to the schema of an
+# existing table, in the order the changes were made
+MIGRATIONS = [
+	(1, "Training fingerprints of the models", _trainingFingerprints),
+	(2, "Warm starts and incremental updates of the glm models", _incrementalModels),
+	(3, "Training samples of the glm models", _trainingSamples),
+	(4, "Fetch date of the repositories", _fetchDate),
+	(5, "Indexes of the commits by repository, time, link and diff state and risk", _commitIndexes)
+]
+
+def _lock(session):
+	"""
+	keeps other processes from migrating until the transaction of the session ends
+	"""
+	session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK})
+
+def schemaVersion(session):
+	"""
+	@return the version of the last migration applied to the database, 0 if none (or if the database
+	has never been migrated, and has no schema_version table yet)
+	"""
+	if session.execute(text("SELECT to_regclass('schema_version')")).scalar() is None:
+		return 0
+	return session.query(func.max(SchemaVersion.version)).scalar() or 0
+
+def pendingMigrations(session):
+	"""
+	@return the migrations that have not been applied to the database yet
+	"""
+	version = schemaVersion(session)
+	return [migration for migration in MIGRATIONS if migration[0] > version]
+
+def migrate():
+	"""
+	Creates the missing tables and applies the migrations the database does not have yet.
+	Building the indexes of a large commits table locks it against writes for a while, so the
+	managers should be stopped while migrating.
+	"""
+	session = Session()
+	try:
+		_lock(session)
+		Base.metadata.create_all(bind=session.connection())
+		session.commit()
+
+		for version, description, apply in MIGRATIONS:
+			# another process may have been migrating, so check again once it is done
+			_lock(session)
+			if version <= schemaVersion(session):
+				session.commit()
+				continue
+
+			logging.info("Migrating the database to version " + str(version) + ": " + description)
+			apply(session)
+			session.add(SchemaVersion({"version": version, "description": description}))
+			session.commit()
+
+		logging.info("Database schema is at version " + str(schemaVersion(session)))
+	except:
+		session.rollback()
+		raise
+	finally:
+		session.close()
@@ -51,6 +51,20 @@ class Commit(Base):
     # Many-to-One Relation to repositories table
     repository_id = Column(String)
 
+    # existing databases get these from migrations.py, which must create them the same way
+    __table_args__ = (
+        # the commits of a repository, in time order (analysis, metrics and model building)
+        Index('commits_repository_time', 'repository_id', 'author_date_unix_timestamp'),
+        # the corrective commits left to link
+        Index('commits_unlinked_fixes', 'repository_id', 'author_date_unix_timestamp',
+            postgresql_where=text("fix = 'True' AND NOT linked")),
+        # the commits left to diff
+        Index('commits_not_diffed', 'repository_id', 'author_date_unix_timestamp',
+            postgresql_where=text("NOT diffed")),
+        # the riskiest commits of a repository
+        Index('commits_repository_risk', 'repository_id', 'glm_probability'),
+    )
+
     def __init__(self, commitDict):
         """
         __init__(): Dictonary -> NoneType
@@ -54,6 +54,20 @@ class GlmCoefficients(Base):
     sexp = Column(Float, unique=False, default=0)
     sexp_sig = Column(Float)
 
+    # fingerprint of the training data the model was built from
+    training_fingerprint = Column(String)
+
+    # author time of the most recent training commit, the fisher information matrix of the model
+    # (JSON) and how many incremental updates were made since the last full build
+    training_max_timestamp = Column(Float)
+    information = Column(String)
+    incremental_updates = Column(Integer, default=0)
+
+    # number of training commits and seed of the stratified sample the model was trained on,
+    # null when it was trained on all of them
+    sample_size = Column(Integer)
+    sample_seed = Column(Integer)
+
     def __init__(self, glmCoefficientsDict):
         """
         __init__(): Dictonary -> NoneType
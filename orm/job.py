@@ -0,0 +1,50 @@
+"""
+file: job.py
+description: Holds the job abstraction class and ORM. A job is a stage of work (fetch, ingest, link,
+diff or build the models) to be done on a repository, claimed by one worker at a time.
+"""
+from db import *
+from datetime import datetime
+
+class Job(Base):
+    """
+    Job():
+    description: The SQLAlchemy ORM for the jobs table
+    """
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    repo = Column(String, nullable=False)
+    stage = Column(String, nullable=False)    # fetch, ingest, link, diff or model
+    state = Column(String, nullable=False)    # queued, running, done or failed
+    attempts = Column(Integer, default=0)
+    lease_until = Column(DateTime)            # a running job belongs to its worker until then
+    run_after = Column(DateTime)              # a job queued again is not claimed before then
+
+    work_units = Column(Float)                # amount of work, in units depending on the stage
+    expected_cost = Column(Float)             # seconds the job is expected to take
+
+    creation_date = Column(DateTime, default=datetime.utcnow)
+    start_date = Column(DateTime)             # when the last attempt was claimed
+    finish_date = Column(DateTime)
+
+    __table_args__ = (
+        # a repository has at most one job waiting or running, so no stage is ever done twice at once
+        Index('jobs_active_repo', 'repo', unique=True,
+            postgresql_where=text("state IN ('queued', 'running')")),
+        # jobs are claimed by stage
+        Index('jobs_queued', 'stage', 'creation_date',
+            postgresql_where=text("state = 'queued'")),
+        # the last runs of a stage tell how long its next jobs take
+        Index('jobs_history', 'stage', 'repo', 'finish_date',
+            postgresql_where=text("state = 'done'")),
+    )
+
+    def __init__(self, jobDict):
+        """
+        __init__(): Dictonary -> NoneType
+        """
+        self.__dict__.update(jobDict)
+
+    def __repr__(self):
+        return "<Job %s: %s %s - %s>" % (self.id, self.stage, self.repo, self.state)
@@ -68,6 +68,9 @@ class Metrics(Base):
     sexpnonbuggy = Column(Float, unique=False, default=0)
     sexp_sig = Column(Float)
 
+    # fingerprint of the training data the model was built from
+    training_fingerprint = Column(String)
+
     def __init__(self, metricDict):
         """
         __init__(): Dictonary -> NoneType
@@ -21,6 +21,7 @@ class Repository(Base):
 
     creation_date = Column(String)
     ingestion_date = Column(String)
+    fetch_date = Column(String) # when the local clone was last fetched, to be ingested
     analysis_date = Column(String)
     status = Column(String)
     email = Column(String)
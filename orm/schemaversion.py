@@ -0,0 +1,27 @@
+"""
+file: schemaversion.py
+description: Holds the schema version abstraction class and ORM. Each row is a migration (see
+migrations.py) that has been applied to the database.
+"""
+from db import *
+from datetime import datetime
+
+class SchemaVersion(Base):
+    """
+    SchemaVersion():
+    description: The SQLAlchemy ORM for the schema_version table
+    """
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied_date = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, versionDict):
+        """
+        __init__(): Dictonary -> NoneType
+        """
+        self.__dict__.update(versionDict)
+
+    def __repr__(self):
+        return "<SchemaVersion %s: %s>" % (self.version, self.description)
@@ -0,0 +1,175 @@
+"""
+file: riskservice.py
+description: Scores the risk of changes that have not gone through the ingestion pipeline, using the
+stored glm model of their repository. Can be used from the command line or as an HTTP service.
+
+usage:
+  python riskservice.py score <repo_id> --diff <file, or - for stdin> [--author <name>]
+  python riskservice.py score <repo_id> --range <A..B> [--author <name>]
+  python riskservice.py serve [--host <address>] [--port <port>]
+
+HTTP:
+  POST /score?repo=<repo_id>&author=<name>   with the diff as the request body
+  GET  /score?repo=<repo_id>&range=<A..B>
+  GET  /top?repo=<repo_id>&limit=<n>         riskiest stored commits of a repository
+  GET  /commit?repo=<repo_id>&hash=<hash>    stored risk of a commit
+  GET  /summary?repo=<repo_id>               stored metrics and model of a repository
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from analyzer.riskscorer import *
+from analyzer.riskreader import *
+from config import config
+
+def createScorer():
+	""" creates the scorer from the risk_service configuration """
+	service_config = config.get('risk_service', {})
+	return RiskScorer(int(service_config.get('cache_size', 64)), int(service_config.get('ttl', 600)))
+
+def createReader():
+	""" creates the cached reader of stored results from the risk_service configuration """
+	service_config = config.get('risk_service', {})
+	return RiskReader(int(service_config.get('read_cache_size', 1024)), int(service_config.get('read_ttl', 300)))
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	""" HTTP server handling each request in its own thread """
+	daemon_threads = True
+
+class RiskRequestHandler(BaseHTTPRequestHandler):
+	""" Handles the requests of the scoring and read service """
+
+	scorer = None
+	reader = None
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		params = parse_qs(url.query)
+
+		if url.path in ("/top", "/commit", "/summary"):
+			self._read(url.path, params)
+			return
+
+		if url.path != "/score" or "repo" not in params or "range" not in params:
+			self._respond(400, {"error": "expected /score?repo=<repo_id>&range=<A..B>"})
+			return
+
+		author = params["author"][0] if "author" in params else None
+		self._handle(lambda: self.scorer.scoreRange(params["repo"][0], params["range"][0], author), "scoring a change")
+
+	def do_POST(self):
+		url = urlparse(self.path)
+		params = parse_qs(url.query)
+
+		if url.path != "/score" or "repo" not in params:
+			self._respond(400, {"error": "expected /score?repo=<repo_id> with a diff as the body"})
+			return
+
+		length = int(self.headers.get("Content-Length", 0))
+		diff = self.rfile.read(length).decode("utf-8", "replace")
+		author = params["author"][0] if "author" in params else None
+		self._handle(lambda: self.scorer.scoreDiff(params["repo"][0], diff, author), "scoring a change")
+
+	def _read(self, path, params):
+		""" serves the stored results of a repository from the reader's cache """
+		if "repo" not in params:
+			self._respond(400, {"error": "expected repo=<repo_id>"})
+			return
+
+		repo_id = params["repo"][0]
+		if path == "/top":
+			read = lambda: self.reader.topRiskyCommits(repo_id, self._limit(params))
+		elif path == "/commit" and "hash" in params:
+			read = lambda: self.reader.commitRisk(repo_id, params["hash"][0])
+		elif path == "/summary":
+			read = lambda: self.reader.repositorySummary(repo_id)
+		else:
+			self._respond(400, {"error": "expected hash=<commit hash>"})
+			return
+
+		self._handle(read, "reading the stored results of repository " + repo_id)
+
+	def _limit(self, params):
+		""" the number of commits asked for, 10 by default """
+		try:
+			limit = int(params.get("limit", ["10"])[0])
+		except ValueError:
+			raise InvalidRequest("limit must be a positive integer")
+		if limit < 1:
+			raise InvalidRequest("limit must be a positive integer")
+		return limit
+
+	def _handle(self, produce, action):
+		"""
+		responds with the result of produce, 404 if there is none (or the repository is unknown), 400 if
+		the request is invalid and 500 if it fails otherwise (i.e. the database is unavailable)
+		"""
+		try:
+			result = produce()
+		except InvalidRequest as e:
+			self._respond(400, {"error": str(e)})
+			return
+		except ValueError as e:
+			self._respond(404, {"error": str(e)})
+			return
+		except Exception as e:
+			logging.exception("Got an exception " + action)
+			self._respond(500, {"error": str(e)})
+			return
+
+		if result is None:
+			self._respond(404, {"error": "not found"})
+		else:
+			self._respond(200, result)
+
+	def _respond(self, status, body):
+		content = json.dumps(body).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, format, *args):
+		logging.info("Risk service: " + format % args)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Scores the risk of unseen changes")
+	subparsers = parser.add_subparsers(dest="command")
+
+	score_parser = subparsers.add_parser("score", help="score a diff or a commit range")
+	score_parser.add_argument("repo_id")
+	score_parser.add_argument("--diff", help="file holding the diff, - for stdin")
+	score_parser.add_argument("--range", help="commit range of the local clone, i.e. A..B")
+	score_parser.add_argument("--author")
+
+	serve_parser = subparsers.add_parser("serve", help="start the HTTP scoring service")
+	serve_parser.add_argument("--host", default=config.get('risk_service', {}).get('host', '127.0.0.1'),
+		help="address to listen on, local only by default as requests are not authenticated")
+	serve_parser.add_argument("--port", type=int, default=int(config.get('risk_service', {}).get('port', 8090)))
+
+	args = parser.parse_args()
+
+	if args.command == "score":
+		scorer = createScorer()
+		if args.range is not None:
+			result = scorer.scoreRange(args.repo_id, args.range, args.author)
+		elif args.diff is not None:
+			diff = sys.stdin.read() if args.diff == "-" else open(args.diff).read()
+			result = scorer.scoreDiff(args.repo_id, diff, args.author)
+		else:
+			parser.error("one of --diff or --range is required")
+		print(json.dumps(result, indent=2))
+
+	elif args.command == "serve":
+		RiskRequestHandler.scorer = createScorer()
+		RiskRequestHandler.reader = createReader()
+		server = ThreadingHTTPServer((args.host, args.port), RiskRequestHandler)
+		logging.info("Risk service listening on " + args.host + ":" + str(args.port))
+		server.serve_forever()
+
+	else:
+		parser.print_help()
@@ -9,19 +9,30 @@ from analyzer.analyzer import *
 from orm.feedback import * # so that we create the table - used by web
 from orm.user import * # so that we create the table - used by web
 from orm.glmcoefficients import * # so that we create the table - used by web
+from orm.job import * # so that we create the table
+from migrations import *
 
-if len(sys.argv) > 1:
-	arg = sys.argv[1]
-else:
-	arg = ''
+# worker processes re-import this module, so only run when invoked as a script
+if __name__ == "__main__":
 
-if arg == "initDb":
-    # Init the database
-    logging.info('Initializing the Database...')
-    Base.metadata.create_all(engine)
-    logging.info('Done')
+	if len(sys.argv) > 1:
+		arg = sys.argv[1]
+	else:
+		arg = ''
 
-else:
-	logging.info("Starting CAS Manager")
-	cas_manager = CAS_Manager()
-	cas_manager.start()
+	if arg == "initDb" or arg == "migrate":
+		# Init the database, or upgrade an existing one
+		logging.info('Initializing the Database...')
+		migrate()
+		logging.info('Done')
+
+	else:
+		session = Session()
+		pending = len(pendingMigrations(session))
+		session.close()
+		if pending > 0:
+			logging.warning(str(pending) + " database migrations are pending, run `python script.py migrate`")
+
+		logging.info("Starting CAS Manager")
+		cas_manager = CAS_Manager()
+		cas_manager.start()
@@ -0,0 +1,181 @@
+"""
+Tests of the batches in which corrective commits are linked and commits are diffed, against the
+database of config.json, which must be a scratch database (as set up by `python script.py initDb`).
+git itself is replaced, only the checkpointing and resuming is tested.
+"""
+import json
+import os
+import shutil
+import subprocess
+import uuid
+from ingester import git
+from ingester.git import *
+from analyzer.git_commit_linker import *
+
+def _addCommits(repo_id, hashes, fix="False"):
+	"""adds commits of the repository, one second apart, in the order of hashes"""
+	session = Session()
+	for index, commit_hash in enumerate(hashes):
+		session.add(Commit({"commit_hash": commit_hash, "repository_id": repo_id, "fix": fix,
+			"author_date_unix_timestamp": float(index + 1), "linked": False, "diffed": False, "fixes": None}))
+	session.commit()
+	session.close()
+
+def _commits(repo_id):
+	session = Session()
+	commits = dict((commit.commit_hash, commit) for commit in session.query(Commit).filter(Commit.repository_id == repo_id))
+	session.close()
+	return commits
+
+def _cleanUp(repo_id):
+	session = Session()
+	session.query(Commit).filter(Commit.repository_id == repo_id).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+def test_linking_resumes_from_the_interrupted_batch():
+	repo_id = "test-checkpoints-" + str(uuid.uuid4())
+	fixes = [repo_id + "-fix" + str(index) for index in range(5)]
+	buggy = repo_id + "-bug"
+	_addCommits(repo_id, [buggy])
+	_addCommits(repo_id, fixes, fix="True")
+
+	calls = []
+	interrupt = [fixes[3]]
+
+	def linkCorrectiveCommit(commit):
+		calls.append(commit.commit_hash)
+		if commit.commit_hash in interrupt:
+			raise DeadlineExceeded("interrupted")
+		return [buggy]
+
+	linker = GitCommitLinker(repo_id)
+	linker._linkCorrectiveCommit = linkCorrectiveCommit
+	session = Session()
+	try:
+		try:
+			linker.linkCorrectiveCommits(session, batch_size=2)
+			assert False, "expected DeadlineExceeded"
+		except DeadlineExceeded:
+			session.rollback()
+
+		# the first batch was committed, the interrupted one was not
+		commits = _commits(repo_id)
+		assert [fix for fix in fixes if commits[fix].linked] == fixes[:2]
+		assert commits[buggy].contains_bug and json.loads(commits[buggy].fixes) == fixes[:2]
+
+		del calls[:]
+		del interrupt[:]
+		assert linker.linkCorrectiveCommits(session, batch_size=2) == 3
+		assert calls == fixes[2:]
+
+		# the fixes found by every batch are kept
+		commits = _commits(repo_id)
+		assert all(commits[fix].linked for fix in fixes)
+		assert json.loads(commits[buggy].fixes) == fixes
+	finally:
+		session.close()
+		_cleanUp(repo_id)
+
+def test_corrective_commits_that_cannot_be_linked_are_linked_once():
+	repo_id = "test-checkpoints-" + str(uuid.uuid4())
+	fixes = [repo_id + "-fix" + str(index) for index in range(3)]
+	_addCommits(repo_id, fixes, fix="True")
+
+	# not a git repository: the commits have no modified regions
+	linker = GitCommitLinker(repo_id)
+	linker.repo_path = os.path.join(os.path.dirname(__file__), "no-such-repository")
+	session = Session()
+	try:
+		assert linker.linkCorrectiveCommits(session, batch_size=2) == 3
+		assert linker.linkCorrectiveCommits(session, batch_size=2) == 0
+		assert all(commit.linked and not commit.fixes for commit in _commits(repo_id).values())
+	finally:
+		session.close()
+		_cleanUp(repo_id)
+
+class _FakeGit:
+	"""replaces checkOutput in ingester.git: records the commits diffed, and fails for some of them"""
+
+	def __init__(self, failing=(), interrupt=()):
+		self.calls = []
+		self.failing = list(failing)
+		self.interrupt = list(interrupt)
+
+	def checkOutput(self, command, **kwargs):
+		commit_hash = command.split()[2].rstrip("^")
+		self.calls.append(commit_hash)
+		if commit_hash in self.interrupt:
+			raise DeadlineExceeded("interrupted")
+		if commit_hash in self.failing:
+			raise subprocess.CalledProcessError(128, command)
+		return b"diff --git a/file.py b/file.py"
+
+def _diff(repo_id, fake_git, batch_size):
+	"""diffs the repository with git replaced by fake_git, in batches of batch_size"""
+	original_check_output = git.checkOutput
+	original_stages = config.get('stages')
+	diff_dir = os.path.dirname(git.__file__) + Git.DIFF_DIRECTORY + repo_id
+	os.makedirs(diff_dir, exist_ok=True)
+
+	git.checkOutput = fake_git.checkOutput
+	config['stages'] = {"diff": {"batch_size": batch_size}}
+	repository = Git()
+	repository.parsingDiff = lambda diff_info, commit: []
+	try:
+		repository.diff(repo_id)
+	finally:
+		git.checkOutput = original_check_output
+		if original_stages is None:
+			del config['stages']
+		else:
+			config['stages'] = original_stages
+		shutil.rmtree(diff_dir)
+
+def test_diffing_resumes_from_the_interrupted_batch():
+	repo_id = "test-checkpoints-" + str(uuid.uuid4())
+	hashes = [repo_id + "-" + str(index) for index in range(5)]
+	_addCommits(repo_id, hashes)
+	newest_first = hashes[::-1]
+
+	try:
+		fake_git = _FakeGit(interrupt=[newest_first[3]])
+		try:
+			_diff(repo_id, fake_git, 2)
+			assert False, "expected DeadlineExceeded"
+		except DeadlineExceeded:
+			pass
+
+		# the first batch was committed, the interrupted one was not
+		commits = _commits(repo_id)
+		assert [commit_hash for commit_hash in newest_first if commits[commit_hash].diffed] == newest_first[:2]
+
+		fake_git = _FakeGit()
+		_diff(repo_id, fake_git, 2)
+		assert fake_git.calls == newest_first[2:]
+		assert all(commit.diffed for commit in _commits(repo_id).values())
+	finally:
+		_cleanUp(repo_id)
+
+def test_commits_that_cannot_be_diffed_are_tried_once_per_run():
+	repo_id = "test-checkpoints-" + str(uuid.uuid4())
+	hashes = [repo_id + "-" + str(index) for index in range(5)]
+	_addCommits(repo_id, hashes)
+
+	try:
+		# with and without a parent
+		fake_git = _FakeGit(failing=[hashes[1]])
+		_diff(repo_id, fake_git, 2)
+		assert fake_git.calls.count(hashes[1]) == 2
+		assert sorted(fake_git.calls) == sorted(hashes + [hashes[1]])
+
+		commits = _commits(repo_id)
+		assert [commit_hash for commit_hash in hashes if not commits[commit_hash].diffed] == [hashes[1]]
+
+		# it is tried again by the next run
+		fake_git = _FakeGit()
+		_diff(repo_id, fake_git, 2)
+		assert fake_git.calls == [hashes[1]]
+		assert _commits(repo_id)[hashes[1]].diffed
+	finally:
+		_cleanUp(repo_id)
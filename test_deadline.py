@@ -0,0 +1,66 @@
+import os
+import subprocess
+import tempfile
+import time
+from deadline import *
+
+def _isRunning(pid):
+	"""true if the process exists and is not a zombie"""
+	try:
+		with open("/proc/" + str(pid) + "/status") as status:
+			return not any(line.startswith("State:") and "Z" in line for line in status)
+	except (IOError, OSError):
+		return False
+
+def test_commands_run_as_usual():
+	assert checkOutput(["echo", "hello"]) == b"hello\n"
+	assert call(["sh", "-c", "exit 3"]) == 3
+	try:
+		checkOutput(["sh", "-c", "exit 1"])
+		assert False, "expected CalledProcessError"
+	except subprocess.CalledProcessError as e:
+		assert e.returncode == 1
+
+def test_timed_out_command_is_killed_with_its_children():
+	pid_file = os.path.join(tempfile.mkdtemp(), "pid")
+	start = time.time()
+	try:
+		checkOutput(["sh", "-c", "sleep 30 & echo $! > " + pid_file + "; wait"], timeout=0.5)
+		assert False, "expected DeadlineExceeded"
+	except DeadlineExceeded:
+		pass
+
+	assert time.time() - start < 5
+	child = int(open(pid_file).read())
+	deadline = time.time() + 5
+	while _isRunning(child) and time.time() < deadline:
+		time.sleep(0.05)
+	assert not _isRunning(child)
+
+def test_commands_do_not_outlive_the_deadline_of_the_job():
+	assert remainingTime() is None
+
+	with Deadline(0.5):
+		assert 0 < remainingTime() <= 0.5
+		start = time.time()
+		try:
+			call(["sleep", "30"], timeout=60)
+			assert False, "expected DeadlineExceeded"
+		except DeadlineExceeded:
+			pass
+		assert time.time() - start < 5
+
+		# past the deadline, commands are not even started
+		time.sleep(0.1)
+		try:
+			checkOutput(["echo", "too late"])
+			assert False, "expected DeadlineExceeded"
+		except DeadlineExceeded:
+			pass
+
+	assert remainingTime() is None
+
+def test_no_deadline():
+	with Deadline(0):
+		assert remainingTime() is None
+		assert checkOutput(["echo", "ok"]) == b"ok\n"
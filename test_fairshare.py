@@ -0,0 +1,24 @@
+from jobqueue import _fairShareOrder
+
+def test_owners_take_turns():
+	# candidates by priority: alice queued many short jobs before bob's
+	candidates = [(1, "alice"), (2, "alice"), (3, "alice"), (4, "bob"), (5, "alice"), (6, "bob")]
+	assert _fairShareOrder(candidates, {}, 0, {}) == [1, 4, 2, 6, 3, 5]
+
+def test_least_loaded_owner_goes_first():
+	candidates = [(1, "alice"), (2, "bob"), (3, "alice")]
+	assert _fairShareOrder(candidates, {"alice": 2}, 0, {}) == [2, 1, 3]
+
+def test_owners_at_their_limit_are_skipped():
+	candidates = [(1, "alice"), (2, "alice"), (3, "bob"), (4, "alice")]
+	assert _fairShareOrder(candidates, {"alice": 1}, 2, {}) == [3, 1]
+	assert _fairShareOrder(candidates, {"alice": 2, "bob": 2}, 2, {}) == []
+
+def test_weights_share_the_workers_unevenly():
+	candidates = [(job_id, "alice") for job_id in range(1, 7)] + [(job_id, "bob") for job_id in range(7, 13)]
+	order = _fairShareOrder(candidates, {}, 0, {"alice": 2})
+
+	# alice gets two jobs for each of bob's
+	first_six = order[:6]
+	assert len([job_id for job_id in first_six if job_id <= 6]) == 4
+	assert len(order) == 12
@@ -0,0 +1,77 @@
+"""
+Tests of the single pass reading the training and testing commits of a repository, against the
+database of config.json, which must be a scratch database (as set up by `python script.py initDb`).
+"""
+import uuid
+import numpy as np
+from analyzer.metricsgenerator import *
+
+CUTOFF = 1000
+
+def _addCommits(repo_id):
+	"""
+	adds commits on both sides of the cutoff, buggy or not, merges with and without changed lines,
+	and a commit without author time
+	"""
+	rng = np.random.RandomState(7)
+	commits = []
+	for index in range(40):
+		commit = dict((name, float(rng.randint(0, 20))) for name in RepositoryMetrics.metric_names)
+		commit.update({"commit_hash": repo_id + "-" + str(index), "repository_id": repo_id,
+			"author_date_unix_timestamp": float(CUTOFF - 500 + 25 * index), "contains_bug": bool(index % 3 == 0),
+			"classification": "Merge" if index % 5 == 0 else "Feature Addition"})
+		if index % 10 == 0:
+			commit["la"] = 0.0
+			commit["ld"] = 0.0
+		commits.append(commit)
+	commits.append({"commit_hash": repo_id + "-undated", "repository_id": repo_id, "author_date_unix_timestamp": None})
+
+	session = Session()
+	for commit in commits:
+		session.add(Commit(commit))
+	session.commit()
+	session.close()
+
+def _cleanUp(repo_id):
+	session = Session()
+	session.query(Commit).filter(Commit.repository_id == repo_id).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+def test_one_pass_splits_like_the_queries_per_period():
+	repo_id = "test-fetchmetrics-" + str(uuid.uuid4())
+	_addCommits(repo_id)
+	session = Session()
+	try:
+		# the queries of the training and testing commits the single pass replaced
+		training_commits = (session.query(Commit)
+			.filter( (Commit.repository_id == repo_id) & (Commit.author_date_unix_timestamp < CUTOFF) )
+			.order_by( Commit.author_date_unix_timestamp.desc() )
+			.all())
+		testing_commits = (session.query(Commit)
+			.filter( (Commit.repository_id == repo_id) & (Commit.author_date_unix_timestamp >= CUTOFF) )
+			.all())
+
+		# merges without changed lines are not trained on
+		training_commits = [commit for commit in training_commits
+			if not (commit.classification == "Merge" and commit.la == 0 and commit.ld == 0)]
+		assert 0 < len(training_commits) < 20
+
+		metrics_generator = MetricsGenerator(repo_id, CUTOFF)
+		metrics_generator.fetchAllMetrics()
+		metrics = metrics_generator.metrics
+
+		expected = np.array([[getattr(commit, name) for name in RepositoryMetrics.metric_names] for commit in training_commits])
+		assert np.array_equal(metrics.data, expected)
+		assert list(metrics.is_buggy) == [commit.contains_bug == True for commit in training_commits]
+		assert list(metrics.timestamps) == [commit.author_date_unix_timestamp for commit in training_commits]
+
+		# every testing commit is scored, merges included
+		tested = dict((commit.commit_hash, commit) for commit in metrics_generator.testData)
+		assert sorted(tested.keys()) == sorted(commit.commit_hash for commit in testing_commits)
+		for commit in testing_commits:
+			assert all(getattr(tested[commit.commit_hash], name) == getattr(commit, name)
+				for name in RepositoryMetrics.metric_names)
+	finally:
+		session.close()
+		_cleanUp(repo_id)
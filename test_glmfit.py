@@ -0,0 +1,60 @@
+import numpy as np
+from analyzer import glmfit
+from analyzer.glmfit import *
+
+# vs ~ mpg on R's mtcars data set
+mpg = np.array([21.0, 21.0, 22.8, 21.4, 18.7, 18.1, 14.3, 24.4, 22.8, 19.2, 17.8, 16.4, 17.3, 15.2, 10.4, 10.4,
+	14.7, 32.4, 30.4, 33.9, 21.5, 15.5, 15.2, 13.3, 19.2, 27.3, 26.0, 30.4, 15.8, 19.7, 15.0, 21.4])
+vs = np.array([0, 0, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 1], dtype=float)
+
+def test_fit_matches_r():
+	# summary(glm(vs ~ mpg, data=mtcars, family=binomial))
+	fit = fitLogit(mpg[:, None], vs, ["mpg"])
+
+	assert fit.converged
+	assert abs(fit.coefficients["intercept"] - -8.8331) < 1e-4
+	assert abs(fit.coefficients["mpg"] - 0.4304) < 1e-4
+	assert abs(fit.pvalues["intercept"] - 0.00522) < 1e-5
+	assert abs(fit.pvalues["mpg"] - 0.00659) < 1e-5
+	assert abs(fit.deviance - 25.533) < 1e-3
+
+def test_warm_start_gives_the_same_fit():
+	fit = fitLogit(mpg[:, None], vs, ["mpg"])
+	warm = fitLogit(mpg[:, None], vs, ["mpg"], start=[-8.0, 0.4])
+
+	assert warm.iterations < fit.iterations
+	assert abs(warm.coefficients["mpg"] - fit.coefficients["mpg"]) < 1e-6
+
+	# a start that does not converge falls back to the default one
+	diverging = fitLogit(mpg[:, None], vs, ["mpg"], start=[1e6, -1e6], maxit=3)
+	assert diverging is not None
+
+def test_collinear_metrics_cannot_be_fitted():
+	X = np.column_stack([mpg, 2 * mpg])
+	assert fitLogit(X, vs, ["a", "b"]) is None
+	assert fitLogit(np.empty((0, 1)), np.empty(0), ["a"]) is None
+
+def test_cache_fits_each_formula_once():
+	calls = []
+	original = glmfit.fitLogit
+
+	def counting(X, y, terms, start=None):
+		calls.append(tuple(terms))
+		return original(X, y, terms, start)
+
+	glmfit.fitLogit = counting
+	try:
+		X = np.column_stack([mpg, mpg ** 2])
+		data_fingerprint = fingerprint(X, vs)
+		cache = FitCache(2)
+		cache.submit(X, vs, ["a", "b"], ["a"], data_fingerprint)
+		first = cache.get(X, vs, ["a", "b"], ["a"], data_fingerprint)
+		second = cache.get(X, vs, ["a", "b"], ["a"], data_fingerprint)
+		other = cache.get(X, vs, ["a", "b"], ["a"], fingerprint(X, 1 - vs))
+		cache.shutdown()
+	finally:
+		glmfit.fitLogit = original
+
+	assert first is second
+	assert other is not first
+	assert calls == [("a",), ("a",)]
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import tempfile
+from types import SimpleNamespace
+import jobcost
+from jobcost import *
+
+def _clone(num_commits):
+	"""a local repository with num_commits commits, in a directory of clones"""
+	directory = tempfile.mkdtemp() + "/"
+	repo_dir = directory + "repo"
+	os.mkdir(repo_dir)
+	subprocess.check_call(["git", "init", "-q"], cwd=repo_dir)
+	for index in range(num_commits):
+		subprocess.check_call(["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+			"commit", "-q", "--allow-empty", "-m", "commit " + str(index)], cwd=repo_dir)
+	return directory
+
+def test_commits_to_ingest_are_counted_once_per_fetch():
+	directory = _clone(3)
+	previous_directory = jobcost.REPO_DIRECTORY
+	jobcost.REPO_DIRECTORY = directory
+	try:
+		repo = SimpleNamespace(id="repo", ingestion_date=None, fetch_date="2026-01-01 00:00:00")
+		assert jobcost._countCommits(repo) == 3
+
+		# the clone only changes when it is fetched again, so the count is not recomputed until then
+		subprocess.check_call(["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+			"commit", "-q", "--allow-empty", "-m", "new"], cwd=directory + "repo")
+		assert jobcost._countCommits(repo) == 3
+
+		repo.fetch_date = "2026-01-02 00:00:00"
+		assert jobcost._countCommits(repo) == 4
+
+		# commits before the last ingestion are not counted
+		repo.ingestion_date = "2030-01-01 00:00:00"
+		assert jobcost._countCommits(repo) == 0
+	finally:
+		jobcost.REPO_DIRECTORY = previous_directory
+
+def test_missing_clone_counts_no_commits():
+	repo = SimpleNamespace(id="does-not-exist", ingestion_date=None, fetch_date=None)
+	assert jobcost._countCommits(repo) == 0
+
+def test_first_clone_costs_more_than_a_pull():
+	directory = _clone(1)
+	previous_directory = jobcost.REPO_DIRECTORY
+	jobcost.REPO_DIRECTORY = directory
+	try:
+		assert workUnits(None, "repo", "fetch") == 1
+		assert workUnits(None, "not-cloned-yet", "fetch") == FIRST_CLONE_UNITS
+	finally:
+		jobcost.REPO_DIRECTORY = previous_directory
@@ -0,0 +1,126 @@
+"""
+Tests of the leases, retries and reaping of jobs against the database of config.json, which must be a
+scratch database: claiming takes every queued job of the stage, not only those queued by the tests.
+"""
+import time
+import uuid
+from jobqueue import *
+
+Base.metadata.create_all(engine)
+
+def _claimedJob(stage="model"):
+	"""queues a job for a new repository and claims it"""
+	session = Session()
+	repo = Repository({"name": "test-joblease", "status": "Building Model"})
+	repo.id = "test-joblease-" + str(uuid.uuid4())
+	session.add(repo)
+	enqueueJob(session, repo.id, stage)
+	session.commit()
+
+	jobs = [job for job in claimJobs(session, [stage], 100, 60) if job.repo == repo.id]
+	session.close()
+	assert len(jobs) == 1
+	return jobs[0]
+
+def _job(job_id):
+	session = Session()
+	job = session.query(Job).filter(Job.id == job_id).first()
+	session.expunge(job)
+	session.close()
+	return job
+
+def _repositoryStatus(repo_id):
+	session = Session()
+	status = session.query(Repository.status).filter(Repository.id == repo_id).scalar()
+	session.close()
+	return status
+
+def _cleanUp(repo_id):
+	session = Session()
+	session.query(Job).filter(Job.repo == repo_id).delete(synchronize_session=False)
+	session.query(Repository).filter(Repository.id == repo_id).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+def test_only_the_current_attempt_renews_the_lease():
+	job = _claimedJob()
+	try:
+		assert renewLease(job.id, job.attempts, 600)
+		assert _job(job.id).lease_until > datetime.utcnow() + timedelta(seconds=300)
+		assert not renewLease(job.id, job.attempts + 1, 600)
+	finally:
+		_cleanUp(job.repo)
+
+def test_failed_jobs_are_retried_with_backoff_then_given_up():
+	job = _claimedJob()
+	try:
+		failJob(job.id, job.attempts, 2, 60)
+		retried = _job(job.id)
+		assert retried.state == "queued" and retried.lease_until is None
+		assert retried.run_after > datetime.utcnow() + timedelta(seconds=50)
+		assert _repositoryStatus(job.repo) != "Error"
+
+		# the second attempt fails too - the job is given up and its repository is in error
+		session = Session()
+		session.query(Job).filter(Job.id == job.id).update({"run_after": None}, synchronize_session=False)
+		session.commit()
+		second = [claimed for claimed in claimJobs(session, ["model"], 100, 60) if claimed.id == job.id][0]
+		session.close()
+		assert second.attempts == 2
+
+		failJob(second.id, second.attempts, 2, 60)
+		assert _job(job.id).state == "failed"
+		assert _repositoryStatus(job.repo) == "Error"
+	finally:
+		_cleanUp(job.repo)
+
+def test_expired_leases_are_reaped():
+	job = _claimedJob()
+	try:
+		session = Session()
+		session.query(Job).filter(Job.id == job.id).update(
+			{"lease_until": datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+		session.commit()
+
+		assert reapExpiredJobs(session, 5, 60) >= 1
+		session.close()
+		assert _job(job.id).state == "queued"
+
+		# the worker that lost the lease cannot complete or fail the job anymore
+		completeJob(job.id, job.attempts, "diff")
+		failJob(job.id, job.attempts, 5, 60)
+		reaped = _job(job.id)
+		assert reaped.state == "queued" and reaped.stage == "model"
+	finally:
+		_cleanUp(job.repo)
+
+def test_completed_jobs_queue_the_next_stage():
+	job = _claimedJob("link")
+	try:
+		completeJob(job.id, job.attempts, "diff", "Analyzing")
+		assert _job(job.id).state == "done"
+		assert _repositoryStatus(job.repo) == "Analyzing"
+
+		session = Session()
+		next_jobs = session.query(Job).filter( (Job.repo == job.repo) & (Job.state == "queued") ).all()
+		session.close()
+		assert [next_job.stage for next_job in next_jobs] == ["diff"]
+	finally:
+		_cleanUp(job.repo)
+
+def test_heartbeat_renews_the_lease_past_the_deadline():
+	job = _claimedJob()
+	deadlines = []
+	try:
+		heartbeat = LeaseHeartbeat(job.id, job.attempts, 3, 0.5, lambda: deadlines.append(time.time()))
+		heartbeat.start()
+		time.sleep(2.5)
+		assert heartbeat.timedOut()
+
+		# the job still runs, so its lease is kept: reaping it now would run it twice
+		assert _job(job.id).lease_until > datetime.utcnow() + timedelta(seconds=1)
+		heartbeat.stop()
+		heartbeat.join()
+		assert len(deadlines) == 1
+	finally:
+		_cleanUp(job.repo)
@@ -0,0 +1,42 @@
+"""
+Tests of the job notifications against the database of config.json, which must be a scratch database.
+"""
+import threading
+import uuid
+from jobqueue import *
+
+Base.metadata.create_all(engine)
+
+def test_queued_jobs_are_announced_on_commit():
+	notified = threading.Event()
+	listener = JobListener(notified.set, reconnect_delay=1)
+	listener.start()
+	time.sleep(2) # until it listens, notifications would be lost (but it calls on_notify on reconnect)
+	notified.clear()
+
+	repo_id = "test-joblistener-" + str(uuid.uuid4())
+	session = Session()
+	try:
+		assert enqueueJob(session, repo_id, "model")
+		assert not notified.wait(1) # not before the job is committed
+
+		session.commit()
+		assert notified.wait(10)
+	finally:
+		session.query(Job).filter(Job.repo == repo_id).delete(synchronize_session=False)
+		session.commit()
+		session.close()
+
+def test_rolled_back_jobs_are_not_announced():
+	notified = threading.Event()
+	listener = JobListener(notified.set, reconnect_delay=1)
+	listener.start()
+	time.sleep(2)
+	notified.clear()
+
+	session = Session()
+	enqueueJob(session, "test-joblistener-" + str(uuid.uuid4()), "model")
+	session.rollback()
+	session.close()
+
+	assert not notified.wait(2)
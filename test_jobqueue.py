@@ -0,0 +1,113 @@
+"""
+Tests of the jobs table against the database of config.json, which must be a scratch database (as
+set up by `python script.py initDb`): claiming takes every queued job of the stage, not only those
+queued by the tests.
+"""
+import threading
+import uuid
+from jobqueue import *
+
+def _repoIds(count):
+	prefix = "test-jobqueue-" + str(uuid.uuid4()) + "-"
+	return [prefix + str(index) for index in range(count)]
+
+def _cleanUp(repo_ids):
+	session = Session()
+	session.query(Job).filter(Job.repo.in_(repo_ids)).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+Base.metadata.create_all(engine)
+
+def test_one_active_job_per_repository():
+	repo_ids = _repoIds(1)
+	session = Session()
+	try:
+		assert enqueueJob(session, repo_ids[0], "model")
+		session.commit()
+		assert not enqueueJob(session, repo_ids[0], "model")
+		assert not enqueueJob(session, repo_ids[0], "link")
+		session.commit()
+
+		jobs = session.query(Job).filter(Job.repo == repo_ids[0]).all()
+		assert len(jobs) == 1
+		assert jobs[0].state == "queued" and jobs[0].attempts == 0
+		assert jobs[0].work_units >= 1 and jobs[0].expected_cost > 0
+	finally:
+		session.close()
+		_cleanUp(repo_ids)
+
+def test_claimed_jobs_are_leased_once():
+	repo_ids = _repoIds(3)
+	session = Session()
+	try:
+		for repo_id in repo_ids:
+			enqueueJob(session, repo_id, "model")
+		session.commit()
+
+		claimed = [job for job in claimJobs(session, ["model"], 100, 60) if job.repo in repo_ids]
+		assert sorted(job.repo for job in claimed) == sorted(repo_ids)
+		for job in claimed:
+			assert job.state == "running" and job.attempts == 1
+			assert job.lease_until > datetime.utcnow()
+
+		assert [job for job in claimJobs(session, ["model"], 100, 60) if job.repo in repo_ids] == []
+
+		# a job that could not be started goes back to the queue as it was
+		releaseJob(claimed[0].id, claimed[0].attempts)
+		again = [job for job in claimJobs(session, ["model"], 100, 60) if job.repo in repo_ids]
+		assert [job.id for job in again] == [claimed[0].id]
+		assert again[0].attempts == 1
+	finally:
+		session.close()
+		_cleanUp(repo_ids)
+
+def test_concurrent_claims_never_share_a_job():
+	repo_ids = _repoIds(40)
+	session = Session()
+	for repo_id in repo_ids:
+		enqueueJob(session, repo_id, "model")
+	session.commit()
+	session.close()
+
+	claims = []
+	lock = threading.Lock()
+
+	def claim():
+		claim_session = Session()
+		jobs = claimJobs(claim_session, ["model"], 10, 60)
+		claim_session.close()
+		with lock:
+			claims.extend(job.id for job in jobs if job.repo in repo_ids)
+
+	try:
+		threads = [threading.Thread(target=claim) for _ in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		# a claimer may skip the jobs locked by the others - they are left for the next claim
+		session = Session()
+		claims.extend(job.id for job in claimJobs(session, ["model"], 100, 60) if job.repo in repo_ids)
+		session.close()
+
+		assert len(claims) == len(set(claims))
+		assert len(claims) == 40
+	finally:
+		_cleanUp(repo_ids)
+
+def test_jobs_backing_off_are_not_claimed():
+	repo_ids = _repoIds(1)
+	session = Session()
+	try:
+		enqueueJob(session, repo_ids[0], "model")
+		session.query(Job).filter(Job.repo == repo_ids[0]).update(
+			{"run_after": datetime.utcnow() + timedelta(hours=1)}, synchronize_session=False)
+		session.commit()
+
+		assert [job for job in claimJobs(session, ["model"], 100, 60) if job.repo in repo_ids] == []
+		assert queuedJobCounts(session).get("model", 0) >= 1
+	finally:
+		session.close()
+		_cleanUp(repo_ids)
@@ -0,0 +1,44 @@
+import math
+import numpy as np
+from analyzer.glmfit import *
+
+def _data(n=2000, seed=1):
+	"""is_buggy depends strongly on a, weakly on b and not at all on c; d is constant"""
+	rng = np.random.RandomState(seed)
+	X = np.column_stack([rng.normal(size=n), rng.normal(size=n), rng.normal(size=n), np.ones(n)])
+	eta = -0.5 + 2.0 * X[:, 0] + 0.5 * X[:, 1]
+	y = (rng.uniform(size=n) < 1 / (1 + np.exp(-eta))).astype(float)
+	return X, y
+
+def test_path_goes_from_no_term_to_the_informative_ones():
+	X, y = _data()
+	path = l1LogitPath(X, y, ["a", "b", "c", "d"])
+
+	lambdas = [penalty for penalty, support in path]
+	assert lambdas == sorted(lambdas, reverse=True)
+
+	# the largest penalty selects nothing, the strongest term enters first
+	assert path[0][1] == []
+	first_support = next(support for penalty, support in path if len(support) > 0)
+	assert first_support == ["a"]
+
+	# the informative terms are selected once the penalty is small, a constant never is
+	last_support = path[-1][1]
+	assert "a" in last_support and "b" in last_support
+	assert all("d" not in support for penalty, support in path)
+
+def test_single_class_has_no_path():
+	X, y = _data()
+	assert l1LogitPath(X, np.zeros(len(y)), ["a", "b", "c", "d"]) == []
+	assert l1LogitPath(np.empty((0, 4)), np.empty(0), ["a", "b", "c", "d"]) == []
+
+def test_bic_prefers_the_true_model():
+	X, y = _data()
+	n = len(y)
+	true_model = fitLogit(X[:, :2], y, ["a", "b"])
+	larger_model = fitLogit(X[:, :3], y, ["a", "b", "c"])
+	smaller_model = fitLogit(X[:, :1], y, ["a"])
+
+	assert bic(true_model, n) == true_model.deviance + 3 * math.log(n)
+	assert bic(true_model, n) < bic(larger_model, n)
+	assert bic(true_model, n) < bic(smaller_model, n)
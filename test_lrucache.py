@@ -0,0 +1,37 @@
+import time
+from analyzer.lrucache import *
+
+def test_least_recently_used_entry_is_evicted():
+	cache = LRUCache(2)
+	cache.put("a", 1)
+	cache.put("b", 2)
+	assert cache.get("a") == 1 # a is now more recent than b
+	cache.put("c", 3)
+
+	assert cache.get("b") is None
+	assert cache.get("a") == 1
+	assert cache.get("c") == 3
+
+def test_entries_expire_after_ttl():
+	cache = LRUCache(10, ttl=0.05)
+	cache.put("a", 1)
+	assert cache.get("a") == 1
+	time.sleep(0.1)
+	assert cache.get("a") is None
+	assert len(cache.entries) == 0
+
+def test_invalidation():
+	cache = LRUCache(10)
+	for key in [("r1", "top"), ("r1", "summary"), ("r2", "top")]:
+		cache.put(key, key)
+
+	cache.invalidateWhere(lambda key: key[0] == "r1")
+	assert cache.get(("r1", "top")) is None and cache.get(("r1", "summary")) is None
+	assert cache.get(("r2", "top")) == ("r2", "top")
+
+	cache.invalidate(("r2", "top"))
+	assert cache.get(("r2", "top")) is None
+
+	cache.put("a", 1)
+	cache.invalidate()
+	assert len(cache.entries) == 0
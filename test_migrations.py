@@ -0,0 +1,53 @@
+"""
+Tests of the schema migrations against the database of config.json, which must be a scratch database
+(as set up by `python script.py initDb`): the tests drop and rebuild an index of the commits table.
+"""
+from migrations import *
+
+def _indexes(session):
+	return set(row[0] for row in session.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'commits'")))
+
+def test_migrating_is_idempotent():
+	migrate()
+	migrate()
+
+	session = Session()
+	try:
+		assert schemaVersion(session) == len(MIGRATIONS)
+		assert pendingMigrations(session) == []
+		assert [version for version, description, apply in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
+		assert session.query(SchemaVersion).count() == len(MIGRATIONS)
+		assert {"commits_repository_time", "commits_unlinked_fixes", "commits_not_diffed",
+			"commits_repository_risk"} <= _indexes(session)
+	finally:
+		session.close()
+
+def test_unmigrated_database_has_every_migration_pending():
+	migrate()
+	session = Session()
+	try:
+		# the drop is rolled back with the transaction
+		session.execute(text("DROP TABLE schema_version"))
+		assert schemaVersion(session) == 0
+		assert pendingMigrations(session) == MIGRATIONS
+	finally:
+		session.rollback()
+		session.close()
+
+def test_missing_migrations_are_applied():
+	migrate()
+	session = Session()
+	session.execute(text("DROP INDEX commits_repository_risk"))
+	session.query(SchemaVersion).filter(SchemaVersion.version == len(MIGRATIONS)).delete()
+	session.commit()
+	assert [migration[0] for migration in pendingMigrations(session)] == [len(MIGRATIONS)]
+	session.close()
+
+	migrate()
+
+	session = Session()
+	try:
+		assert schemaVersion(session) == len(MIGRATIONS)
+		assert "commits_repository_risk" in _indexes(session)
+	finally:
+		session.close()
@@ -0,0 +1,162 @@
+"""
+Tests of the month partitioned dumps of the commits, against the database of config.json, which must
+be a scratch database (as set up by `python script.py initDb`). The dumps are written to a temporary
+directory.
+"""
+import calendar
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+from analyzer.metricsgenerator import *
+
+def _time(year, month, day):
+	return float(calendar.timegm(datetime(year, month, day).utctimetuple()))
+
+def _addCommits(repo_id):
+	"""adds three commits in each of January to March 2020, and one without author time"""
+	session = Session()
+	for month in (1, 2, 3):
+		for day in (1, 15, 28):
+			session.add(Commit({"commit_hash": "%s-%d-%d" % (repo_id, month, day), "repository_id": repo_id,
+				"author_date_unix_timestamp": _time(2020, month, day), "la": float(day)}))
+	session.add(Commit({"commit_hash": repo_id + "-undated", "repository_id": repo_id, "author_date_unix_timestamp": None}))
+	session.commit()
+	session.close()
+
+def _cleanUp(repo_id):
+	session = Session()
+	session.query(Commit).filter(Commit.repository_id == repo_id).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+def _rows(path):
+	with gzip.open(path, "rt", newline="") as file:
+		return list(csv.reader(file))
+
+def _sha256(path):
+	with open(path, "rb") as file:
+		return hashlib.sha256(file.read()).hexdigest()
+
+class _Dumps:
+	"""dumps the repository into a temporary directory, recording the months rewritten"""
+
+	def __init__(self, repo_id):
+		self.repo_id = repo_id
+		self.location = tempfile.mkdtemp()
+		self.dir_of_repo = os.path.join(self.location, repo_id)
+		self.rewritten = []
+
+	def dump(self):
+		original_location = config['data_dumps']['location']
+		config['data_dumps']['location'] = self.location
+		metrics_generator = MetricsGenerator(self.repo_id, 0)
+		dump_partition = metrics_generator._dumpPartition
+
+		def recordingDumpPartition(session, month, path):
+			self.rewritten.append(month)
+			return dump_partition(session, month, path)
+
+		metrics_generator._dumpPartition = recordingDumpPartition
+		del self.rewritten[:]
+		try:
+			metrics_generator.dumpData()
+		finally:
+			config['data_dumps']['location'] = original_location
+
+		with open(os.path.join(self.dir_of_repo, "manifest.json")) as file:
+			return json.load(file)
+
+	def remove(self):
+		shutil.rmtree(self.location)
+
+def test_first_dump_writes_every_month():
+	repo_id = "test-monthlydumps-" + str(uuid.uuid4())
+	_addCommits(repo_id)
+	dumps = _Dumps(repo_id)
+	try:
+		manifest = dumps.dump()
+
+		months = ["2020-01", "2020-02", "2020-03", "unknown"]
+		assert sorted(dumps.rewritten) == months
+		assert sorted(manifest["partitions"].keys()) == months
+		assert sorted(os.listdir(dumps.dir_of_repo)) == sorted([month + ".csv.gz" for month in months] + ["manifest.json"])
+		assert manifest["repo"] == repo_id and manifest["columns"] == Commit.__table__.columns.keys()
+
+		for month in months:
+			partition = manifest["partitions"][month]
+			path = os.path.join(dumps.dir_of_repo, partition["file"])
+			assert partition["sha256"] == _sha256(path)
+
+			rows = _rows(path)
+			assert rows[0] == manifest["columns"]
+			assert len(rows) - 1 == partition["rows"] == (1 if month == "unknown" else 3)
+
+		# newest first, every column of the commits
+		rows = _rows(os.path.join(dumps.dir_of_repo, "2020-02.csv.gz"))
+		hashes = [row[rows[0].index("commit_hash")] for row in rows[1:]]
+		assert hashes == ["%s-2-%d" % (repo_id, day) for day in (28, 15, 1)]
+		assert [float(row[rows[0].index("la")]) for row in rows[1:]] == [28, 15, 1]
+	finally:
+		dumps.remove()
+		_cleanUp(repo_id)
+
+def test_only_changed_months_are_rewritten():
+	repo_id = "test-monthlydumps-" + str(uuid.uuid4())
+	_addCommits(repo_id)
+	dumps = _Dumps(repo_id)
+	try:
+		first = dumps.dump()
+		assert dumps.dump()["partitions"] == first["partitions"]
+		assert dumps.rewritten == []
+
+		# a commit of February is labelled as buggy
+		session = Session()
+		session.query(Commit).filter(Commit.commit_hash == repo_id + "-2-15").update({"contains_bug": True}, synchronize_session=False)
+		session.commit()
+		session.close()
+
+		manifest = dumps.dump()
+		assert dumps.rewritten == ["2020-02"]
+		assert manifest["partitions"]["2020-02"]["source_checksum"] != first["partitions"]["2020-02"]["source_checksum"]
+		for month in ("2020-01", "2020-03", "unknown"):
+			assert manifest["partitions"][month] == first["partitions"][month]
+
+		rows = _rows(os.path.join(dumps.dir_of_repo, "2020-02.csv.gz"))
+		buggy = [row[rows[0].index("commit_hash")] for row in rows[1:] if row[rows[0].index("contains_bug")] == "True"]
+		assert buggy == [repo_id + "-2-15"]
+
+		# a partition missing from the directory is written again
+		os.remove(os.path.join(dumps.dir_of_repo, "2020-01.csv.gz"))
+		dumps.dump()
+		assert dumps.rewritten == ["2020-01"]
+	finally:
+		dumps.remove()
+		_cleanUp(repo_id)
+
+def test_months_without_commits_are_removed():
+	repo_id = "test-monthlydumps-" + str(uuid.uuid4())
+	_addCommits(repo_id)
+	dumps = _Dumps(repo_id)
+	try:
+		dumps.dump()
+
+		session = Session()
+		(session.query(Commit)
+			.filter( (Commit.repository_id == repo_id) & (Commit.author_date_unix_timestamp >= _time(2020, 3, 1)) )
+			.delete(synchronize_session=False))
+		session.commit()
+		session.close()
+
+		manifest = dumps.dump()
+		assert dumps.rewritten == []
+		assert sorted(manifest["partitions"].keys()) == ["2020-01", "2020-02", "unknown"]
+		assert not os.path.exists(os.path.join(dumps.dir_of_repo, "2020-03.csv.gz"))
+	finally:
+		dumps.remove()
+		_cleanUp(repo_id)
@@ -0,0 +1,50 @@
+import threading
+import time
+from cas_manager import ThreadPool, ProcessPool
+
+def _waitFor(condition, timeout=5):
+	deadline = time.time() + timeout
+	while not condition() and time.time() < deadline:
+		time.sleep(0.05)
+	return condition()
+
+def test_thread_pool_grows_and_shrinks():
+	pool = ThreadPool(1)
+	pool.resize(3)
+	assert pool.size() == 3 and pool.capacity() == 3
+	assert pool.num_workers == 3
+
+	# busy threads finish their task before retiring
+	release = threading.Event()
+	assert pool.add_task(release.wait)
+	pool.resize(1)
+	assert pool.size() == 1 and pool.capacity() == 0
+	assert _waitFor(lambda: pool.num_workers == 1)
+
+	release.set()
+	pool.wait_completion()
+	assert pool.capacity() == 1
+
+def test_process_pool_keeps_its_executor_when_resized():
+	pool = ProcessPool(1, max_processes=4)
+	assert pool.capacity() == 1
+
+	pool.resize(3)
+	assert pool.size() == 3 and pool.capacity() == 3
+	executor = pool._getExecutor()
+
+	# resizing between the bounds only changes how many tasks are admitted
+	pool.resize(2)
+	pool.resize(4, 4)
+	assert pool._getExecutor() is executor
+
+	# the size never exceeds the processes of the executor
+	pool.resize(10)
+	assert pool.size() == 4
+
+	# a new bound replaces the executor
+	pool.resize(2, 2)
+	assert pool._getExecutor() is not executor
+	assert pool.size() == 2
+	pool.executor.shutdown()
+	executor.shutdown()
@@ -0,0 +1,42 @@
+import numpy as np
+from analyzer.glmfit import *
+from analyzer.linear_reg_model import LinearRegressionModel
+
+def test_probabilities_of_all_commits_at_once():
+	X = np.array([[1.0, 2.0], [0.0, 0.0], [-3.0, 1.5]])
+	intercept = -0.5
+	coefficients = [0.25, -1.0]
+
+	probabilities = predictProbabilities(X, intercept, coefficients)
+	expected = [1 / (1 + np.exp(-(intercept + row[0] * coefficients[0] + row[1] * coefficients[1]))) for row in X]
+
+	assert probabilities.shape == (3,)
+	assert np.allclose(probabilities, expected)
+
+def test_extreme_scores_do_not_overflow():
+	X = np.array([[1e6], [-1e6]])
+	with np.errstate(over='raise'):
+		probabilities = predictProbabilities(X, 0.0, [1.0])
+
+	assert probabilities[0] == 1.0
+	assert probabilities[1] == 0.0
+
+def test_commits_missing_a_metric_are_not_scored():
+	class _Commit:
+		def __init__(self, commit_hash, la, ld):
+			self.commit_hash = commit_hash
+			self.la = la
+			self.ld = ld
+
+	stored = []
+	model = LinearRegressionModel.__new__(LinearRegressionModel)
+	model.repo_id = "test-predictprobabilities"
+	model._storeRiskyness = lambda hashes, probabilities: stored.append((hashes, probabilities))
+
+	commits = [_Commit("a", 1.0, 2.0), _Commit("b", None, 2.0), _Commit("c", 3.0, None)]
+	model._scoreCommits(commits, -0.5, {"la": 0.25, "ld": -1.0})
+
+	hashes, probabilities = stored[0]
+	assert hashes == ["a", "b", "c"]
+	assert np.isclose(probabilities[0], 1 / (1 + np.exp(0.5 - 0.25 + 2.0)))
+	assert list(probabilities[1:]) == [-1.0, -1.0]
@@ -0,0 +1,64 @@
+"""
+Tests of the process executor against the database of config.json (as set up by
+`python script.py initDb`).
+"""
+import logging
+import os
+import time
+import db
+from cas_manager import ProcessPool
+
+def _workerDatabase():
+	"""runs in a worker process: its pid, the pool size of its engine, and whether it uses that engine"""
+	session = db.Session()
+	try:
+		uses_engine = session.get_bind() is db.engine
+		session.execute(db.text("SELECT 1")).scalar()
+	finally:
+		session.close()
+	return os.getpid(), db.engine.pool.size(), uses_engine
+
+def _fail():
+	raise ValueError("failed task")
+
+def _runTask(pool, func):
+	"""adds the task to the pool and returns its future, once done"""
+	assert pool.add_task(func)
+	future = list(pool.pending)[0]
+	pool.wait_completion()
+	return future
+
+def _waitFor(condition, timeout=5):
+	deadline = time.time() + timeout
+	while not condition() and time.time() < deadline:
+		time.sleep(0.05)
+	return condition()
+
+def test_worker_processes_have_an_engine_of_their_own():
+	pool = ProcessPool(1)
+	try:
+		pid, pool_size, uses_engine = _runTask(pool, _workerDatabase).result()
+	finally:
+		pool.executor.shutdown()
+
+	assert pid != os.getpid()
+	assert pool_size == int(db.config['db'].get('worker_pool_size', 5))
+	assert pool_size != db.engine.pool.size()
+	assert uses_engine
+
+def test_failed_tasks_are_logged_with_their_traceback(caplog):
+	done = []
+	pool = ProcessPool(1, lambda: done.append(1))
+	try:
+		with caplog.at_level(logging.ERROR):
+			_runTask(pool, _fail)
+			# the callbacks of a future run once its waiters are woken up
+			assert _waitFor(lambda: done == [1])
+	finally:
+		pool.executor.shutdown()
+
+	assert pool.capacity() == 1
+	records = [record for record in caplog.records if record.getMessage() == "Task failed in a worker process"]
+	assert len(records) == 1
+	assert isinstance(records[0].exc_info[1], ValueError)
+	assert "_fail" in caplog.text # the worker's traceback
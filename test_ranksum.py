@@ -0,0 +1,36 @@
+import numpy as np
+from analyzer.ranksum import *
+
+def test_exact_pvalue_without_ties():
+	# wilcox.test(x, y) - W = 35, p-value = 0.2544
+	x = np.array([0.80, 0.83, 1.89, 1.04, 1.45, 1.38, 1.91, 1.64, 0.73, 1.46])
+	y = np.array([1.15, 0.88, 0.90, 0.74, 1.21])
+
+	buggy_medians, nonbuggy_medians, pvalues = medianTests(x[:, None], y[:, None])
+
+	assert abs(buggy_medians[0] - 1.415) < 1e-12
+	assert abs(nonbuggy_medians[0] - 0.90) < 1e-12
+	assert abs(pvalues[0] - 0.25441) < 1e-5
+
+def test_normal_approximation_with_ties():
+	# wilcox.test(x, y), with continuity and tie correction
+	x = np.array([1, 2, 2, 3, 4, 5, 5, 6] * 8, dtype=float)
+	y = np.array([2, 3, 3, 4, 6, 7, 7, 8] * 8, dtype=float)
+
+	pvalues = medianTests(x[:, None], y[:, None])[2]
+	assert abs(pvalues[0] - 6.1828e-05) < 1e-8
+
+def test_every_metric_at_once():
+	rng = np.random.RandomState(3)
+	buggy = rng.normal(size=(30, 3))
+	nonbuggy = rng.normal(size=(40, 3))
+	buggy[:, 1] += 5 # only the second metric differs
+
+	buggy_medians, nonbuggy_medians, pvalues = medianTests(buggy, nonbuggy)
+
+	assert len(pvalues) == 3
+	assert pvalues[1] < 1e-6
+	assert pvalues[0] > 0.01 and pvalues[2] > 0.01
+	for column in range(3):
+		single = medianTests(buggy[:, [column]], nonbuggy[:, [column]])[2][0]
+		assert abs(single - pvalues[column]) < 1e-12
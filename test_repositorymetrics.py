@@ -0,0 +1,37 @@
+import numpy as np
+from analyzer.repositorymetrics import *
+
+def _row(la, ld, contains_bug, classification, timestamp):
+	metrics = dict((name, 1.0) for name in RepositoryMetrics.metric_names)
+	metrics["la"] = la
+	metrics["ld"] = ld
+	return [metrics[name] for name in RepositoryMetrics.metric_names] + [contains_bug, classification, timestamp]
+
+def test_rows_become_columns():
+	metrics = RepositoryMetrics.fromRows([
+		_row(10, 2, True, "Corrective", 100),
+		_row(3, 0, False, "Feature Addition", 300),
+		_row(0, 5, None, "Merge", 200)
+	])
+
+	assert metrics.data.shape == (3, len(RepositoryMetrics.metric_names))
+	assert list(metrics.is_buggy) == [True, False, False]
+	assert metrics.num_buggy == 1 and metrics.num_nonbuggy == 2
+	assert metrics.max_timestamp == 300
+	assert list(metrics.buggy("la")) == [10]
+	assert list(metrics.nonbuggy("ld")) == [0, 5]
+
+def test_merges_without_changed_lines_are_excluded():
+	metrics = RepositoryMetrics.fromRows([
+		_row(0, 0, False, "Merge", 100),
+		_row(0, 0, False, "Feature Addition", 200),
+		_row(1, 0, False, "Merge", 300)
+	])
+
+	assert len(metrics.is_buggy) == 2
+	assert list(metrics.timestamps) == [200, 300]
+
+def test_no_rows():
+	metrics = RepositoryMetrics.fromRows([])
+	assert metrics.data.shape == (0, len(RepositoryMetrics.metric_names))
+	assert metrics.max_timestamp is None
@@ -0,0 +1,58 @@
+"""
+Tests of the cached reads of stored results against the database of config.json, which must be a
+scratch database (as set up by `python script.py initDb`).
+"""
+import uuid
+from analyzer.riskreader import *
+
+def _addRepository(repo_id, probability):
+	session = Session()
+	session.add(Repository({"id": repo_id, "name": "test-riskreader", "analysis_date": "2020-01-01 00:00:00"}))
+	session.add(Commit({"commit_hash": repo_id + "-commit", "repository_id": repo_id, "glm_probability": probability}))
+	session.commit()
+	session.close()
+
+def _update(model, key, values):
+	session = Session()
+	session.query(model).filter(key).update(values, synchronize_session=False)
+	session.commit()
+	session.close()
+
+def _cleanUp(repo_id):
+	session = Session()
+	session.query(Commit).filter(Commit.repository_id == repo_id).delete(synchronize_session=False)
+	session.query(Repository).filter(Repository.id == repo_id).delete(synchronize_session=False)
+	session.commit()
+	session.close()
+
+def test_results_are_read_again_once_analyzed_again():
+	repo_id = "test-riskreader-" + str(uuid.uuid4())
+	_addRepository(repo_id, 0.5)
+	reader = RiskReader(version_check_interval=0)
+	try:
+		assert [commit["glm_probability"] for commit in reader.topRiskyCommits(repo_id)] == [0.5]
+
+		_update(Commit, Commit.repository_id == repo_id, {"glm_probability": 0.9})
+		assert [commit["glm_probability"] for commit in reader.topRiskyCommits(repo_id)] == [0.5]
+
+		_update(Repository, Repository.id == repo_id, {"analysis_date": "2020-02-01 00:00:00"})
+		assert [commit["glm_probability"] for commit in reader.topRiskyCommits(repo_id)] == [0.9]
+	finally:
+		_cleanUp(repo_id)
+
+def test_versions_are_bounded_by_the_cache_size():
+	repo_ids = ["test-riskreader-" + str(uuid.uuid4()) for _ in range(5)]
+	for repo_id in repo_ids:
+		_addRepository(repo_id, 0.5)
+	reader = RiskReader(cache_size=2)
+	try:
+		for repo_id in repo_ids:
+			assert reader.repositorySummary(repo_id)["num_commits"] == 1
+		assert len(reader.versions.entries) == 2
+
+		# a repository whose version was evicted has its results read again
+		reader.cache.put((repo_ids[0], "summary"), {"stale": True})
+		assert "stale" not in reader.repositorySummary(repo_ids[0])
+	finally:
+		for repo_id in repo_ids:
+			_cleanUp(repo_id)
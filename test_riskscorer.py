@@ -0,0 +1,54 @@
+import os
+import tempfile
+from analyzer.riskscorer import *
+
+def test_commit_ranges():
+	for commit_range in ["A..B", "HEAD~2..HEAD", "a1b2c3", "v1.0...master", "master@{1}..", "..feature/x"]:
+		assert REVISION_RANGE.match(commit_range), commit_range
+
+	for commit_range in ["--output=/tmp/x", "-p", "A..--output=/tmp/x", "A B", "A;rm", ""]:
+		assert not REVISION_RANGE.match(commit_range), commit_range
+
+def test_invalid_range_is_rejected_before_running_git():
+	scorer = RiskScorer()
+	try:
+		scorer.scoreRange("repo", "--output=/tmp/x")
+		assert False, "expected InvalidRequest"
+	except InvalidRequest:
+		pass
+
+def test_numstat_of_a_diff():
+	diff = "\n".join([
+		"diff --git a/src/a.py b/src/a.py",
+		"--- a/src/a.py",
+		"+++ b/src/a.py",
+		"@@ -1,3 +1,4 @@",
+		" context",
+		"-removed",
+		"+added",
+		"+added again",
+		"diff --git a/b.txt b/b.txt",
+		"@@ -1 +1 @@",
+		"-x",
+		"+y"
+	])
+	assert RiskScorer()._numstat(diff) == [(2, 1, "src/a.py"), (1, 1, "b.txt")]
+
+def test_files_changed():
+	scorer = RiskScorer()
+	assert scorer._filesChanged("NULL") == []
+	assert scorer._filesChanged(None) == []
+	assert scorer._filesChanged("a.py,CAS_DELIMITER,b/c.py,CAS_DELIMITER") == ["a.py", "b/c.py"]
+
+def test_lines_are_only_counted_inside_the_clone():
+	scorer = RiskScorer()
+	scorer.REPO_DIRECTORY = tempfile.mkdtemp()
+	os.mkdir(os.path.join(scorer.REPO_DIRECTORY, "repo"))
+	with open(os.path.join(scorer.REPO_DIRECTORY, "repo", "a.py"), "w") as file:
+		file.write("1\n2\n3\n")
+	with open(os.path.join(scorer.REPO_DIRECTORY, "secret"), "w") as file:
+		file.write("1\n")
+
+	assert scorer._countLines("repo", "a.py") == 3
+	assert scorer._countLines("repo", "missing.py") == 0
+	assert scorer._countLines("repo", "../secret") == 0
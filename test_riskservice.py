@@ -0,0 +1,46 @@
+from riskservice import *
+
+class _Reader:
+	"""reader failing the way the database or the request can"""
+
+	def __init__(self, error=None):
+		self.error = error
+		self.limits = []
+
+	def topRiskyCommits(self, repo_id, limit):
+		if self.error is not None:
+			raise self.error
+		self.limits.append(limit)
+		return []
+
+	def repositorySummary(self, repo_id):
+		return None
+
+def _get(path, reader):
+	"""serves the GET request of path with reader, returning the (status, body) responded"""
+	handler = RiskRequestHandler.__new__(RiskRequestHandler)
+	handler.path = path
+	handler.reader = reader
+	responses = []
+	handler._respond = lambda status, body: responses.append((status, body))
+	handler.do_GET()
+	assert len(responses) == 1
+	return responses[0]
+
+def test_reads():
+	reader = _Reader()
+	assert _get("/top?repo=r", reader) == (200, [])
+	assert _get("/top?repo=r&limit=3", reader) == (200, [])
+	assert reader.limits == [10, 3]
+	assert _get("/summary?repo=r", reader)[0] == 404
+	assert _get("/commit?repo=r", reader)[0] == 400
+	assert _get("/top", reader)[0] == 400
+
+def test_invalid_limit_is_a_bad_request():
+	for limit in ["abc", "0", "-1", "2.5"]:
+		status, body = _get("/top?repo=r&limit=" + limit, _Reader())
+		assert status == 400 and "limit" in body["error"], limit
+
+def test_failed_read_is_a_server_error():
+	status, body = _get("/top?repo=r", _Reader(RuntimeError("database is unavailable")))
+	assert status == 500 and body["error"] == "database is unavailable"
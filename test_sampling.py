@@ -0,0 +1,45 @@
+import math
+import numpy as np
+from analyzer.repositorymetrics import *
+from analyzer.glmfit import *
+
+def _metrics(n=20000, seed=0):
+	rng = np.random.RandomState(seed)
+	data = rng.normal(size=(n, len(RepositoryMetrics.metric_names)))
+	eta = -3.0 + 1.0 * data[:, 0]
+	is_buggy = rng.uniform(size=n) < 1 / (1 + np.exp(-eta))
+	return RepositoryMetrics(data, is_buggy, np.arange(n, dtype=float))
+
+def test_sample_keeps_every_buggy_commit():
+	metrics = _metrics()
+	sample = metrics.sample(2000, 42)
+
+	assert sample.num_buggy == metrics.num_buggy
+	assert sample.num_nonbuggy == 2000
+	assert sample.nonbuggy_sampling_rate == 2000 / float(metrics.num_nonbuggy)
+	assert sample.sample_seed == 42
+
+	# commits keep their order
+	assert np.all(np.diff(sample.timestamps) > 0)
+
+def test_sample_is_reproducible():
+	metrics = _metrics()
+	assert np.array_equal(metrics.sample(2000, 42).timestamps, metrics.sample(2000, 42).timestamps)
+	assert not np.array_equal(metrics.sample(2000, 42).timestamps, metrics.sample(2000, 7).timestamps)
+
+def test_small_training_sets_are_not_sampled():
+	metrics = _metrics(n=100)
+	assert metrics.sample(1000, 42) is metrics
+	assert metrics.nonbuggy_sampling_rate == 1.0
+
+def test_prior_correction_recovers_the_intercept():
+	metrics = _metrics(n=200000)
+	sample = metrics.sample(20000, 42)
+
+	full_fit = fitLogit(metrics.data[:, :1], metrics.is_buggy.astype(float), ["ns"])
+	sample_fit = fitLogit(sample.data[:, :1], sample.is_buggy.astype(float), ["ns"])
+
+	# the slope is unbiased, the intercept is off by the log of the sampling rate
+	corrected = sample_fit.coefficients["intercept"] + math.log(sample.nonbuggy_sampling_rate)
+	assert abs(corrected - full_fit.coefficients["intercept"]) < 0.1
+	assert abs(sample_fit.coefficients["ns"] - full_fit.coefficients["ns"]) < 0.1
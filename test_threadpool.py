@@ -0,0 +1,30 @@
+import threading
+from cas_manager import ThreadPool
+
+def test_tasks_are_added_without_blocking():
+	release = threading.Event()
+	done = []
+	pool = ThreadPool(2, lambda: done.append(1))
+
+	assert pool.capacity() == 2
+	assert pool.add_task(release.wait)
+	assert pool.add_task(release.wait)
+
+	# every thread is busy - the task is refused rather than queued behind them
+	assert pool.capacity() == 0
+	assert not pool.add_task(release.wait)
+	assert pool.busy() == 2
+
+	release.set()
+	pool.wait_completion()
+	assert pool.busy() == 0 and pool.capacity() == 2
+	assert len(done) == 2
+
+def test_failing_task_frees_its_thread():
+	def fail():
+		raise ValueError("failed task")
+
+	pool = ThreadPool(1)
+	assert pool.add_task(fail)
+	pool.wait_completion()
+	assert pool.capacity() == 1
@@ -0,0 +1,27 @@
+import numpy as np
+from analyzer.repositorymetrics import *
+
+def _metrics(seed=0, n=50):
+	rng = np.random.RandomState(seed)
+	data = rng.normal(size=(n, len(RepositoryMetrics.metric_names)))
+	is_buggy = rng.uniform(size=n) < 0.3
+	timestamps = np.arange(n, dtype=float)
+	return RepositoryMetrics(data, is_buggy, timestamps)
+
+def test_same_training_data_same_fingerprint():
+	assert _metrics().fingerprint() == _metrics().fingerprint()
+
+def test_changed_label_or_metric_changes_the_fingerprint():
+	metrics = _metrics()
+	fingerprint = metrics.fingerprint()
+
+	relabeled = _metrics()
+	relabeled.is_buggy[0] = not relabeled.is_buggy[0]
+	assert relabeled.fingerprint() != fingerprint
+
+	changed = _metrics()
+	changed.data[10, 3] += 1
+	assert changed.fingerprint() != fingerprint
+
+def test_new_commit_changes_the_fingerprint():
+	assert _metrics(n=51).fingerprint() != _metrics(n=50).fingerprint()
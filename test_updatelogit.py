@@ -0,0 +1,37 @@
+import numpy as np
+from analyzer.glmfit import *
+
+def _data(n, seed):
+	rng = np.random.RandomState(seed)
+	X = rng.normal(size=(n, 2))
+	eta = -1.0 + 0.8 * X[:, 0] - 0.4 * X[:, 1]
+	y = (rng.uniform(size=n) < 1 / (1 + np.exp(-eta))).astype(float)
+	return X, y
+
+def test_update_approximates_a_full_refit():
+	X_old, y_old = _data(5000, 1)
+	X_new, y_new = _data(500, 2)
+
+	old_fit = fitLogit(X_old, y_old, ["a", "b"])
+	updated = updateLogit(X_new, y_new, ["a", "b"], old_fit.startVector(), old_fit.information)
+	full_fit = fitLogit(np.vstack([X_old, X_new]), np.concatenate([y_old, y_new]), ["a", "b"])
+
+	assert updated.converged
+	for name in ["intercept", "a", "b"]:
+		assert abs(updated.coefficients[name] - full_fit.coefficients[name]) < 1e-3
+		assert abs(updated.pvalues[name] - full_fit.pvalues[name]) < 1e-3 + 1e-2 * full_fit.pvalues[name]
+
+	# the information of the old and new commits adds up, so the model can be updated again
+	scale = np.max(np.diag(full_fit.information))
+	assert np.allclose(updated.information, full_fit.information, rtol=0, atol=1e-2 * scale)
+
+def test_update_without_new_commits_keeps_the_model():
+	X_old, y_old = _data(1000, 1)
+	old_fit = fitLogit(X_old, y_old, ["a", "b"])
+	updated = updateLogit(np.empty((0, 2)), np.empty(0), ["a", "b"], old_fit.startVector(), old_fit.information)
+
+	assert np.allclose(updated.startVector(), old_fit.startVector())
+
+def test_singular_information_cannot_be_updated():
+	X_new, y_new = _data(10, 2)
+	assert updateLogit(X_new[:, [0, 0]], y_new, ["a", "a2"], [0.0, 0.0, 0.0], np.zeros((3, 3))) is None